@@ -0,0 +1,358 @@
+# async_server.py
+# ASGI serving mode with micro-batching.
+# Exposes the same /predict contract as pythonserver.py, but queues incoming
+# single-row requests and merges them into one scaling + model.predict call
+# once MAX_BATCH_SIZE rows are waiting or the oldest has waited MAX_WAIT_MS.
+# Run with: python async_server.py  (requires uvicorn)
+import argparse
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import pythonserver
+from pythonserver import label_prediction, parse_features
+
+# --- Configuration ---
+MAX_BATCH_SIZE = int(os.environ.get("MICROBATCH_MAX_SIZE", "64"))
+MAX_WAIT_MS = float(os.environ.get("MICROBATCH_MAX_WAIT_MS", "2"))
+
+
+class PredictionError(Exception):
+    """Carries an HTTP status and JSON body back to the waiting request"""
+
+    def __init__(self, status, body):
+        super().__init__(body.get("error"))
+        self.status = status
+        self.body = body
+
+
+def _scale(current, rows):
+    """Scales a (n, features) array with the state's scaler"""
+    if current.fast_path is not None:
+        return current.fast_path.transform(rows)
+    return current.scaler.transform(pd.DataFrame(rows, columns=current.features))
+
+
+def _predict_rows(current, rows):
+    """
+    Scales and predicts a batch in one call. If the batch fails, rows are
+    retried one by one so only the offending request sees the error.
+    """
+    try:
+        return [
+            label_prediction(value, current.targets)
+            for value in current.model.predict(_scale(current, rows))
+        ], None
+    except Exception:
+        pass
+    results, errors = [], []
+    for row in rows:
+        try:
+            input_scaled = _scale(current, row[None, :])
+        except Exception as e:
+            results.append(None)
+            errors.append(
+                PredictionError(
+                    500,
+                    {
+                        "error": "Failed to scale input data. Check feature count and types.",
+                        "details": str(e),
+                    },
+                )
+            )
+            continue
+        try:
+            results.append(label_prediction(current.model.predict(input_scaled)[0], current.targets))
+            errors.append(None)
+        except Exception as e:
+            results.append(None)
+            errors.append(
+                PredictionError(
+                    500, {"error": "Failed to make prediction", "details": str(e)}
+                )
+            )
+    return results, errors
+
+
+class MicroBatcher:
+    """
+    Collects rows submitted from many coroutines and evaluates them together.
+    Model calls run on one worker thread so the event loop keeps accepting
+    requests (and filling the next batch) while a batch is being predicted.
+    """
+
+    def __init__(self, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = None
+        self._task = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="predict")
+        self.batches = 0
+        self.rows = 0
+        self.full_batches = 0
+        self.batch_size_counts = {}
+        self.total_queue_wait = 0.0
+        self.total_predict_time = 0.0
+
+    def start(self):
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._executor.shutdown(wait=False)
+
+    async def submit(self, row, features):
+        """
+        Queues one row, validated against the features list, and waits for
+        its prediction. Returns (prediction, model_version).
+        """
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((row, features, future, time.perf_counter()))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            await self._dispatch(loop, batch)
+
+    async def _dispatch(self, loop, batch):
+        # One state snapshot per batch, so a hot reload never splits a batch
+        current = pythonserver.state
+        # Rows validated against a model that was replaced while they waited
+        stale = [features != current.features for _, features, _, _ in batch]
+        if any(stale):
+            for (_, _, future, _), is_stale in zip(batch, stale):
+                if is_stale and not future.done():
+                    future.set_exception(
+                        PredictionError(
+                            503, {"error": "Model changed while the request was queued, retry it"}
+                        )
+                    )
+            batch = [item for item, is_stale in zip(batch, stale) if not is_stale]
+            if not batch:
+                return
+        rows = np.vstack([row for row, _, _, _ in batch])
+        started = time.perf_counter()
+        try:
+            results, errors = await loop.run_in_executor(
+                self._executor, _predict_rows, current, rows
+            )
+        except Exception as e:
+            results = [None] * len(batch)
+            errors = [
+                PredictionError(500, {"error": "Failed to make prediction", "details": str(e)})
+            ] * len(batch)
+        finished = time.perf_counter()
+
+        self.batches += 1
+        self.rows += len(batch)
+        self.full_batches += len(batch) == self.max_batch_size
+        self.batch_size_counts[len(batch)] = self.batch_size_counts.get(len(batch), 0) + 1
+        self.total_predict_time += finished - started
+        for (_, _, future, queued), result, error in zip(
+            batch, results, errors or [None] * len(batch)
+        ):
+            self.total_queue_wait += started - queued
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result((result, current.version))
+
+    def stats(self):
+        """Batching counters for the /stats endpoint"""
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "batches": self.batches,
+            "rows": self.rows,
+            "mean_batch_size": self.rows / self.batches if self.batches else 0.0,
+            "full_batches": self.full_batches,
+            "batch_size_counts": {
+                str(size): count for size, count in sorted(self.batch_size_counts.items())
+            },
+            "mean_queue_wait_ms": self.total_queue_wait / self.rows * 1000.0 if self.rows else 0.0,
+            "mean_batch_predict_ms": (
+                self.total_predict_time / self.batches * 1000.0 if self.batches else 0.0
+            ),
+        }
+
+
+batcher = MicroBatcher()
+
+
+# --- Request Handling ---
+def _validate(current, body):
+    """Parses and validates a /predict body into one row of current's features"""
+    try:
+        input_data = json.loads(body) if body else None
+        if not input_data:
+            raise PredictionError(400, {"error": "No input data received"})
+    except ValueError as e:
+        raise PredictionError(400, {"error": f"Failed to parse JSON: {str(e)}"})
+
+    # Rolling-window features read the device's history, as /predict does
+    if current.rolling is not None and isinstance(input_data, dict):
+        input_data = current.rolling.augment(input_data, ingest=False)
+
+    missing_features = [
+        feature for feature in current.features if feature not in input_data
+    ]
+    if missing_features:
+        raise PredictionError(
+            400, {"error": "Missing required features", "missing": missing_features}
+        )
+
+    try:
+        row = parse_features(input_data, np.empty(len(current.features)), current.features)
+    except (ValueError, TypeError) as e:
+        raise PredictionError(
+            400,
+            {
+                "error": "Invalid data type for one or more features. All features must be numeric.",
+                "details": str(e),
+            },
+        )
+    if np.isinf(row).any():
+        raise PredictionError(
+            500,
+            {
+                "error": "Failed to scale input data. Check feature count and types.",
+                "details": "Input X contains infinity or a value too large for dtype('float64').",
+            },
+        )
+    return row
+
+
+async def _predict(body):
+    current = pythonserver.state
+    if current.model is None or current.scaler is None:
+        return 500, {"error": "Model or scaler not loaded"}
+    try:
+        row = _validate(current, body)
+        prediction, version = await batcher.submit(row, current.features)
+    except PredictionError as e:
+        return e.status, e.body
+    return 200, {"prediction": prediction, "model_version": version}
+
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            return b"".join(chunks)
+
+
+async def _send_json(send, status, payload):
+    body = json.dumps(payload).encode()
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"access-control-allow-origin", b"*"),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+async def app(scope, receive, send):
+    """ASGI entry point"""
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                batcher.start()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await batcher.stop()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    if scope["type"] != "http":
+        return
+
+    path, method = scope["path"], scope["method"]
+    if method == "OPTIONS":
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 204,
+                "headers": [
+                    (b"access-control-allow-origin", b"*"),
+                    (b"access-control-allow-methods", b"GET, POST, OPTIONS"),
+                    (b"access-control-allow-headers", b"content-type"),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": b""})
+    elif path == "/predict" and method == "POST":
+        status, payload = await _predict(await _read_body(receive))
+        await _send_json(send, status, payload)
+    elif path == "/stats" and method == "GET":
+        await _send_json(send, 200, batcher.stats())
+    else:
+        await _send_json(send, 404, {"error": "Not found"})
+
+
+# --- Run the ASGI App ---
+def main():
+    parser = argparse.ArgumentParser(description="Micro-batching ASGI prediction server.")
+    parser.add_argument("--host", type=str, default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument(
+        "--max-batch-size",
+        type=int,
+        default=MAX_BATCH_SIZE,
+        help="Dispatch a batch as soon as this many rows are queued.",
+    )
+    parser.add_argument(
+        "--max-wait-ms",
+        type=float,
+        default=MAX_WAIT_MS,
+        help="Longest time the first row of a batch waits for company.",
+    )
+    args = parser.parse_args()
+
+    if pythonserver.state.model is None or pythonserver.state.scaler is None:
+        print("ASGI server not started due to loading errors.")
+        return
+
+    import uvicorn
+
+    batcher.max_batch_size = args.max_batch_size
+    batcher.max_wait = args.max_wait_ms / 1000.0
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
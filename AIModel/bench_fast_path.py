@@ -0,0 +1,102 @@
+# bench_fast_path.py
+# Microbenchmark for the single-row /predict path: compares the pandas
+# DataFrame path against the pandas-free fast path on the loaded model.
+# Run from the AIModel directory so that models/ resolves.
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+import pythonserver
+
+parser = argparse.ArgumentParser(
+    description="Compare /predict latency with and without the fast path."
+)
+parser.add_argument(
+    "--data-path",
+    type=str,
+    default="sensor_data_log.csv",
+    help="CSV used to draw realistic request payloads.",
+)
+parser.add_argument(
+    "--requests",
+    type=int,
+    default=2000,
+    help="Number of timed requests per mode.",
+)
+
+
+def _payloads(data_path, count, current):
+    """
+    Builds request bodies from rows of the sensor log, with the inputs the
+    served model needs (for rolling models: the raw columns and the device)
+    """
+    data = pd.read_csv(data_path)
+    data = data.rename(
+        columns={
+            alias: name
+            for alias, name in pythonserver.FEATURE_ALIASES.items()
+            if name not in data.columns
+        }
+    )
+    columns = pythonserver._input_features(current)
+    if current.rolling is not None and "uuid" in data.columns:
+        columns = [*columns, "uuid"]
+    missing = [column for column in columns if column not in data.columns]
+    if missing:
+        raise ValueError(f"{data_path} is missing the model's features: {missing}")
+    rows = data[columns].sample(n=count, replace=True, random_state=0)
+    return rows.to_dict(orient="records")
+
+
+def _time_requests(client, payloads):
+    """Posts every payload once and returns per-request latencies in microseconds"""
+    latencies = np.empty(len(payloads))
+    predictions = []
+    for i, payload in enumerate(payloads):
+        start = time.perf_counter()
+        response = client.post("/predict", json=payload)
+        latencies[i] = (time.perf_counter() - start) * 1e6
+        predictions.append(response.get_json()["prediction"])
+    return latencies, predictions
+
+
+def main():
+    args = parser.parse_args()
+    current = pythonserver.state
+    if current.model is None or current.scaler is None:
+        print("Model or scaler not loaded, nothing to benchmark.")
+        return
+
+    try:
+        payloads = _payloads(args.data_path, args.requests, current)
+    except (OSError, ValueError) as e:
+        print(f"Error building payloads: {e}")
+        return
+    # Time the inference path itself, not cache hits
+    pythonserver.prediction_cache = None
+    client = pythonserver.app.test_client()
+    fast = pythonserver.FastPath(current.model, current.scaler, current.features)
+    modes = {"pandas": None, "fast": fast}
+
+    results = {}
+    for mode, path in modes.items():
+        current.fast_path = path
+        _time_requests(client, payloads[:100])  # warmup
+        results[mode] = _time_requests(client, payloads)
+
+    print(f"Model: {type(current.model).__name__}, requests: {args.requests}")
+    for mode, (latencies, _) in results.items():
+        print(
+            f"{mode:>7}: mean {latencies.mean():8.1f} us  "
+            f"p50 {np.percentile(latencies, 50):8.1f} us  "
+            f"p99 {np.percentile(latencies, 99):8.1f} us"
+        )
+    speedup = results["pandas"][0].mean() / results["fast"][0].mean()
+    identical = results["pandas"][1] == results["fast"][1]
+    print(f"Speedup: {speedup:.2f}x, identical predictions: {identical}")
+
+
+if __name__ == "__main__":
+    main()
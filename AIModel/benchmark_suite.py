@@ -0,0 +1,356 @@
+# benchmark_suite.py
+# Reproducible benchmarks for the serving and training hot paths.
+#
+#   python benchmark_suite.py serve --output serve.json
+#       drives /predict and /predict/batch in-process through the Flask test
+#       client (or over HTTP with --url) using rows from sensor_data_log.csv
+#   python benchmark_suite.py train --output train.json
+#       times TournamentModelSelection.run_tournament and
+#       tune_rf_standalone.py on gt_full.csv at several data sizes
+#
+# Every run writes one JSON document with the environment, the arguments and
+# the results, so runs before and after a change can be compared directly.
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+# --- Helpers ---
+def _environment():
+    """Versions and machine details recorded with every result"""
+    import sklearn
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=HERE,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "sklearn": sklearn.__version__,
+    }
+
+
+def _latency_summary(latencies, rows_per_request, wall_time):
+    """Throughput and latency percentiles for one scenario"""
+    latencies = np.asarray(latencies)
+    return {
+        "requests": len(latencies),
+        "rows_per_request": rows_per_request,
+        "wall_time_s": wall_time,
+        "requests_per_s": len(latencies) / wall_time,
+        "rows_per_s": len(latencies) * rows_per_request / wall_time,
+        "latency_ms": {
+            "mean": float(latencies.mean() * 1e3),
+            "p50": float(np.percentile(latencies, 50) * 1e3),
+            "p95": float(np.percentile(latencies, 95) * 1e3),
+            "p99": float(np.percentile(latencies, 99) * 1e3),
+            "max": float(latencies.max() * 1e3),
+        },
+    }
+
+
+def _write(document, output):
+    text = json.dumps(document, indent=2)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+        print(f"Results written to {output}")
+    else:
+        print(text)
+
+
+# --- Serving Benchmarks ---
+def _payload_rows(data_path, features, count, random_state):
+    """Draws realistic request rows from the sensor log"""
+    data = pd.read_csv(data_path)[features]
+    rows = data.sample(n=count, replace=True, random_state=random_state)
+    return rows.to_dict(orient="records")
+
+
+class _TestClientTransport:
+    """Posts through the Flask test client, without sockets"""
+
+    concurrency = 1
+
+    def __init__(self):
+        import pythonserver
+
+        self.client = pythonserver.app.test_client()
+
+    def post(self, path, payload):
+        response = self.client.post(path, json=payload)
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} returned {response.status_code}: {response.get_json()}")
+
+
+class _HttpTransport:
+    """Posts to a running server over HTTP"""
+
+    def __init__(self, url, concurrency):
+        self.url = url.rstrip("/")
+        self.concurrency = concurrency
+
+    def post(self, path, payload):
+        request = urllib.request.Request(
+            self.url + path,
+            data=json.dumps(payload).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(request) as response:
+            response.read()
+
+
+def _run_scenario(transport, path, payloads, rows_per_request, warmup):
+    """Sends every payload and returns the scenario summary"""
+    for payload in payloads[:warmup]:
+        transport.post(path, payload)
+
+    def timed(payload):
+        start = time.perf_counter()
+        transport.post(path, payload)
+        return time.perf_counter() - start
+
+    started = time.perf_counter()
+    if transport.concurrency > 1:
+        with ThreadPoolExecutor(max_workers=transport.concurrency) as pool:
+            latencies = list(pool.map(timed, payloads))
+    else:
+        latencies = [timed(payload) for payload in payloads]
+    return _latency_summary(latencies, rows_per_request, time.perf_counter() - started)
+
+
+def run_serve(args):
+    if args.url:
+        transport = _HttpTransport(args.url, args.concurrency)
+        with urllib.request.urlopen(transport.url + "/admin/model") as response:
+            features = json.load(response)["features"]
+    else:
+        import pythonserver
+
+        if pythonserver.state.model is None:
+            print("Model or scaler not loaded, nothing to benchmark.")
+            return
+        if not args.with_cache:
+            # Measure the inference path rather than cache hits
+            pythonserver.prediction_cache = None
+        transport = _TestClientTransport()
+        features = pythonserver.state.features
+
+    rows = _payload_rows(
+        args.data_path, features, args.requests * max(args.batch_sizes), args.random_state
+    )
+    results = {}
+
+    print(f"Single-row /predict x {args.requests}")
+    results["single_row"] = _run_scenario(
+        transport, "/predict", rows[: args.requests], 1, args.warmup
+    )
+
+    for batch_size in args.batch_sizes:
+        count = max(1, args.requests // batch_size)
+        payloads = [rows[i * batch_size:(i + 1) * batch_size] for i in range(count)]
+        print(f"Batched /predict/batch x {count} (batch size {batch_size})")
+        results[f"batch_{batch_size}"] = _run_scenario(
+            transport, "/predict/batch", payloads, batch_size, min(args.warmup, count)
+        )
+
+    for name, summary in results.items():
+        latency = summary["latency_ms"]
+        print(
+            f"{name:>12}: {summary['rows_per_s']:10.0f} rows/s  "
+            f"p50 {latency['p50']:7.2f} ms  p95 {latency['p95']:7.2f} ms  p99 {latency['p99']:7.2f} ms"
+        )
+
+    _write(
+        {
+            "benchmark": "serve",
+            "mode": "http" if args.url else "inprocess",
+            "environment": _environment(),
+            "arguments": vars(args),
+            "results": results,
+        },
+        args.output,
+    )
+
+
+# --- Training Benchmarks ---
+def _sizes(spec, total):
+    """Parses "1000,4000,all" into row counts"""
+    sizes = []
+    for item in spec.split(","):
+        item = item.strip()
+        sizes.append(total if item == "all" else min(int(item), total))
+    return sizes
+
+
+def _time_tournament(data_file, target, rounds, fraction, random_state):
+    """Times run_tournament in the current directory (it writes models/)"""
+    from training import TournamentModelSelection
+
+    np.random.seed(random_state)
+    started = time.perf_counter()
+    tournament = TournamentModelSelection(
+        data_path=data_file,
+        target_column=target,
+        tournament_rounds=rounds,
+        tournament_data_fraction=fraction,
+        random_state=random_state,
+    )
+    setup = time.perf_counter() - started
+    winner_name, _ = tournament.run_tournament()
+    return {
+        "setup_s": setup,
+        "run_tournament_s": time.perf_counter() - started - setup,
+        "winner": winner_name,
+    }
+
+
+def _time_tune(data_file, target, n_iter, cv_folds, random_state):
+    """Times tune_rf_standalone.py as a subprocess (it parses argv on import)"""
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [
+            sys.executable,
+            os.path.join(HERE, "tune_rf_standalone.py"),
+            "--data-path", data_file,
+            "--target-column", target,
+            "--n-iter", str(n_iter),
+            "--cv-folds", str(cv_folds),
+            "--random-state", str(random_state),
+        ],
+        capture_output=True,
+        text=True,
+    )
+    elapsed = time.perf_counter() - started
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr[-2000:])
+    return {"main_s": elapsed}
+
+
+def run_train(args):
+    data = pd.read_csv(args.data_path)
+    results = []
+    original_dir = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="ecoverify_bench_")
+    sys.path.insert(0, HERE)
+    try:
+        # Both entry points write into models/, keep that out of the repo
+        os.chdir(workdir)
+        for size in _sizes(args.sizes, len(data)):
+            subset = data.sample(n=size, random_state=args.random_state).sort_index()
+            data_file = os.path.join(workdir, f"data_{size}.csv")
+            subset.to_csv(data_file, index=False)
+            entry = {"rows": size}
+            if not args.skip_tournament:
+                print(f"Tournament on {size} rows...")
+                entry["tournament"] = _time_tournament(
+                    data_file,
+                    args.target_column,
+                    args.tournament_rounds,
+                    args.tournament_data_fraction,
+                    args.random_state,
+                )
+            if not args.skip_tune:
+                print(f"tune_rf_standalone on {size} rows...")
+                entry["tune_rf_standalone"] = _time_tune(
+                    data_file, args.target_column, args.n_iter, args.cv_folds, args.random_state
+                )
+            results.append(entry)
+    finally:
+        os.chdir(original_dir)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    _write(
+        {
+            "benchmark": "train",
+            "environment": _environment(),
+            "arguments": vars(args),
+            "results": results,
+        },
+        args.output,
+    )
+
+
+# --- Command Line ---
+def main():
+    parser = argparse.ArgumentParser(description="EcoVerify performance benchmarks.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve = subparsers.add_parser("serve", help="Benchmark /predict and /predict/batch.")
+    serve.add_argument("--data-path", type=str, default="sensor_data_log.csv")
+    serve.add_argument("--requests", type=int, default=1000, help="Rows per scenario.")
+    serve.add_argument(
+        "--batch-sizes",
+        type=lambda text: [int(item) for item in text.split(",")],
+        default=[10, 100, 1000],
+        help="Comma-separated batch sizes for /predict/batch.",
+    )
+    serve.add_argument("--warmup", type=int, default=20)
+    serve.add_argument(
+        "--url",
+        type=str,
+        default=None,
+        help="Benchmark a running server over HTTP instead of in-process.",
+    )
+    serve.add_argument("--concurrency", type=int, default=8, help="HTTP client threads.")
+    serve.add_argument(
+        "--with-cache",
+        action="store_true",
+        help="Keep the prediction cache enabled (in-process mode).",
+    )
+    serve.add_argument("--random-state", type=int, default=42)
+    serve.add_argument("--output", type=str, default=None)
+
+    train = subparsers.add_parser("train", help="Benchmark model selection and tuning.")
+    train.add_argument("--data-path", type=str, default="gt_full.csv")
+    train.add_argument("--target-column", type=str, default="CO")
+    train.add_argument(
+        "--sizes",
+        type=str,
+        default="1000,4000,16000",
+        help="Comma-separated row counts ('all' for the full file).",
+    )
+    train.add_argument("--tournament-rounds", type=int, default=3)
+    train.add_argument("--tournament-data-fraction", type=float, default=0.3)
+    train.add_argument("--n-iter", type=int, default=5)
+    train.add_argument("--cv-folds", type=int, default=3)
+    train.add_argument("--skip-tournament", action="store_true")
+    train.add_argument("--skip-tune", action="store_true")
+    train.add_argument("--random-state", type=int, default=42)
+    train.add_argument("--output", type=str, default=None)
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        run_serve(args)
+    else:
+        args.data_path = os.path.abspath(args.data_path)
+        run_train(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+# bulk_score.py
+# Offline scoring of historical readings with the server's model.
+#
+# The input is read in chunks (CSV like sensor_data_log.csv, or newline-
+# delimited JSON such as a mongoexport of Recording documents), each chunk's
+# features are scored in a process pool (rolling-window features, which
+# depend on earlier readings, are computed in order in this process first),
+# and predictions are appended to a Parquet file (one row group per chunk,
+# needs pyarrow) or a CSV file. JSON lines that do not parse are skipped and
+# counted, like rows with invalid features are left unscored. At most
+# 2 x workers chunks are in flight, so memory stays constant whatever the
+# input size.
+#
+# Models are loaded exactly as pythonserver.py loads them: the default model
+# (bundle, or final_model.joblib + scaler.joblib) or any registry model by
+# name or target.
+import argparse
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from threadpoolctl import threadpool_limits
+
+# Scoring processes never reload models or cache predictions
+# (read by pythonserver at import time)
+os.environ.setdefault("MODEL_WATCH_INTERVAL", "0")
+os.environ.setdefault("PREDICTION_CACHE_SIZE", "0")
+
+import pythonserver  # noqa: E402
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# Columns copied from the input to the output when present
+DEFAULT_KEEP_COLUMNS = ["timestamp", "uuid"]
+# Nested fields of exported Recording documents, flattened to plain columns
+RECORDING_PREFIXES = ["sensor_data.", "metadata."]
+JSON_SUFFIXES = (".json", ".jsonl", ".ndjson")
+# Skipped JSON lines that are reported one by one
+REPORTED_BAD_LINES = 10
+
+parser = argparse.ArgumentParser(
+    description="Score historical sensor readings in bulk with the prediction server's model."
+)
+parser.add_argument("input", type=str, help="CSV or newline-delimited JSON file to score.")
+parser.add_argument(
+    "--output",
+    type=str,
+    required=True,
+    help="Output file (.parquet, which needs pyarrow, or .csv).",
+)
+parser.add_argument(
+    "--model",
+    type=str,
+    default=pythonserver.DEFAULT_MODEL_NAME,
+    help="Registry model name or target (default: the model /predict serves).",
+)
+parser.add_argument("--chunk-size", type=int, default=100000, help="Rows per chunk.")
+parser.add_argument(
+    "--workers",
+    type=int,
+    default=os.cpu_count() or 1,
+    help="Scoring processes (1 scores in this process).",
+)
+parser.add_argument(
+    "--threads",
+    type=int,
+    default=1,
+    help="BLAS/OpenMP threads per scoring process.",
+)
+parser.add_argument(
+    "--keep-columns",
+    type=lambda text: [column for column in text.split(",") if column],
+    default=DEFAULT_KEEP_COLUMNS,
+    help="Comma-separated input columns copied to the output when present.",
+)
+
+# --- Model Loading ---
+_worker_state = None
+
+
+def load_model(name):
+    """The serving state for a model name, as the server would resolve it"""
+    if name == pythonserver.DEFAULT_MODEL_NAME:
+        if pythonserver.state.model is None or pythonserver.state.scaler is None:
+            raise RuntimeError("The default model or scaler could not be loaded")
+        return pythonserver.state
+    return pythonserver.registry.get(name)
+
+
+def _init_worker(name, threads):
+    global _worker_state
+    threadpool_limits(limits=threads)
+    _worker_state = load_model(name)
+
+
+def score_chunk(values):
+    """
+    Scales and predicts a (rows, features) array with the worker's model.
+    Rows with a missing or non-numeric feature are not scored (NaN).
+    Returns (rows, outputs) predictions.
+    """
+    current = _worker_state
+    outputs = len(current.targets) if current.targets is not None else 1
+    predictions = np.full((len(values), outputs), np.nan)
+    valid = np.isfinite(values).all(axis=1)
+    if valid.any():
+        input_scaled = current.scaler.transform(
+            pd.DataFrame(values[valid], columns=current.features)
+        )
+        predictions[valid] = np.reshape(current.model.predict(input_scaled), (-1, outputs))
+    return predictions
+
+
+# --- Input ---
+def _flatten_records(records):
+    """Recording documents to one column per field (sensor_data.TVOC -> TVOC)"""
+    frame = pd.json_normalize(records)
+    renamed = {}
+    for column in frame.columns:
+        name = column
+        for prefix in RECORDING_PREFIXES:
+            if name.startswith(prefix):
+                name = name[len(prefix):]
+        # mongoexport writes dates as {"$date": ...}
+        if name.endswith(".$date"):
+            name = name[: -len(".$date")]
+        renamed[column] = name
+    return frame.rename(columns=renamed)
+
+
+def read_chunks(path, chunk_size, bad_lines=None):
+    """
+    Yields DataFrames of up to chunk_size rows from a CSV or JSON lines file.
+    JSON lines that are not a valid object are skipped; their line numbers
+    are appended to bad_lines.
+    """
+    if not path.lower().endswith(JSON_SUFFIXES):
+        yield from pd.read_csv(path, chunksize=chunk_size)
+        return
+    records = []
+    with open(path) as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                if not isinstance(record, dict):
+                    raise ValueError(f"expected an object, got {type(record).__name__}")
+            except ValueError as e:
+                if bad_lines is not None:
+                    bad_lines.append(line_number)
+                    if len(bad_lines) <= REPORTED_BAD_LINES:
+                        print(f"Warning: skipping line {line_number} of {path}: {e}")
+                continue
+            records.append(record)
+            if len(records) == chunk_size:
+                yield _flatten_records(records)
+                records = []
+    if records:
+        yield _flatten_records(records)
+
+
+def feature_values(chunk, current):
+    """
+    The chunk's model features as a float array; values that do not parse
+    become NaN. Rolling features continue each device's history from the
+    previous chunks, in file order.
+    """
+    chunk = chunk.rename(
+        columns={
+            alias: name
+            for alias, name in pythonserver.FEATURE_ALIASES.items()
+            if name not in chunk.columns
+        }
+    )
+    required = current.features
+    if current.rolling is not None:
+        derived = set(current.rolling.feature_names)
+        required = [feature for feature in required if feature not in derived]
+        required += [column for column in current.rolling.columns if column not in required]
+    missing = [feature for feature in required if feature not in chunk.columns]
+    if missing:
+        raise ValueError(f"Input is missing required features: {missing}")
+    if current.rolling is not None:
+        chunk = current.rolling.add_features(chunk)
+    return chunk[current.features].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=np.float64)
+
+
+# --- Output ---
+class OutputWriter:
+    """
+    Appends scored chunks to Parquet (one row group each) or CSV. Copied
+    input columns are written as strings so every chunk has the same schema.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.parquet = path.lower().endswith(".parquet")
+        if self.parquet and pq is None:
+            raise RuntimeError(
+                f"writing {path} needs pyarrow (pip install pyarrow), or use a .csv output"
+            )
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self._writer = None
+        self._started = False
+
+    def write(self, frame):
+        if self.parquet:
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.path, table.schema)
+            self._writer.write_table(table)
+        else:
+            frame.to_csv(self.path, mode="a" if self._started else "w", header=not self._started, index=False)
+        self._started = True
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+def _output_frame(chunk, keep_columns, predictions, targets):
+    frame = pd.DataFrame(
+        {column: chunk[column].astype("string") for column in keep_columns if column in chunk.columns}
+    )
+    if targets is None:
+        frame["prediction"] = predictions[:, 0]
+    else:
+        for j, target in enumerate(targets):
+            frame[f"prediction_{target}"] = predictions[:, j]
+    return frame
+
+
+# --- Main Scoring Loop ---
+def main():
+    args = parser.parse_args()
+    try:
+        current = load_model(args.model)
+    except (KeyError, RuntimeError) as e:
+        print(f"Error loading model {args.model}: {e}")
+        return
+    try:
+        writer = OutputWriter(args.output)
+    except RuntimeError as e:
+        print(f"Error: {e}")
+        return
+    print(f"Scoring {args.input} with model version {current.version} on {args.workers} process(es)")
+
+    started = time.perf_counter()
+    rows = unscored = 0
+    bad_lines = []
+    pool = None
+    if args.workers > 1:
+        pool = ProcessPoolExecutor(
+            max_workers=args.workers,
+            initializer=_init_worker,
+            initargs=(args.model, args.threads),
+        )
+    else:
+        _init_worker(args.model, args.threads)
+    pending = deque()
+
+    def finish_oldest():
+        nonlocal rows, unscored
+        chunk, predictions = pending.popleft()
+        if pool is not None:
+            predictions = predictions.result()
+        writer.write(_output_frame(chunk, args.keep_columns, predictions, current.targets))
+        rows += len(chunk)
+        unscored += int(np.isnan(predictions).any(axis=1).sum())
+        print(f"Scored {rows} rows ({rows / (time.perf_counter() - started) * 60:,.0f} rows/min)")
+
+    try:
+        for chunk in read_chunks(args.input, args.chunk_size, bad_lines):
+            values = feature_values(chunk, current)
+            if pool is None:
+                pending.append((chunk, score_chunk(values)))
+            else:
+                pending.append((chunk, pool.submit(score_chunk, values)))
+            # Bounded read-ahead: never more than two chunks per worker in memory
+            while len(pending) >= 2 * max(args.workers, 1) or (pool is None and pending):
+                finish_oldest()
+        while pending:
+            finish_oldest()
+    except (OSError, ValueError) as e:
+        print(f"Error scoring {args.input}: {e}")
+        return
+    finally:
+        writer.close()
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    elapsed = time.perf_counter() - started
+    print(
+        f"Scored {rows} rows in {elapsed:.1f}s ({rows / max(elapsed, 1e-9) * 60:,.0f} rows/min), "
+        f"{unscored} rows with missing or invalid features left unscored"
+    )
+    if bad_lines:
+        print(f"Warning: skipped {len(bad_lines)} JSON lines that did not parse")
+    print(f"Predictions saved to {writer.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+# cost_aware_search.py
+# Hyperparameter search under a wall-clock budget.
+# Trials (one cross-validation of one parameter set) run in waves of
+# parallel worker processes. After every wave the per-tree fit cost of each
+# parameter region (e.g. criterion="absolute_error" with unbounded depth) is
+# re-estimated from the finished trials; the next wave takes the cheapest
+# remaining trials that still fit in the budget. A trial running much longer
+# than its estimate is killed, and its region is marked at least that
+# expensive. The search can stop as soon as a trial reaches a goal score.
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.base import clone
+from sklearn.model_selection import cross_validate
+
+from timelimit import TimeLimitExceeded, run_with_time_limit
+
+# A trial is killed after this many times its estimated duration
+KILL_FACTOR = 3.0
+# Share of the remaining budget a trial may use while nothing is known yet
+UNKNOWN_COST_SHARE = 0.25
+
+
+def default_region(params):
+    """Parameter region used to pool cost observations of forest trials"""
+    return (
+        params.get("criterion"),
+        "unbounded" if params.get("max_depth", 0) is None else "bounded",
+        str(params.get("max_features")),
+    )
+
+
+def _run_trial(estimator, params, X, y, cv, scoring):
+    started = time.perf_counter()
+    scores = cross_validate(
+        clone(estimator).set_params(**params), X, y, cv=cv, scoring=scoring, n_jobs=1
+    )
+    return {
+        "scores": [float(score) for score in scores["test_score"]],
+        "fit_time": time.perf_counter() - started,
+    }
+
+
+class CostModel:
+    """
+    Per-region cost of one unit of work (one tree by default). Killed trials
+    count as lower bounds, so a region that keeps timing out grows more
+    expensive with every kill.
+    """
+
+    def __init__(self, region=default_region, size_param="n_estimators"):
+        self.region = region
+        self.size_param = size_param
+        self.observations = {}  # region -> list of seconds per unit
+
+    def units(self, params):
+        return max(1, params.get(self.size_param, 1) or 1)
+
+    def observe(self, params, seconds):
+        self.observations.setdefault(self.region(params), []).append(
+            seconds / self.units(params)
+        )
+
+    def estimate(self, params):
+        """Estimated trial seconds, or None while nothing has been observed"""
+        costs = self.observations.get(self.region(params))
+        if costs is None:
+            if not self.observations:
+                return None
+            # Unseen region: assume the typical observed cost
+            costs = [np.median(values) for values in self.observations.values()]
+        return float(np.median(costs)) * self.units(params)
+
+
+class CostAwareSearch:
+    """
+    Evaluates as many of the candidate parameter dicts as time_budget seconds
+    allow, cheapest first. After fit: trials_ is a DataFrame with one row per
+    candidate (status ok / killed / skipped / error, fit_time, mean score,
+    pareto flag) and best_index_, best_params_, best_score_ describe the
+    best finished trial.
+    """
+
+    def __init__(
+        self,
+        estimator,
+        candidates,
+        time_budget,
+        cv=3,
+        scoring=None,
+        n_workers=1,
+        goal_score=None,
+        cost_model=None,
+        verbose=1,
+    ):
+        self.estimator = estimator
+        self.candidates = candidates
+        self.time_budget = time_budget
+        self.cv = cv
+        self.scoring = scoring
+        self.n_workers = n_workers
+        self.goal_score = goal_score
+        self.cost_model = cost_model or CostModel()
+        self.verbose = verbose
+
+    def _time_limit(self, estimate, remaining):
+        if estimate is None:
+            return remaining * UNKNOWN_COST_SHARE
+        return min(remaining, KILL_FACTOR * estimate)
+
+    def fit(self, X, y):
+        started = time.monotonic()
+        trials = [
+            {"status": "pending", "fit_time": np.nan, "scores": None, "estimate": np.nan}
+            for _ in self.candidates
+        ]
+        pending = list(range(len(self.candidates)))
+        wave = 0
+        while pending:
+            remaining = self.time_budget - (time.monotonic() - started)
+            if remaining <= 0:
+                break
+            estimates = {index: self.cost_model.estimate(self.candidates[index]) for index in pending}
+            # Cheapest first; with no observations yet, n_estimators decides
+            pending.sort(
+                key=lambda index: (
+                    estimates[index]
+                    if estimates[index] is not None
+                    else self.cost_model.units(self.candidates[index])
+                )
+            )
+            batch = []
+            for index in pending:
+                if len(batch) == self.n_workers:
+                    break
+                if estimates[index] is not None and estimates[index] > remaining:
+                    continue  # Would blow the budget, maybe later estimates improve
+                batch.append(index)
+            if not batch:
+                break
+            for index in batch:
+                pending.remove(index)
+                trials[index]["estimate"] = estimates[index] if estimates[index] is not None else np.nan
+
+            wave += 1
+            if self.verbose:
+                print(f"Wave {wave}: {len(batch)} trials, {remaining:.0f}s of budget left")
+            limits = [self._time_limit(estimates[index], remaining) for index in batch]
+            wave_started = time.monotonic()
+            outcomes = run_with_time_limit(
+                [
+                    (_run_trial, (self.estimator, self.candidates[index], X, y, self.cv, self.scoring))
+                    for index in batch
+                ],
+                time_limit=limits,
+                budget=remaining,
+                max_workers=self.n_workers,
+            )
+            for index, limit, outcome in zip(batch, limits, outcomes):
+                trial = trials[index]
+                if isinstance(outcome, TimeLimitExceeded):
+                    trial["status"] = "killed"
+                    trial["fit_time"] = min(limit, time.monotonic() - wave_started)
+                    # Lower bound: the region costs at least this much
+                    self.cost_model.observe(self.candidates[index], trial["fit_time"])
+                elif isinstance(outcome, Exception):
+                    trial["status"] = "error"
+                    print(f"Trial {index} failed: {outcome}")
+                else:
+                    trial.update(status="ok", fit_time=outcome["fit_time"], scores=outcome["scores"])
+                    self.cost_model.observe(self.candidates[index], outcome["fit_time"])
+
+            scores = [np.mean(trial["scores"]) for trial in trials if trial["status"] == "ok"]
+            if self.goal_score is not None and scores and max(scores) >= self.goal_score:
+                print("Goal score reached, stopping the search.")
+                break
+
+        for index in pending:
+            trials[index]["status"] = "skipped"
+        self.trials_ = self._report(trials)
+        finished = self.trials_[self.trials_["status"] == "ok"]
+        if finished.empty:
+            raise RuntimeError("No trial finished within the time budget")
+        self.best_index_ = int(finished["mean_score"].idxmax())
+        self.best_params_ = self.candidates[self.best_index_]
+        self.best_score_ = float(finished["mean_score"].max())
+        self.elapsed_ = time.monotonic() - started
+        return self
+
+    def _report(self, trials):
+        rows = []
+        for index, (params, trial) in enumerate(zip(self.candidates, trials)):
+            rows.append(
+                {
+                    "params": params,
+                    "region": "/".join(map(str, self.cost_model.region(params))),
+                    "status": trial["status"],
+                    "estimate": trial["estimate"],
+                    "fit_time": trial["fit_time"],
+                    "mean_score": np.mean(trial["scores"]) if trial["scores"] else np.nan,
+                    "scores": trial["scores"],
+                }
+            )
+        report = pd.DataFrame(rows)
+        # Pareto front: no other finished trial is both faster and better
+        report["pareto"] = False
+        finished = report[report["status"] == "ok"].sort_values(["fit_time", "mean_score"], ascending=[True, False])
+        best = -np.inf
+        for index, row in finished.iterrows():
+            if row["mean_score"] > best:
+                report.loc[index, "pareto"] = True
+                best = row["mean_score"]
+        return report
@@ -0,0 +1,240 @@
+# dataset_cache.py
+# Converts a CSV once into one .npy file per column (integers downcast to the
+# smallest integer type; floats kept as float64, or float32 with
+# DATASET_CACHE_FLOAT32=1) and serves later loads from memory-mapped arrays.
+# A cache is refreshed when its source changes: the mtime/size are checked
+# first and the content hash settles any doubt. A CSV that only had rows
+# appended (like sensor_data_log.csv) has just the new rows parsed and added
+# to the columns; any other change rebuilds the cache.
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+# DATASET_CACHE=0 reads CSVs directly
+CACHE_ENABLED = os.environ.get("DATASET_CACHE", "1") != "0"
+# Defaults to a .dataset_cache directory next to each CSV
+CACHE_DIR = os.environ.get("DATASET_CACHE_DIR")
+# Halves the memory of float columns, but models that do not already work in
+# float32 (everything except the tree ensembles) then train on rounded values
+FLOAT32 = os.environ.get("DATASET_CACHE_FLOAT32", "0") == "1"
+MANIFEST = "manifest.json"
+FORMAT_VERSION = 2
+
+
+def _cache_path(csv_path, cache_dir=None, float32=FLOAT32):
+    csv_path = os.path.abspath(csv_path)
+    root = cache_dir or CACHE_DIR or os.path.join(os.path.dirname(csv_path), ".dataset_cache")
+    return os.path.join(root, os.path.basename(csv_path) + (".float32" if float32 else ""))
+
+
+def _file_hash(path, size=None):
+    """sha256 of the file, or of its first size bytes"""
+    digest = hashlib.sha256()
+    remaining = float("inf") if size is None else size
+    with open(path, "rb") as f:
+        while remaining > 0:
+            block = f.read(int(min(1 << 20, remaining)))
+            if not block:
+                break
+            digest.update(block)
+            remaining -= len(block)
+    return digest.hexdigest()
+
+
+def _read_manifest(cache_path):
+    try:
+        with open(os.path.join(cache_path, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_manifest(cache_path, manifest):
+    tmp_path = os.path.join(cache_path, MANIFEST + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, os.path.join(cache_path, MANIFEST))
+
+
+def _downcast(series, float32):
+    if pd.api.types.is_float_dtype(series):
+        return series.to_numpy(dtype=np.float32 if float32 else np.float64)
+    if pd.api.types.is_integer_dtype(series):
+        return pd.to_numeric(series, downcast="integer").to_numpy()
+    if pd.api.types.is_bool_dtype(series):
+        return series.to_numpy()
+    # Text (timestamps and the like) stays as objects, loaded without mmap
+    return series.to_numpy(dtype=object)
+
+
+def _write_cache(csv_path, cache_path, stat, arrays, float32):
+    """
+    Writes {column name: values} and the manifest into a fresh directory
+    and swaps it in as cache_path. Concurrent builders each use their own
+    directory; the last swap wins and the others' work is discarded.
+    """
+    parent = os.path.dirname(cache_path)
+    os.makedirs(parent, exist_ok=True)
+    tmp_path = tempfile.mkdtemp(prefix=os.path.basename(cache_path) + ".building-", dir=parent)
+    try:
+        columns = []
+        for position, (name, values) in enumerate(arrays.items()):
+            file_name = f"{position:04d}.npy"
+            np.save(os.path.join(tmp_path, file_name), values, allow_pickle=values.dtype == object)
+            columns.append({"name": name, "file": file_name, "dtype": values.dtype.str})
+        rows = len(next(iter(arrays.values()))) if arrays else 0
+        _write_manifest(
+            tmp_path,
+            {
+                "format": FORMAT_VERSION,
+                "source": os.path.abspath(csv_path),
+                "float32": float32,
+                "mtime_ns": stat.st_mtime_ns,
+                "size": stat.st_size,
+                "sha256": _file_hash(csv_path, stat.st_size),
+                "rows": rows,
+                "columns": columns,
+            },
+        )
+        # Readers holding memory maps of the old files keep them after the unlink
+        old_path = None
+        if os.path.exists(cache_path):
+            old_path = tempfile.mkdtemp(prefix=os.path.basename(cache_path) + ".old-", dir=parent)
+            os.replace(cache_path, os.path.join(old_path, "cache"))
+        try:
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            # Another builder swapped its cache in first
+            pass
+        if old_path is not None:
+            shutil.rmtree(old_path, ignore_errors=True)
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    return rows, len(columns)
+
+
+def build_cache(csv_path, cache_dir=None, float32=FLOAT32):
+    """Converts csv_path into its column cache and returns the manifest"""
+    cache_path = _cache_path(csv_path, cache_dir, float32)
+    stat = os.stat(csv_path)
+    data = pd.read_csv(csv_path)
+    arrays = {str(column): _downcast(data[column], float32) for column in data.columns}
+    rows, columns = _write_cache(csv_path, cache_path, stat, arrays, float32)
+    print(f"Cached {csv_path} ({rows} rows, {columns} columns) in {cache_path}")
+    return _read_manifest(cache_path)
+
+
+def _appended_rows(csv_path, manifest, stat):
+    """
+    The rows added to csv_path since manifest was written, as a DataFrame,
+    or None if the file changed in any other way.
+    """
+    size = manifest["size"]
+    if stat.st_size <= size:
+        return None
+    with open(csv_path, "rb") as f:
+        f.seek(size - 1)
+        if f.read(1) != b"\n":
+            return None  # The last cached row was still being written
+    if _file_hash(csv_path, size) != manifest["sha256"]:
+        return None
+    with open(csv_path, "rb") as f:
+        f.seek(size)
+        return pd.read_csv(
+            f, header=None, names=[column["name"] for column in manifest["columns"]]
+        )
+
+
+def append_cache(csv_path, cache_path, manifest, stat, tail, float32=FLOAT32):
+    """
+    Adds the rows of tail (see _appended_rows) to the cached columns and
+    returns the manifest, or None if a column's type changed (e.g. text in a
+    numeric column) and the cache has to be rebuilt.
+    """
+    arrays = {}
+    for column in manifest["columns"]:
+        old = np.load(
+            os.path.join(cache_path, column["file"]), mmap_mode="r", allow_pickle=column["dtype"] == "|O"
+        )
+        new = tail[column["name"]]
+        if (old.dtype == object) != (new.dtype == object):
+            return None
+        arrays[column["name"]] = _downcast(
+            pd.concat([pd.Series(np.asarray(old)), new], ignore_index=True), float32
+        )
+    rows, _ = _write_cache(csv_path, cache_path, stat, arrays, float32)
+    print(f"Appended {len(tail)} rows to the cache of {csv_path} ({rows} rows) in {cache_path}")
+    return _read_manifest(cache_path)
+
+
+def ensure_cache(csv_path, cache_dir=None, float32=FLOAT32):
+    """Returns (cache directory, manifest), refreshing the cache if it is stale"""
+    cache_path = _cache_path(csv_path, cache_dir, float32)
+    stat = os.stat(csv_path)  # FileNotFoundError like pd.read_csv
+    manifest = _read_manifest(cache_path)
+    if manifest is None or manifest.get("format") != FORMAT_VERSION:
+        return cache_path, build_cache(csv_path, cache_dir, float32)
+    if manifest["mtime_ns"] == stat.st_mtime_ns and manifest["size"] == stat.st_size:
+        return cache_path, manifest
+    # Touched but maybe unchanged (copied, checked out again)
+    if manifest["size"] == stat.st_size and manifest["sha256"] == _file_hash(csv_path):
+        manifest["mtime_ns"] = stat.st_mtime_ns
+        _write_manifest(cache_path, manifest)
+        return cache_path, manifest
+    tail = _appended_rows(csv_path, manifest, stat)
+    if tail is not None:
+        appended = append_cache(csv_path, cache_path, manifest, stat, tail, float32)
+        if appended is not None:
+            return cache_path, appended
+    return cache_path, build_cache(csv_path, cache_dir, float32)
+
+
+def dataset_columns(csv_path, cache_dir=None):
+    """Column names of csv_path, in file order"""
+    _, manifest = ensure_cache(csv_path, cache_dir)
+    return [column["name"] for column in manifest["columns"]]
+
+
+def load_csv(csv_path, columns=None, index_col=None, mmap=True, cache_dir=None):
+    """
+    Cached stand-in for pd.read_csv(csv_path, usecols=columns, index_col=index_col).
+    Numeric columns are memory-mapped read-only unless mmap is False, so
+    only the columns (and pages) that are used get read. Float columns are
+    float64 as pd.read_csv returns them unless DATASET_CACHE_FLOAT32=1.
+    """
+    if not CACHE_ENABLED:
+        return pd.read_csv(csv_path, usecols=columns, index_col=index_col)
+
+    cache_path, manifest = ensure_cache(csv_path, cache_dir)
+    by_name = {column["name"]: column for column in manifest["columns"]}
+    names = [column["name"] for column in manifest["columns"]]
+    if isinstance(index_col, int):
+        index_col = names[index_col]
+    if columns is not None:
+        missing = [name for name in columns if name not in by_name]
+        if missing:
+            raise ValueError(f"Usecols do not match columns, columns expected but not found: {missing}")
+        names = [name for name in names if name in columns or name == index_col]
+
+    arrays = {}
+    for name in names:
+        entry = by_name[name]
+        is_object = np.dtype(entry["dtype"]) == object
+        arrays[name] = np.load(
+            os.path.join(cache_path, entry["file"]),
+            mmap_mode=None if (is_object or not mmap) else "r",
+            allow_pickle=is_object,
+        )
+    index = None
+    if index_col is not None:
+        # pandas leaves the name of an unnamed index column empty
+        index = pd.Index(
+            np.asarray(arrays.pop(index_col)),
+            name=None if index_col.startswith("Unnamed: ") else index_col,
+        )
+    return pd.DataFrame(arrays, index=index, copy=False)
@@ -0,0 +1,121 @@
+# experiment_store.py
+# Local record of finished model evaluations, so reruns and interrupted runs
+# of training.py / tune_rf_standalone.py only evaluate what is new.
+# Results are keyed by a hash of everything that determines them: dataset
+# content, split/fold indices, estimator class and parameters, and metrics.
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import joblib
+import numpy as np
+
+DEFAULT_STORE_PATH = os.path.join("models", "experiments.sqlite")
+
+
+def fingerprint(*parts):
+    """
+    Stable hex digest of arrays, frames, estimators and JSON-like values.
+    Estimators contribute their class and parameters, not their fitted state.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        if hasattr(part, "get_params"):
+            part = {
+                "estimator": type(part).__module__ + "." + type(part).__qualname__,
+                "params": part.get_params(deep=False),
+            }
+        elif hasattr(part, "to_numpy"):
+            part = part.to_numpy()
+        if isinstance(part, np.ndarray):
+            array = np.ascontiguousarray(part)
+            digest.update(f"{array.dtype.str}{array.shape}".encode())
+            digest.update(array.tobytes())
+        else:
+            digest.update(json.dumps(part, sort_keys=True, default=repr).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ExperimentStore:
+    """SQLite table of evaluation results: key -> JSON scores"""
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        # WAL lets a second run read while another one writes
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                name TEXT,
+                scores TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        self._connection.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Returns the stored scores for key, or None"""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT scores FROM results WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key, kind, name, scores):
+        """Records scores (a JSON-serialisable value); committed immediately"""
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                (key, kind, name, json.dumps(scores, default=float), time.time()),
+            )
+            self._connection.commit()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class ArtifactWriter:
+    """
+    Writes joblib artifacts on a background thread so training does not
+    wait on disk. Files appear atomically (written to .tmp, then renamed).
+    """
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="artifacts")
+        self._pending = []
+
+    def submit(self, obj, path, **dump_kwargs):
+        self._pending.append(self._executor.submit(self._write, obj, path, dump_kwargs))
+
+    @staticmethod
+    def _write(obj, path, dump_kwargs):
+        tmp_path = path + ".tmp"
+        joblib.dump(obj, tmp_path, **dump_kwargs)
+        os.replace(tmp_path, path)
+        return path
+
+    def flush(self):
+        """Waits for every submitted write, re-raising the first failure"""
+        pending, self._pending = self._pending, []
+        for future in pending:
+            future.result()
@@ -0,0 +1,182 @@
+# model_bundle.py
+# One self-describing, versioned file per deployable model:
+# model, scaler, feature schema, target, training metrics and a content hash
+# (plus the rolling-feature configuration of models trained with it).
+# The file is an uncompressed joblib dict, so its arrays can be memory-mapped:
+#   - tree ensembles also carry their compiled node arrays (tree_engine.py),
+#     which the server uses directly without unpickling the estimator;
+#   - the estimator itself is kept as pickled bytes and only unpickled on
+#     first use (e.g. batches above the engine's row limit, or non-tree models).
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+
+import joblib
+import numpy as np
+
+from tree_engine import CompiledTreeEnsemble, HybridTreePredictor, select_engine
+
+BUNDLE_FORMAT = "ecoverify-model-bundle"
+BUNDLE_VERSION = 1
+BUNDLE_SUFFIX = ".bundle.joblib"
+# Node arrays of a compiled ensemble, in hashing order
+ENGINE_ARRAYS = ["feature", "threshold", "left", "right", "missing_left", "value", "roots"]
+
+
+def _check_features(model, scaler, features):
+    """Rejects a model/scaler pair that was not fitted on features"""
+    names = getattr(scaler, "feature_names_in_", None)
+    if names is not None and [str(name) for name in names] != list(features):
+        raise ValueError(
+            f"Scaler was fitted on {[str(name) for name in names]}, bundle lists {list(features)}"
+        )
+    for label, obj in (("Scaler", scaler), ("Model", model)):
+        count = getattr(obj, "n_features_in_", len(features))
+        if count != len(features):
+            raise ValueError(f"{label} expects {count} features, bundle lists {len(features)}")
+
+
+def _content_hash(header, model_bytes, scaler_bytes, engine):
+    digest = hashlib.sha256()
+    digest.update(json.dumps(header, sort_keys=True, default=float).encode())
+    digest.update(memoryview(model_bytes))
+    digest.update(memoryview(scaler_bytes))
+    if engine is not None:
+        for name in ENGINE_ARRAYS:
+            digest.update(np.ascontiguousarray(getattr(engine, name)).tobytes())
+    return digest.hexdigest()
+
+
+def write_bundle(
+    path, model, scaler, features, target=None, name=None, metrics=None, rolling=None
+):
+    """
+    Writes a bundle atomically and returns its content hash.
+    Tree ensembles are compiled (and checked against the estimator) at
+    write time, so loading them costs nothing extra.
+    rolling is RollingFeatures.config() for models trained on rolling features.
+    """
+    features = [str(feature) for feature in features]
+    _check_features(model, scaler, features)
+    engine = select_engine(model, "compiled")
+    if not isinstance(engine, CompiledTreeEnsemble):
+        engine = None
+    header = {
+        "format": BUNDLE_FORMAT,
+        "version": BUNDLE_VERSION,
+        "name": name or os.path.basename(path)[: -len(BUNDLE_SUFFIX)],
+        "target": target,
+        "features": features,
+        "metrics": metrics or {},
+        "model_type": type(model).__name__,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    if rolling is not None:
+        header["rolling"] = rolling
+    model_bytes = np.frombuffer(pickle.dumps(model, protocol=5), dtype=np.uint8)
+    scaler_bytes = np.frombuffer(pickle.dumps(scaler, protocol=5), dtype=np.uint8)
+    content_hash = _content_hash(header, model_bytes, scaler_bytes, engine)
+    bundle = dict(
+        header,
+        content_hash=content_hash,
+        model_bytes=model_bytes,
+        scaler_bytes=scaler_bytes,
+        engine=engine,
+    )
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    tmp_path = path + ".tmp"
+    joblib.dump(bundle, tmp_path, compress=0)
+    os.replace(tmp_path, path)
+    print(f"Model bundle saved to {path} ({content_hash[:12]})")
+    return content_hash
+
+
+class _LazyEstimator:
+    """Stands in for the bundle's estimator until a prediction needs it"""
+
+    def __init__(self, bundle):
+        self.bundle = bundle
+        self.n_features_in_ = len(bundle.features)
+
+    def predict(self, X):
+        return self.bundle.model.predict(X)
+
+
+class ModelBundle:
+    """A loaded bundle; the estimator is unpickled on first access of .model"""
+
+    def __init__(self, path, contents):
+        self.path = path
+        self.header = {
+            key: contents[key]
+            for key in ("format", "version", "name", "target", "features", "metrics",
+                        "model_type", "created_at", "rolling")
+            if key in contents
+        }
+        self.name = contents["name"]
+        self.target = contents["target"]
+        self.features = list(contents["features"])
+        self.metrics = contents["metrics"]
+        self.rolling = contents.get("rolling")
+        self.content_hash = contents["content_hash"]
+        self.engine = contents["engine"]
+        self._model_bytes = contents["model_bytes"]
+        self._scaler_bytes = contents["scaler_bytes"]
+        self.scaler = pickle.loads(self._scaler_bytes)
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    started = time.perf_counter()
+                    self._model = pickle.loads(self._model_bytes)
+                    print(
+                        f"Unpickled {self.header['model_type']} from {self.path} "
+                        f"in {time.perf_counter() - started:.2f}s"
+                    )
+        return self._model
+
+    def verify(self):
+        """Recomputes the content hash, raising ValueError on a mismatch"""
+        actual = _content_hash(self.header, self._model_bytes, self._scaler_bytes, self.engine)
+        if actual != self.content_hash:
+            raise ValueError(f"Bundle {self.path} is corrupt (content hash mismatch)")
+
+    def serving_model(self, mode="auto", max_rows=128):
+        """
+        Predictor for a tree_engine mode. With compiled node arrays,
+        "compiled" never unpickles the estimator and "auto" only does so for
+        the first batch above max_rows.
+        """
+        if self.engine is None or mode == "sklearn":
+            return self.model
+        if mode == "compiled":
+            return self.engine
+        if mode != "auto":
+            raise ValueError(f"Unknown tree engine mode: {mode}")
+        return HybridTreePredictor(_LazyEstimator(self), self.engine, max_rows)
+
+
+def load_bundle(path, mmap=True, verify=False):
+    """Loads a bundle, memory-mapping its arrays unless mmap is False"""
+    contents = joblib.load(path, mmap_mode="r" if mmap else None)
+    if not isinstance(contents, dict) or contents.get("format") != BUNDLE_FORMAT:
+        raise ValueError(f"{path} is not a model bundle")
+    if contents["version"] > BUNDLE_VERSION:
+        raise ValueError(
+            f"{path} has bundle version {contents['version']}, "
+            f"this code reads up to {BUNDLE_VERSION}"
+        )
+    bundle = ModelBundle(path, contents)
+    if verify:
+        bundle.verify()
+    _check_features(bundle.engine, bundle.scaler, bundle.features)
+    return bundle
@@ -0,0 +1,379 @@
+# model_compaction.py
+# Shrinks a fitted tree ensemble after training while guarding its accuracy.
+#   - Tree subset: random forests keep the trees that help most (greedy
+#     forward selection on a third of the test set); boosted models keep
+#     their first stages.
+#   - Depth capping: forest trees are cut at a maximum depth and the cut
+#     subtrees are merged into leaves (each node already holds the prediction
+#     for its samples), then the node arrays are rebuilt without them.
+# Each step is tried from gentle to aggressive and the search stops at the
+# first one whose RMSE or MAPE on another third of the test set degrades by
+# more than the allowed fraction. The report scores the original and the
+# compacted model on the last third, which took no part in either choice.
+#
+#   python model_compaction.py --schema models/tuned_standalone_RandomForest_CO.schema.json \
+#       --data-path gt_full.csv
+import argparse
+import copy
+import json
+import os
+import tempfile
+import time
+
+import joblib
+import numpy as np
+from sklearn.ensemble import ExtraTreesRegressor, GradientBoostingRegressor, RandomForestRegressor
+from sklearn.metrics import mean_absolute_percentage_error, mean_squared_error
+from sklearn.model_selection import train_test_split
+
+from dataset_cache import load_csv
+
+OUTPUT_DIR = "models"
+# sklearn's markers for "no child" / "no split" in tree node arrays
+TREE_LEAF = -1
+TREE_UNDEFINED = -2
+# Each tree-subset step keeps this share of the previous step's trees
+SUBSET_SHRINK = 0.75
+LATENCY_REPEATS = 50
+LATENCY_BATCH_ROWS = 1000
+LOAD_REPEATS = 3
+
+
+def _scores(model, X, y):
+    y_pred = model.predict(X)
+    return {
+        "rmse": float(np.sqrt(mean_squared_error(y, y_pred))),
+        "mape": float(mean_absolute_percentage_error(y, y_pred)),
+    }
+
+
+def _kind(model):
+    if isinstance(model, (RandomForestRegressor, ExtraTreesRegressor)):
+        return "forest"
+    if isinstance(model, GradientBoostingRegressor):
+        return "boosting"
+    if hasattr(model, "get_booster"):
+        return "xgboost"
+    return None
+
+
+def _tree_count(model):
+    kind = _kind(model)
+    if kind == "forest":
+        return len(model.estimators_)
+    if kind == "boosting":
+        return model.n_estimators_
+    return model.get_booster().num_boosted_rounds()
+
+
+def _node_depths(nodes):
+    """Depth of every node; children always come after their parent"""
+    depths = np.zeros(len(nodes), dtype=np.int64)
+    frontier = np.array([0])
+    level = 0
+    while len(frontier):
+        depths[frontier] = level
+        internal = frontier[nodes["left_child"][frontier] != TREE_LEAF]
+        frontier = np.concatenate(
+            [nodes["left_child"][internal], nodes["right_child"][internal]]
+        )
+        level += 1
+    return depths
+
+
+def cap_tree_depth(tree, max_depth):
+    """
+    Copy of a fitted sklearn Tree cut at max_depth: nodes at that depth
+    become leaves and everything below them is dropped.
+    """
+    cls, init_args, state = tree.__reduce__()
+    nodes, values = state["nodes"], state["values"]
+    depths = _node_depths(nodes)
+    keep = depths <= max_depth
+    new_index = np.cumsum(keep) - 1
+
+    capped = nodes[keep].copy()
+    leaf = (capped["left_child"] == TREE_LEAF) | (depths[keep] == max_depth)
+    capped["left_child"] = np.where(leaf, TREE_LEAF, new_index[capped["left_child"]])
+    capped["right_child"] = np.where(leaf, TREE_LEAF, new_index[capped["right_child"]])
+    capped["feature"] = np.where(leaf, TREE_UNDEFINED, capped["feature"])
+    capped["threshold"] = np.where(leaf, TREE_UNDEFINED, capped["threshold"])
+
+    new_tree = cls(*init_args)
+    new_tree.__setstate__(
+        dict(
+            state,
+            max_depth=int(min(state["max_depth"], max_depth)),
+            node_count=int(keep.sum()),
+            nodes=capped,
+            values=np.ascontiguousarray(values[keep]),
+        )
+    )
+    return new_tree
+
+
+def _forest_order(model, X, y):
+    """
+    Tree indices in greedy forward-selection order: each step adds the tree
+    that lowers the squared error of the running average most.
+    """
+    predictions = np.array([tree.predict(X) for tree in model.estimators_])
+    remaining = list(range(len(predictions)))
+    order = []
+    total = np.zeros(len(y))
+    while remaining:
+        errors = (((total + predictions[remaining]) / (len(order) + 1) - y) ** 2).mean(axis=1)
+        chosen = remaining.pop(int(np.argmin(errors)))
+        order.append(chosen)
+        total += predictions[chosen]
+    return order
+
+
+def _keep_trees(model, count, order=None):
+    """Copy of model with count trees (forest: the first count of order)"""
+    compact = copy.copy(model)
+    kind = _kind(model)
+    if kind == "forest":
+        compact.estimators_ = [model.estimators_[index] for index in order[:count]]
+        compact.n_estimators = count
+    elif kind == "boosting":
+        compact.estimators_ = model.estimators_[:count]
+        compact.train_score_ = model.train_score_[:count]
+        compact.n_estimators_ = count
+        compact.n_estimators = count
+    else:
+        compact._Booster = model.get_booster()[:count]
+        compact.n_estimators = count
+    return compact
+
+
+def _cap_depth(model, max_depth):
+    compact = copy.copy(model)
+    compact.estimators_ = []
+    for estimator in model.estimators_:
+        capped = copy.copy(estimator)
+        capped.tree_ = cap_tree_depth(estimator.tree_, max_depth)
+        capped.max_depth = max_depth
+        compact.estimators_.append(capped)
+    compact.max_depth = max_depth
+    return compact
+
+
+def measure(model, X):
+    """Pickled size, load time and predict latency of model"""
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "model.joblib")
+        joblib.dump(model, path)
+        size = os.path.getsize(path)
+        load_times = []
+        for _ in range(LOAD_REPEATS):
+            started = time.perf_counter()
+            joblib.load(path)
+            load_times.append(time.perf_counter() - started)
+    single = X[:1]
+    model.predict(single)  # Warm-up
+    timings = []
+    for _ in range(LATENCY_REPEATS):
+        started = time.perf_counter()
+        model.predict(single)
+        timings.append(time.perf_counter() - started)
+    batch = X[np.arange(LATENCY_BATCH_ROWS) % len(X)]
+    started = time.perf_counter()
+    model.predict(batch)
+    return {
+        "trees": _tree_count(model),
+        "size_mb": size / 2**20,
+        "load_ms": float(np.median(load_times)) * 1000,
+        "latency_single_ms": float(np.median(timings)) * 1000,
+        "latency_batch_ms": (time.perf_counter() - started) * 1000,
+    }
+
+
+def compact_model(
+    model, X_test, y_test, max_rmse_increase=0.01, max_mape_increase=0.01, random_state=42
+):
+    """
+    Returns (compacted model, report). X_test must be scaled like the
+    training data. The test rows are split in three: one third orders forest
+    trees, one guards accuracy (a step is kept only while RMSE and MAPE stay
+    within max_*_increase, relative, of the original model's) and one is
+    held out for the report's "baseline" and "compacted" scores.
+    """
+    kind = _kind(model)
+    if kind is None:
+        raise ValueError(f"{type(model).__name__} is not a supported tree ensemble")
+    X_test = np.asarray(X_test)
+    y_test = np.asarray(y_test, dtype=float)
+    X_select, X_rest, y_select, y_rest = train_test_split(
+        X_test, y_test, test_size=2 / 3, random_state=random_state
+    )
+    X_guard, X_holdout, y_guard, y_holdout = train_test_split(
+        X_rest, y_rest, test_size=0.5, random_state=random_state
+    )
+    guard = _scores(model, X_guard, y_guard)
+    limits = {
+        "rmse": guard["rmse"] * (1 + max_rmse_increase),
+        "mape": guard["mape"] * (1 + max_mape_increase),
+    }
+    steps = []
+
+    def accept(candidate, step):
+        scores = _scores(candidate, X_guard, y_guard)
+        passed = all(scores[metric] <= limits[metric] for metric in limits)
+        steps.append(dict(step, **scores, accepted=passed))
+        print(
+            f"{'kept' if passed else 'rejected'}: {step} "
+            f"(RMSE {scores['rmse']:.4f}, MAPE {scores['mape']:.4f})"
+        )
+        return passed
+
+    compact = model
+    # 1. Tree subset, shrinking until accuracy degrades
+    order = _forest_order(model, X_select, y_select) if kind == "forest" else None
+    count = _tree_count(model)
+    while count > 1:
+        count = max(1, int(count * SUBSET_SHRINK))
+        candidate = _keep_trees(model, count, order)
+        if not accept(candidate, {"trees": count}):
+            break
+        compact = candidate
+
+    # 2. Depth cap on forest trees, one level at a time
+    if kind == "forest":
+        depth = max(estimator.tree_.max_depth for estimator in compact.estimators_)
+        while depth > 1:
+            depth -= 1
+            candidate = _cap_depth(compact, depth)
+            if not accept(candidate, {"max_depth": depth}):
+                break
+            compact = candidate
+
+    report = {
+        "baseline": _scores(model, X_holdout, y_holdout),
+        "compacted": _scores(compact, X_holdout, y_holdout),
+        "guard": guard,
+        "limits": limits,
+        "steps": steps,
+        "before": measure(model, X_holdout),
+        "after": measure(compact, X_holdout),
+    }
+    return compact, report
+
+
+def print_report(report):
+    before, after = report["before"], report["after"]
+    print("\n--- Compaction Report ---")
+    print(f"{'':<20}{'before':>12}{'after':>12}{'saving':>10}")
+    for key, label in [
+        ("trees", "Trees"),
+        ("size_mb", "Size (MB)"),
+        ("load_ms", "Load (ms)"),
+        ("latency_single_ms", "Latency/row (ms)"),
+        ("latency_batch_ms", f"Latency/{LATENCY_BATCH_ROWS} (ms)"),
+    ]:
+        saving = 1 - after[key] / before[key] if before[key] else 0.0
+        print(f"{label:<20}{before[key]:>12.3f}{after[key]:>12.3f}{saving:>10.0%}")
+    print("Held-out rows (not used to choose the steps):")
+    for metric in ["rmse", "mape"]:
+        print(
+            f"{metric.upper():<20}{report['baseline'][metric]:>12.4f}"
+            f"{report['compacted'][metric]:>12.4f}"
+        )
+
+
+def save_compacted(compact, report, name, target, scaler_file, features):
+    """Writes the compacted model, its report and a schema for the model registry"""
+    name = f"{name}_compact"
+    model_file = f"{name}.joblib"
+    joblib.dump(compact, os.path.join(OUTPUT_DIR, model_file))
+    with open(os.path.join(OUTPUT_DIR, f"{name}_report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+    schema_path = os.path.join(OUTPUT_DIR, f"{name}.schema.json")
+    with open(schema_path, "w") as f:
+        json.dump(
+            {
+                "name": name,
+                "target": target,
+                "model": model_file,
+                "scaler": scaler_file,
+                "features": features,
+            },
+            f,
+            indent=2,
+        )
+    print(f"Compacted model saved as {name} ({schema_path})")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Shrink a fitted tree ensemble while keeping test accuracy."
+    )
+    parser.add_argument("--schema", type=str, default=None, help="Model schema (.schema.json).")
+    parser.add_argument("--model-path", type=str, default=None, help="Used without --schema.")
+    parser.add_argument("--scaler-path", type=str, default=None, help="Used without --schema.")
+    parser.add_argument("--target-column", type=str, default=None, help="Used without --schema.")
+    parser.add_argument("--data-path", type=str, required=True)
+    parser.add_argument(
+        "--test-size",
+        type=float,
+        default=0.2,
+        help="Must match the split used when training the model.",
+    )
+    parser.add_argument("--random-state", type=int, default=42)
+    parser.add_argument(
+        "--max-rmse-increase",
+        type=float,
+        default=0.01,
+        help="Largest relative RMSE increase allowed (0.01 = 1%%).",
+    )
+    parser.add_argument(
+        "--max-mape-increase",
+        type=float,
+        default=0.01,
+        help="Largest relative MAPE increase allowed.",
+    )
+    args = parser.parse_args()
+
+    try:
+        if args.schema:
+            with open(args.schema) as f:
+                schema = json.load(f)
+            model_path = os.path.join(OUTPUT_DIR, schema["model"])
+            scaler_path = os.path.join(OUTPUT_DIR, schema["scaler"])
+            name, target = schema["name"], schema["target"]
+        else:
+            model_path, scaler_path, target = args.model_path, args.scaler_path, args.target_column
+            if not (model_path and scaler_path and target):
+                parser.error("--schema or --model-path, --scaler-path and --target-column are required")
+            name = os.path.splitext(os.path.basename(model_path))[0]
+        model = joblib.load(model_path)
+        scaler = joblib.load(scaler_path)
+        features = schema["features"] if args.schema else [str(c) for c in scaler.feature_names_in_]
+        data = load_csv(args.data_path)
+    except (OSError, KeyError, AttributeError, ValueError) as e:
+        print(f"Error loading model or data: {e}")
+        return
+
+    # Same rows as the training scripts' test split
+    _, X_test, _, y_test = train_test_split(
+        data[features], data[target], test_size=args.test_size, random_state=args.random_state
+    )
+    compact, report = compact_model(
+        model,
+        scaler.transform(X_test),
+        y_test,
+        max_rmse_increase=args.max_rmse_increase,
+        max_mape_increase=args.max_mape_increase,
+        random_state=args.random_state,
+    )
+    print_report(report)
+    if compact is model:
+        print("No compaction step stayed within the accuracy limits; nothing saved.")
+        return
+    save_compacted(
+        compact, report, name, target, os.path.relpath(scaler_path, OUTPUT_DIR), features
+    )
+
+
+if __name__ == "__main__":
+    main()
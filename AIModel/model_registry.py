@@ -0,0 +1,187 @@
+# model_registry.py
+# Serves several model/scaler/feature-schema sets from one process.
+# Sets are discovered in the models directory, loaded on first use and kept
+# in a least-recently-used cache bounded by both model count and size.
+import glob
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+ModelSpec = namedtuple(
+    "ModelSpec",
+    ["name", "target", "model_path", "scaler_path", "features", "bundle_path"],
+    defaults=(None,),
+)
+
+# Artifacts written by tune_rf_standalone.py before it wrote schema files
+TUNED_PATTERN = re.compile(r"^tuned_standalone_(?P<estimator>[^_]+)_(?P<target>.+)\.joblib$")
+
+# Seconds between rescans of the models directory
+RESCAN_INTERVAL = 5.0
+
+
+def discover_models(model_dir):
+    """
+    Finds servable sets in model_dir and returns {name: ModelSpec}.
+
+    A ``<name>.schema.json`` file describes a set explicitly:
+    ``{"model": ..., "scaler": ..., "features": [...], "target": ...}`` with
+    paths relative to model_dir, and optionally ``"bundle"``: a model bundle
+    (model_bundle.py) that is served instead of the separate files. Tuned
+    models without a schema are paired with their
+    ``scaler_standalone_<target>.joblib`` and use the feature order stored in
+    the scaler.
+    """
+    specs = {}
+    for schema_path in sorted(glob.glob(os.path.join(model_dir, "*.schema.json"))):
+        try:
+            with open(schema_path) as f:
+                schema = json.load(f)
+            name = schema.get("name") or os.path.basename(schema_path)[: -len(".schema.json")]
+            specs[name] = ModelSpec(
+                name=name,
+                target=schema.get("target"),
+                model_path=os.path.join(model_dir, schema["model"]),
+                scaler_path=os.path.join(model_dir, schema["scaler"]),
+                features=schema.get("features"),
+                bundle_path=(
+                    os.path.join(model_dir, schema["bundle"]) if schema.get("bundle") else None
+                ),
+            )
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Skipping invalid model schema {schema_path}: {e}")
+
+    described = {os.path.abspath(spec.model_path) for spec in specs.values()}
+    for model_path in sorted(glob.glob(os.path.join(model_dir, "tuned_standalone_*.joblib"))):
+        match = TUNED_PATTERN.match(os.path.basename(model_path))
+        if match is None or os.path.abspath(model_path) in described:
+            continue
+        target = match.group("target")
+        scaler_path = os.path.join(model_dir, f"scaler_standalone_{target}.joblib")
+        if not os.path.exists(scaler_path):
+            continue
+        name = f"{match.group('estimator')}_{target}"
+        specs.setdefault(name, ModelSpec(name, target, model_path, scaler_path, None))
+    return specs
+
+
+class ModelRegistry:
+    """
+    Lazily loads model sets by name (or by target when it is unambiguous).
+
+    ``loader(spec)`` turns a ModelSpec into a serving state; the registry only
+    decides what is resident. Sizes are estimated from the artifact files, or
+    from the node arrays for compiled tree ensembles.
+    """
+
+    def __init__(self, model_dir, loader, max_bytes, max_models):
+        self.model_dir = model_dir
+        self.loader = loader
+        self.max_bytes = max_bytes
+        self.max_models = max_models
+        self._specs = {}
+        self._scanned_at = None
+        self._loaded = OrderedDict()  # name -> (state, size in bytes)
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self.loads = 0
+        self.evictions = 0
+
+    def _refresh(self, force=False):
+        now = time.monotonic()
+        if force or self._scanned_at is None or now - self._scanned_at > RESCAN_INTERVAL:
+            self._specs = discover_models(self.model_dir)
+            self._scanned_at = now
+
+    def _resolve(self, name):
+        """Maps a model name or target to a spec name, raising KeyError"""
+        if name in self._specs:
+            return name
+        by_target = [spec.name for spec in self._specs.values() if spec.target == name]
+        if len(by_target) == 1:
+            return by_target[0]
+        raise KeyError(name)
+
+    def names(self):
+        with self._lock:
+            self._refresh()
+            return sorted(self._specs)
+
+    def get(self, name):
+        """Returns the serving state for name, loading it if necessary"""
+        with self._lock:
+            self._refresh()
+            try:
+                name = self._resolve(name)
+            except KeyError:
+                # A model may have been written since the last scan
+                self._refresh(force=True)
+                name = self._resolve(name)
+            if name in self._loaded:
+                self._loaded.move_to_end(name)
+                return self._loaded[name][0]
+            spec = self._specs[name]
+            load_lock = self._load_locks.setdefault(name, threading.Lock())
+
+        with load_lock:
+            with self._lock:
+                if name in self._loaded:
+                    self._loaded.move_to_end(name)
+                    return self._loaded[name][0]
+            started = time.perf_counter()
+            state = self.loader(spec)
+            print(f"Registry loaded {name} in {time.perf_counter() - started:.2f}s")
+            size = self._estimate_bytes(spec, state)
+            with self._lock:
+                self._loaded[name] = (state, size)
+                self.loads += 1
+                self._evict()
+            return state
+
+    def _estimate_bytes(self, spec, state):
+        nbytes = getattr(state.model, "nbytes", None)
+        if isinstance(nbytes, int):
+            return nbytes
+        paths = [spec.bundle_path] if spec.bundle_path else [spec.model_path, spec.scaler_path]
+        return sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+
+    def _evict(self):
+        """Unloads least recently used sets until both bounds hold (keeps the newest)"""
+        while len(self._loaded) > 1 and (
+            len(self._loaded) > self.max_models
+            or sum(size for _, size in self._loaded.values()) > self.max_bytes
+        ):
+            name, _ = self._loaded.popitem(last=False)
+            self.evictions += 1
+            print(f"Registry unloaded {name}")
+
+    def describe(self):
+        """One entry per discovered set, for the /models endpoint"""
+        with self._lock:
+            self._refresh()
+            described = []
+            for name, spec in sorted(self._specs.items()):
+                entry = {"name": name, "target": spec.target, "loaded": name in self._loaded}
+                if name in self._loaded:
+                    state, size = self._loaded[name]
+                    entry.update(
+                        model_version=state.version,
+                        features=state.features,
+                        resident_bytes=size,
+                    )
+                described.append(entry)
+            return described
+
+    def stats(self):
+        with self._lock:
+            return {
+                "registry_loaded": len(self._loaded),
+                "registry_resident_bytes": sum(size for _, size in self._loaded.values()),
+                "registry_max_bytes": self.max_bytes,
+                "registry_max_models": self.max_models,
+                "registry_loads": self.loads,
+                "registry_evictions": self.evictions,
+            }
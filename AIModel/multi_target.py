@@ -0,0 +1,70 @@
+# multi_target.py
+# Several targets (e.g. CO and NOX) served by one estimator-like object.
+# Each target is assigned a winning estimator; targets that share a winner
+# are fitted together, as one multi-output fit where the estimator supports
+# it, and predict returns one column per target from a single call.
+import numpy as np
+from sklearn.base import BaseEstimator, RegressorMixin, clone
+from sklearn.multioutput import MultiOutputRegressor
+from sklearn.neural_network import MLPRegressor
+from sklearn.utils import get_tags
+
+
+def supports_multi_output(model):
+    """True if the estimator fits a 2D target natively (one model for all targets)"""
+    # MLPRegressor fits 2D targets but does not declare it in its tags
+    return get_tags(model).target_tags.multi_output or isinstance(model, MLPRegressor)
+
+
+def as_multi_output(model):
+    """The model itself if it is natively multi-output, else one copy per target"""
+    return model if supports_multi_output(model) else MultiOutputRegressor(model)
+
+
+class MultiTargetModel(RegressorMixin, BaseEstimator):
+    """
+    targets: target names, in output column order.
+    estimators: {name: unfitted estimator}.
+    assignment: the estimator name serving each target.
+    """
+
+    def __init__(self, targets, estimators, assignment):
+        self.targets = targets
+        self.estimators = estimators
+        self.assignment = assignment
+
+    def _groups(self):
+        """{estimator name: output columns}, in target order"""
+        groups = {}
+        for column, name in enumerate(self.assignment):
+            groups.setdefault(name, []).append(column)
+        return groups
+
+    def fit(self, X, y):
+        Y = np.asarray(y)
+        if Y.ndim != 2 or Y.shape[1] != len(self.targets):
+            raise ValueError(f"Expected one target column per target {list(self.targets)}")
+        if len(self.assignment) != len(self.targets):
+            raise ValueError("assignment must name one estimator per target")
+        self.estimators_ = {}
+        for name, columns in self._groups().items():
+            model = clone(self.estimators[name])
+            if len(columns) > 1:
+                model = as_multi_output(model)
+                model.fit(X, Y[:, columns])
+            elif isinstance(model, MultiOutputRegressor):
+                model.fit(X, Y[:, columns])
+            else:
+                model.fit(X, Y[:, columns[0]])
+            self.estimators_[name] = model
+        self.n_features_in_ = np.shape(X)[1]
+        return self
+
+    def predict(self, X):
+        """(n_rows, n_targets) predictions"""
+        predictions = np.empty((len(X), len(self.targets)))
+        for name, columns in self._groups().items():
+            predictions[:, columns] = np.reshape(
+                self.estimators_[name].predict(X), (len(X), len(columns))
+            )
+        return predictions
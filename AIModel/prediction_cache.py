@@ -0,0 +1,130 @@
+# prediction_cache.py
+# In-process LRU + TTL cache for single-row predictions.
+# Sensor readings barely move between samples and dashboards poll the same
+# latest reading over and over, so predictions are memoized on the feature
+# vector rounded to configurable per-feature resolutions.
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def parse_resolutions(spec, features):
+    """
+    Parses "feature=step,feature=step" into a per-feature resolution array.
+    Features that are not listed keep a resolution of 0 (exact match).
+    """
+    resolutions = np.zeros(len(features))
+    if not spec:
+        return resolutions
+    for item in spec.split(","):
+        name, _, step = item.partition("=")
+        name = name.strip()
+        if name not in features:
+            raise ValueError(f"Unknown feature in cache resolutions: {name}")
+        resolutions[features.index(name)] = float(step)
+    return resolutions
+
+
+class PredictionCache:
+    """
+    Bounded LRU cache of predictions with a time-to-live per entry.
+
+    Keys are the feature row quantized to ``resolutions`` (0 = exact), plus
+    an optional device id. The cache is bound to the model/scaler pair that
+    produced its entries and clears itself when either object changes;
+    predictions made by any other pair are not stored.
+    """
+
+    def __init__(self, resolutions, max_entries=10000, ttl=30.0, per_device=False):
+        self.resolutions = np.asarray(resolutions, dtype=np.float64)
+        self._quantized = self.resolutions > 0
+        self._steps = np.where(self._quantized, self.resolutions, 1.0)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.per_device = per_device
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._model = None
+        self._scaler = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def key(self, row, device=None):
+        """Builds the cache key for one feature row"""
+        row = np.ravel(row)
+        quantized = np.where(self._quantized, np.rint(row / self._steps), row)
+        key = quantized.tobytes()
+        if self.per_device:
+            return (device, key)
+        return key
+
+    def bind(self, model, scaler):
+        """Clears the cache if the serving model or scaler has changed"""
+        if model is self._model and scaler is self._scaler:
+            return
+        with self._lock:
+            if model is not self._model or scaler is not self._scaler:
+                if self._model is not None or self._scaler is not None:
+                    self.invalidations += 1
+                self._entries.clear()
+                self._model = model
+                self._scaler = scaler
+
+    def get(self, key):
+        """Returns the cached prediction or None"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires = entry
+            if expires < now:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, model, scaler):
+        """
+        Stores a prediction made by model and scaler, evicting the least
+        recently used entries. Dropped if the cache has since been bound to
+        another pair (a request that was still running on a replaced model).
+        """
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            if model is not self._model or scaler is not self._scaler:
+                return
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Counters for the /cache/stats endpoint"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
@@ -1,13 +1,32 @@
+import csv
+import hashlib
+import json
 import os
+import threading
+import time
 import joblib
 import numpy as np
 import pandas as pd
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
+from sklearn.linear_model import ElasticNet, Lasso, LinearRegression, Ridge
+from model_bundle import load_bundle
+from model_registry import ModelRegistry
+from serving_metrics import ServingMetrics
+from prediction_cache import PredictionCache, parse_resolutions
+from rolling_features import RollingFeatures
+from tree_engine import select_engine
 # --- Configuration ---
 MODEL_DIR = "models"
 MODEL_PATH = os.path.join(MODEL_DIR, "final_model.joblib")
 SCALER_PATH = os.path.join(MODEL_DIR, "scaler.joblib")
+# Served instead of MODEL_PATH/SCALER_PATH when present (see model_bundle.py)
+MODEL_BUNDLE_PATH = os.path.join(MODEL_DIR, "final_model.bundle.joblib")
+# Recompute bundle content hashes on load (reads the whole file)
+MODEL_BUNDLE_VERIFY = os.environ.get("MODEL_BUNDLE_VERIFY", "0") == "1"
+# Uncompressed serving artifact to memory-map instead of unpickling MODEL_PATH
+# (written by serve.py so that worker processes share one copy of the arrays)
+MODEL_MMAP_PATH = os.environ.get("MODEL_MMAP_PATH")
 
 # Define the expected feature columns in the correct order (excluding 'co2')
 EXPECTED_FEATURES = [
@@ -21,27 +40,437 @@ EXPECTED_FEATURES = [
     "Tvoc",
     "no2_raw"
 ]
+# Names other producers use for the same features (Recording documents store "TVOC")
+FEATURE_ALIASES = {"TVOC": "Tvoc"}
+
+# Upper bound on rows accepted by a single batch request
+MAX_BATCH_SIZE = 10000
+# Rows scored together by /predict/stream (results are streamed back per batch)
+STREAM_BATCH_SIZE = min(int(os.environ.get("STREAM_BATCH_SIZE", "500")), MAX_BATCH_SIZE)
+
+# Serve single rows without pandas (set FAST_PATH=0 to use the DataFrame path)
+FAST_PATH_ENABLED = os.environ.get("FAST_PATH", "1") != "0"
+
+# Tree ensemble engine: "sklearn", "compiled" (node arrays only) or "auto"
+# (node arrays for batches up to TREE_ENGINE_MAX_ROWS rows; the estimator for
+# larger batches is reloaded from its file the first time one arrives)
+TREE_ENGINE = os.environ.get("TREE_ENGINE", "auto")
+TREE_ENGINE_MAX_ROWS = int(os.environ.get("TREE_ENGINE_MAX_ROWS", "128"))
+
+# Prediction cache: entries (0 disables), time-to-live in seconds, per-feature
+# rounding as "feature=step,..." (unlisted features match exactly), and
+# whether the device uuid in the payload is part of the key
+PREDICTION_CACHE_SIZE = int(os.environ.get("PREDICTION_CACHE_SIZE", "10000"))
+PREDICTION_CACHE_TTL = float(os.environ.get("PREDICTION_CACHE_TTL", "30"))
+PREDICTION_CACHE_RESOLUTIONS = os.environ.get("PREDICTION_CACHE_RESOLUTIONS", "")
+PREDICTION_CACHE_PER_DEVICE = os.environ.get("PREDICTION_CACHE_PER_DEVICE", "0") == "1"
+
+# Name under which final_model.joblib/scaler.joblib are served
+DEFAULT_MODEL_NAME = "final"
+# Bounds on the registry's loaded models (least recently used are unloaded)
+MODEL_REGISTRY_MAX_MB = int(os.environ.get("MODEL_REGISTRY_MAX_MB", "2048"))
+MODEL_REGISTRY_MAX_MODELS = int(os.environ.get("MODEL_REGISTRY_MAX_MODELS", "8"))
+
+# Per-device history kept for models trained with rolling features: devices
+# tracked at most, and seconds without a reading before a device is dropped
+ROLLING_MAX_DEVICES = int(os.environ.get("ROLLING_MAX_DEVICES", "10000"))
+ROLLING_IDLE_SECONDS = float(os.environ.get("ROLLING_IDLE_SECONDS", "3600"))
+
+# Seconds between checks of the model files for changes (0 disables the watcher)
+MODEL_WATCH_INTERVAL = float(os.environ.get("MODEL_WATCH_INTERVAL", "10"))
+# Rows predicted on a newly loaded model before it starts serving
+WARMUP_ROWS = 16
+# Shared secret for /admin endpoints (unset allows any caller)
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+# Per-stage latency histograms and counters on /metrics (METRICS=0 disables)
+METRICS_ENABLED = os.environ.get("METRICS", "1") != "0"
 
 # --- Initialize Flask App ---
 app = Flask(__name__)
 CORS(app)
+metrics = ServingMetrics(enabled=METRICS_ENABLED)
+# --- Pandas-free Single-Row Path ---
+def parse_features(input_data, values, features=EXPECTED_FEATURES):
+    """
+    Reads the features of one JSON record into the 1D array values, in
+    features order, with the same acceptance rules and error messages as
+    pd.to_numeric.
+    """
+    for i, feature in enumerate(features):
+        value = input_data[feature]
+        kind = type(value)
+        if kind is float or kind is int or kind is bool:
+            values[i] = value
+        elif value is None:
+            values[i] = np.nan
+        elif kind is str:
+            try:
+                if "_" in value:
+                    raise ValueError
+                values[i] = float(value)
+            except ValueError:
+                raise ValueError(
+                    f'Unable to parse string "{value}" at position 0'
+                ) from None
+        else:
+            raise TypeError("Invalid object type at position 0")
+    return values
+
+
+class FastPath:
+    """
+    Single-row inference that skips pandas and sklearn input validation.
+    The scaler is folded into precomputed mean/scale arrays, and linear
+    winners are evaluated directly from their coefficients. Arithmetic
+    follows StandardScaler.transform and LinearModel.predict step for step,
+    so predictions are identical to the DataFrame path.
+    """
+
+    LINEAR_MODELS = (LinearRegression, Ridge, Lasso, ElasticNet)
+
+    def __init__(self, model, scaler, features=EXPECTED_FEATURES):
+        self.features = features
+        n_features = len(features)
+        if getattr(scaler, "n_features_in_", n_features) != n_features:
+            raise ValueError(
+                f"Scaler expects {scaler.n_features_in_} features, "
+                f"server is configured for {n_features}"
+            )
+        mean = getattr(scaler, "mean_", None)
+        scale = getattr(scaler, "scale_", None)
+        self.mean = (
+            np.zeros(n_features) if mean is None else np.asarray(mean, dtype=np.float64)
+        )
+        self.scale = (
+            np.ones(n_features) if scale is None else np.asarray(scale, dtype=np.float64)
+        )
+        self.model = model
+        self.coef = None
+        self.intercept = None
+        if isinstance(model, self.LINEAR_MODELS) and np.ndim(model.coef_) == 1:
+            self.coef = np.asarray(model.coef_, dtype=np.float64)
+            self.intercept = model.intercept_
+        self._local = threading.local()
+
+    def parse(self, input_data):
+        """Reads the features into this thread's preallocated row"""
+        row = getattr(self._local, "row", None)
+        if row is None:
+            row = self._local.row = np.empty((1, len(self.features)))
+        parse_features(input_data, row[0], self.features)
+        return row
+
+    def transform(self, row):
+        """Standard scaling, with the same infinity check as the scaler"""
+        if np.isinf(row).any():
+            raise ValueError(
+                "Input X contains infinity or a value too large for dtype('float64')."
+            )
+        scaled = row - self.mean
+        scaled /= self.scale
+        return scaled
+
+    def predict(self, scaled):
+        """Returns the prediction for one scaled row"""
+        if self.coef is None:
+            return self.model.predict(scaled)[0]
+        if np.isnan(scaled).any():
+            raise ValueError("Input X contains NaN.")
+        return (scaled @ self.coef + self.intercept)[0]
+
+
+def _build_fast_path(model, scaler, features=EXPECTED_FEATURES):
+    """Returns a FastPath for the loaded pair, or None to use the DataFrame path"""
+    if not FAST_PATH_ENABLED or model is None or scaler is None:
+        return None
+    try:
+        return FastPath(model, scaler, features)
+    except Exception as e:
+        print(f"Fast path disabled: {e}")
+        return None
+
+
+# --- Model State and Hot Reload ---
+class ServingState:
+    """
+    Snapshot of the model/scaler pair being served. Handlers read the
+    module-level `state` once per request, so a reload that swaps it never
+    changes the model under a request that is already running.
+    """
+
+    def __init__(
+        self,
+        model=None,
+        scaler=None,
+        version=None,
+        loaded_at=None,
+        features=EXPECTED_FEATURES,
+        rolling=None,
+    ):
+        self.model = model
+        self.scaler = scaler
+        self.version = version
+        self.loaded_at = loaded_at
+        self.features = features
+        # Output names of a multi-target model (multi_target.py), else None
+        self.targets = getattr(model, "targets", None)
+        # Device history for models trained with rolling features (starts empty on every load)
+        self.rolling = None
+        if rolling is not None:
+            self.rolling = RollingFeatures(
+                rolling["columns"],
+                window=rolling["window"],
+                max_devices=ROLLING_MAX_DEVICES,
+                idle_seconds=ROLLING_IDLE_SECONDS,
+            )
+        self.fast_path = _build_fast_path(model, scaler, features)
+
+
+def label_prediction(value, targets):
+    """One row's prediction as JSON: a number, or {target: number} for multi-target models"""
+    if targets is None:
+        return float(value)
+    return dict(zip(targets, np.ravel(value).tolist()))
+
+
+def _artifact_version(*paths):
+    """Short content hash identifying a set of artifacts"""
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+def _check_feature_count(model, scaler, features):
+    """Rejects a model/scaler pair that does not take the given features"""
+    n_features = len(features)
+    for name, obj in (("Scaler", scaler), ("Model", model)):
+        count = getattr(obj, "n_features_in_", n_features)
+        if count != n_features:
+            raise ValueError(
+                f"{name} expects {count} features, server is configured for {n_features}"
+            )
+
+
+def _warm_up(new_state):
+    """Runs a few predictions through every path so first requests are not cold"""
+    rng = np.random.default_rng(0)
+    center = getattr(new_state.scaler, "mean_", None)
+    rows = (0.0 if center is None else center) + rng.standard_normal(
+        (WARMUP_ROWS, len(new_state.features))
+    )
+    frame = pd.DataFrame(rows, columns=new_state.features)
+    batch_prediction = new_state.model.predict(new_state.scaler.transform(frame))
+    if new_state.fast_path is not None:
+        new_state.fast_path.predict(new_state.fast_path.transform(rows[:1]))
+    if not np.all(np.isfinite(batch_prediction)):
+        raise ValueError("Warmup predictions are not finite")
+
+
+def _load_bundle_state(bundle_path):
+    """Serving state from a model bundle; its features and hash come with it"""
+    started = time.perf_counter()
+    bundle = load_bundle(bundle_path, verify=MODEL_BUNDLE_VERIFY)
+    print(f"Model bundle {bundle.name} memory-mapped from {bundle_path}")
+    new_state = ServingState(
+        bundle.serving_model(TREE_ENGINE, TREE_ENGINE_MAX_ROWS),
+        bundle.scaler,
+        version=bundle.content_hash[:12],
+        loaded_at=time.time(),
+        features=bundle.features,
+        rolling=bundle.rolling,
+    )
+    _warm_up(new_state)
+    metrics.observe_model_load(os.path.basename(bundle_path), time.perf_counter() - started)
+    return new_state
+
+
+def _reloader(model_path):
+    """Loads model_path again later, refusing a file replaced since this load"""
+    loaded_mtime = os.path.getmtime(model_path)
+
+    def load():
+        if os.path.getmtime(model_path) != loaded_mtime:
+            raise ValueError(f"{model_path} changed since it was loaded; retry after the reload")
+        return joblib.load(model_path)
+
+    return load
+
+
+def load_state(
+    model_path=MODEL_PATH,
+    scaler_path=SCALER_PATH,
+    mmap_path=None,
+    features=EXPECTED_FEATURES,
+    bundle_path=None,
+):
+    """
+    Loads, checks and warms up a model/scaler pair, or a model bundle.
+    features=None takes the feature order the scaler was fitted with.
+    Raises if the pair cannot be served; the caller keeps the old state.
+    """
+    if bundle_path:
+        return _load_bundle_state(bundle_path)
+    started = time.perf_counter()
+    if mmap_path:
+        model = joblib.load(mmap_path, mmap_mode="r")
+        print(f"Model memory-mapped from {mmap_path}")
+    else:
+        model = joblib.load(model_path)
+        print(f"Model loaded from {model_path}")
+    scaler = joblib.load(scaler_path)
+    print(f"Scaler loaded from {scaler_path}")
+    if features is None:
+        if not hasattr(scaler, "feature_names_in_"):
+            raise ValueError(f"No feature schema found for {model_path}")
+        features = [str(name) for name in scaler.feature_names_in_]
+    _check_feature_count(model, scaler, features)
+
+    # Swap tree ensembles for their array-backed form (checked against model.predict)
+    try:
+        model = select_engine(
+            model,
+            TREE_ENGINE,
+            max_rows=TREE_ENGINE_MAX_ROWS,
+            load=None if mmap_path else _reloader(model_path),
+        )
+    except Exception as e:
+        print(f"Tree engine unavailable, serving the original model: {e}")
+
+    new_state = ServingState(
+        model,
+        scaler,
+        # Always the source model, so every load mode reports the same version
+        version=_artifact_version(model_path, scaler_path),
+        loaded_at=time.time(),
+        features=features,
+    )
+    _warm_up(new_state)
+    metrics.observe_model_load(
+        os.path.basename(mmap_path or model_path), time.perf_counter() - started
+    )
+    return new_state
+
+
+_reload_lock = threading.Lock()
+
+
+def reload_model(reason="manual"):
+    """
+    Loads the artifacts from disk and atomically swaps them in.
+    Returns the new state; on failure the current state keeps serving.
+    """
+    global state
+    with _reload_lock:
+        bundle_path = _default_bundle()
+        mmap_path = None
+        if MODEL_MMAP_PATH and not bundle_path:
+            # Every worker reloads from the shared artifact; the first rebuilds it
+            from serve import prepare_mmap_artifact
+
+            mmap_path = prepare_mmap_artifact(MODEL_PATH, os.path.dirname(MODEL_MMAP_PATH))
+        new_state = load_state(
+            MODEL_PATH, SCALER_PATH, mmap_path=mmap_path, bundle_path=bundle_path
+        )
+        previous_version = state.version
+        state = new_state
+    print(f"Model reloaded ({reason}): {previous_version} -> {new_state.version}")
+    return new_state
+
+
+class ModelWatcher(threading.Thread):
+    """
+    Polls the model and scaler files and reloads once a change has settled,
+    i.e. the files look the same on two consecutive polls. This avoids
+    picking up a new model next to a scaler that is still being written.
+    """
+
+    def __init__(self, paths, interval):
+        super().__init__(name="model-watcher", daemon=True)
+        self.paths = paths
+        self.interval = interval
+
+    def _signature(self):
+        try:
+            return tuple(
+                (os.stat(path).st_mtime_ns, os.stat(path).st_size) for path in self.paths
+            )
+        except OSError:
+            return None
+
+    def run(self):
+        last = self._signature()
+        pending = None
+        while True:
+            time.sleep(self.interval)
+            signature = self._signature()
+            if signature is None or signature == last:
+                pending = None
+                continue
+            if signature != pending:
+                pending = signature
+                continue
+            try:
+                reload_model("file change")
+            except Exception as e:
+                print(f"Reload failed, still serving version {state.version}: {e}")
+            last = signature
+            pending = None
+
+
+def _default_bundle():
+    return MODEL_BUNDLE_PATH if os.path.exists(MODEL_BUNDLE_PATH) else None
+
+
+def _start_model_watcher():
+    if MODEL_WATCH_INTERVAL > 0:
+        paths = [MODEL_BUNDLE_PATH] if _default_bundle() else [MODEL_PATH, SCALER_PATH]
+        ModelWatcher(paths, MODEL_WATCH_INTERVAL).start()
+
+
 # --- Load Model and Scaler ---
 try:
-    model = joblib.load(MODEL_PATH)
-    scaler = joblib.load(SCALER_PATH)
-    print(f"Model loaded from {MODEL_PATH}")
-    print(f"Scaler loaded from {SCALER_PATH}")
+    state = load_state(mmap_path=MODEL_MMAP_PATH, bundle_path=_default_bundle())
 except FileNotFoundError as e:
     print(f"Error loading model or scaler: {e}")
     print(
         "Ensure 'final_model.joblib' and 'scaler.joblib' are in the 'models' directory."
     )
-    model = None
-    scaler = None
+    state = ServingState()
 except Exception as e:
     print(f"An unexpected error occurred during loading: {e}")
-    model = None
-    scaler = None
+    state = ServingState()
+
+_start_model_watcher()
+# Threads do not survive fork, so preforked workers start their own watcher
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_start_model_watcher)
+
+# --- Model Registry ---
+# Further models found in MODEL_DIR, loaded on first use (see model_registry.py)
+registry = ModelRegistry(
+    MODEL_DIR,
+    lambda spec: load_state(
+        spec.model_path, spec.scaler_path, features=spec.features, bundle_path=spec.bundle_path
+    ),
+    max_bytes=MODEL_REGISTRY_MAX_MB * 1024 * 1024,
+    max_models=MODEL_REGISTRY_MAX_MODELS,
+)
+
+# --- Prediction Cache ---
+prediction_cache = None
+# A bundle brings its own feature order; the cache keys rows in this one
+prediction_cache_features = state.features
+if PREDICTION_CACHE_SIZE > 0:
+    prediction_cache = PredictionCache(
+        parse_resolutions(PREDICTION_CACHE_RESOLUTIONS, prediction_cache_features),
+        max_entries=PREDICTION_CACHE_SIZE,
+        ttl=PREDICTION_CACHE_TTL,
+        per_device=PREDICTION_CACHE_PER_DEVICE,
+    )
 
 # --- Define Prediction Endpoint ---
 @app.route("/predict", methods=["POST"])
@@ -50,23 +479,47 @@ def predict():
     Receives input features as JSON, preprocesses them,
     makes a prediction using the loaded model, and returns the prediction.
     """
-    if model is None or scaler is None:
+    return _predict_with(state, use_cache=True)
+
+
+def _predict_with(current, use_cache=False):
+    """Single-row prediction against one serving state"""
+    timer = metrics.timer(request.endpoint)
+    try:
+        return _predict_timed(current, use_cache, timer)
+    finally:
+        timer.finish()
+
+
+def _predict_timed(current, use_cache, timer):
+    if current.model is None or current.scaler is None:
+        timer.error("model_not_loaded")
         return jsonify({"error": "Model or scaler not loaded"}), 500
 
     # Get JSON data from the request
     try:
         input_data = request.get_json()
         if not input_data:
+            timer.error("empty_input")
             return jsonify({"error": "No input data received"}), 400
     except Exception as e:
+        timer.error("invalid_json")
         return jsonify({"error": f"Failed to parse JSON: {str(e)}"}), 400
+    timer.mark("parse_json")
+
+    # --- Rolling-Window Features (from this device's previous readings) ---
+    # Read-only: polling or retrying a reading must not add it to the history
+    if current.rolling is not None and isinstance(input_data, dict):
+        input_data = current.rolling.augment(input_data, ingest=False)
+        timer.mark("rolling_features")
 
     # --- Data Validation and Preparation ---
     # Check if all expected features are present
     missing_features = [
-        feature for feature in EXPECTED_FEATURES if feature not in input_data
+        feature for feature in current.features if feature not in input_data
     ]
     if missing_features:
+        timer.error("missing_features")
         return (
             jsonify(
                 {
@@ -79,11 +532,15 @@ def predict():
 
     # Ensure data types are numeric (basic check)
     try:
-        # Create a DataFrame with the correct column order
-        input_df = pd.DataFrame([input_data])[EXPECTED_FEATURES]
-        # Convert to numeric, errors will raise exception
-        input_df = input_df.apply(pd.to_numeric)
+        if current.fast_path is not None:
+            input_df = current.fast_path.parse(input_data)
+        else:
+            # Create a DataFrame with the correct column order
+            input_df = pd.DataFrame([input_data])[current.features]
+            # Convert to numeric, errors will raise exception
+            input_df = input_df.apply(pd.to_numeric)
     except (ValueError, TypeError) as e:
+        timer.error("invalid_type")
         return (
             jsonify(
                 {
@@ -93,13 +550,37 @@ def predict():
             ),
             400,
         )
+    timer.mark("build_input")
+
+    # --- Cache Lookup ---
+    cache_key = None
+    if (
+        use_cache
+        and prediction_cache is not None
+        and current.features == prediction_cache_features
+    ):
+        prediction_cache.bind(current.model, current.scaler)
+        row = input_df if current.fast_path is not None else input_df.to_numpy(dtype=np.float64)
+        cache_key = prediction_cache.key(row, input_data.get("uuid"))
+        cached_prediction = prediction_cache.get(cache_key)
+        timer.mark("cache_lookup")
+        if cached_prediction is not None:
+            response = jsonify(
+                {"prediction": cached_prediction, "model_version": current.version}
+            )
+            timer.mark("serialize")
+            return response
 
     # --- Preprocessing ---
     try:
         # Scale the input data using the loaded scaler
-        input_scaled = scaler.transform(input_df)
+        if current.fast_path is not None:
+            input_scaled = current.fast_path.transform(input_df)
+        else:
+            input_scaled = current.scaler.transform(input_df)
     except Exception as e:
         print(f"Error during scaling: {e}")
+        timer.error("scale_error")
         return (
             jsonify(
                 {
@@ -109,13 +590,19 @@ def predict():
             ),
             500,
         )
+    timer.mark("scale")
 
     # --- Prediction ---
     try:
-        prediction = model.predict(input_scaled)
-        output_prediction = prediction[0]
+        if current.fast_path is not None:
+            output_prediction = current.fast_path.predict(input_scaled)
+        else:
+            prediction = current.model.predict(input_scaled)
+            output_prediction = prediction[0]
+        output_prediction = label_prediction(output_prediction, current.targets)
     except Exception as e:
         print(f"Error during prediction: {e}")
+        timer.error("predict_error")
         return (
             jsonify(
                 {"error": "Failed to make prediction", "details": str(e)}
@@ -123,12 +610,546 @@ def predict():
             500,
         )
 
+    timer.mark("predict")
+
+    if cache_key is not None:
+        prediction_cache.put(cache_key, output_prediction, current.model, current.scaler)
+
     # --- Return Prediction ---
-    return jsonify({"prediction": output_prediction})
+    response = jsonify({"prediction": output_prediction, "model_version": current.version})
+    timer.mark("serialize")
+    return response
+
+
+# --- Multi-Model Endpoints ---
+def _registry_state(name):
+    """Resolves a model name or target to its serving state, or an error response"""
+    if name == DEFAULT_MODEL_NAME:
+        return state, None
+    try:
+        return registry.get(name), None
+    except KeyError:
+        return None, (
+            jsonify(
+                {
+                    "error": f"Unknown model: {name}",
+                    "available": [DEFAULT_MODEL_NAME] + registry.names(),
+                }
+            ),
+            404,
+        )
+    except Exception as e:
+        print(f"Error loading model {name}: {e}")
+        return None, (
+            jsonify({"error": f"Failed to load model {name}", "details": str(e)}),
+            500,
+        )
+
+
+@app.route("/predict/<name>", methods=["POST"])
+def predict_named(name):
+    """Single-row prediction routed to a registry model by name or target"""
+    current, error = _registry_state(name)
+    if error is not None:
+        return error
+    return _predict_with(current, use_cache=current is state)
+
+
+@app.route("/predict/<name>/batch", methods=["POST"])
+def predict_named_batch(name):
+    """Batch prediction routed to a registry model by name or target"""
+    current, error = _registry_state(name)
+    if error is not None:
+        return error
+    return _predict_batch_with(current)
+
+
+@app.route("/models", methods=["GET"])
+def list_models():
+    """Lists every servable model and whether it is loaded"""
+    current = state
+    default = {
+        "name": DEFAULT_MODEL_NAME,
+        "target": "co2",
+        "loaded": current.model is not None,
+        "model_version": current.version,
+        "features": current.features,
+    }
+    return jsonify({"models": [default] + registry.describe(), **registry.stats()})
+
+
+# --- Admin Endpoints ---
+def _admin_authorized():
+    return ADMIN_TOKEN is None or request.headers.get("X-Admin-Token") == ADMIN_TOKEN
+
+
+@app.route("/admin/reload", methods=["POST"])
+def admin_reload():
+    """Reloads the model and scaler from disk and reports the active version"""
+    if not _admin_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    try:
+        new_state = reload_model("admin request")
+    except Exception as e:
+        print(f"Reload failed, still serving version {state.version}: {e}")
+        return (
+            jsonify(
+                {
+                    "error": "Failed to reload model",
+                    "details": str(e),
+                    "model_version": state.version,
+                }
+            ),
+            500,
+        )
+    return jsonify({"status": "reloaded", "model_version": new_state.version})
+
+
+@app.route("/admin/model", methods=["GET"])
+def admin_model():
+    """Describes the model currently being served"""
+    current = state
+    return jsonify(
+        {
+            "model_version": current.version,
+            "model_type": type(current.model).__name__,
+            "loaded_at": current.loaded_at,
+            "fast_path": current.fast_path is not None,
+            "features": current.features,
+            "rolling": (
+                dict(current.rolling.config(), **current.rolling.stats())
+                if current.rolling is not None
+                else None
+            ),
+        }
+    )
+
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """Serves request metrics in the Prometheus text format"""
+    gauges = []
+    if prediction_cache is not None:
+        stats = prediction_cache.stats()
+        for key in ("hits", "misses", "evictions", "size"):
+            gauges.append(
+                (f"prediction_cache_{key}", f"Prediction cache {key}.", {}, stats[key])
+            )
+    current = state
+    gauges.append(
+        (
+            "model_info",
+            "Model currently served under the default name.",
+            {"version": current.version or "", "type": type(current.model).__name__},
+            1,
+        )
+    )
+    return Response(
+        metrics.render(gauges), mimetype="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@app.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    """Reports prediction cache hit/miss counters"""
+    if prediction_cache is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **prediction_cache.stats()})
+
+# --- Define Batch Prediction Endpoint ---
+def _input_features(current):
+    """
+    The features a request must carry: the model's, with rolling features
+    replaced by the raw columns they are computed from.
+    """
+    if current.rolling is None:
+        return current.features
+    derived = set(current.rolling.feature_names)
+    required = [feature for feature in current.features if feature not in derived]
+    return required + [column for column in current.rolling.columns if column not in required]
+
+
+def _batch_records(payload):
+    """A batch payload as a list of records (columnar payloads are transposed)"""
+    if isinstance(payload, dict) and "records" in payload:
+        payload = payload["records"]
+    if isinstance(payload, dict):
+        if not all(isinstance(values, list) for values in payload.values()):
+            raise ValueError("Columnar payloads must map every feature to a list")
+        if len({len(values) for values in payload.values()}) > 1:
+            raise ValueError("All feature columns must have the same length")
+        payload = [dict(zip(payload, values)) for values in zip(*payload.values())]
+    return payload
+
+
+def _with_rolling_features(current, records, input_df, missing_per_row):
+    """
+    Adds rolling-window features to the records of a batch already framed
+    on _input_features (input_df, missing_per_row), in order, for models
+    trained with them. Only rows that pass validation are ingested (added
+    to their device's history); the others only read it. Returns the batch
+    framed on the model's features.
+    """
+    if current.rolling is None:
+        return input_df, missing_per_row
+    _, _, invalid_mask = _coerce_frame(input_df)
+    accepted = [
+        not missing and not invalid
+        for missing, invalid in zip(missing_per_row, invalid_mask.any(axis=1))
+    ]
+    records = [
+        current.rolling.augment(record, ingest=ingest)
+        for record, ingest in zip(records, accepted)
+    ]
+    return _batch_frame(records, current.features)
+
+
+def _batch_frame(payload, features=EXPECTED_FEATURES):
+    """
+    Turns a batch payload into a DataFrame holding the features in order,
+    plus a per-row list of missing features (records only).
+    Accepts a list of records, {"records": [...]}, or columnar {feature: [values...]}.
+    """
+    if isinstance(payload, dict) and "records" in payload:
+        payload = payload["records"]
+
+    if isinstance(payload, list):
+        if not all(isinstance(record, dict) for record in payload):
+            raise ValueError("Every record must be a JSON object")
+        missing_per_row = [
+            [feature for feature in features if feature not in record]
+            for record in payload
+        ]
+        frame = pd.DataFrame.from_records(payload, columns=features)
+        return frame, missing_per_row
+
+    if isinstance(payload, dict):
+        # Columnar payload: feature presence is checked once for the whole batch
+        missing_features = [
+            feature for feature in features if feature not in payload
+        ]
+        if missing_features:
+            raise KeyError(missing_features)
+        columns = {feature: payload[feature] for feature in features}
+        if not all(isinstance(values, list) for values in columns.values()):
+            raise ValueError("Columnar payloads must map every feature to a list")
+        if len({len(values) for values in columns.values()}) > 1:
+            raise ValueError("All feature columns must have the same length")
+        frame = pd.DataFrame(columns, columns=features)
+        return frame, [[] for _ in range(len(frame))]
+
+    raise ValueError("Expected a list of records or a mapping of feature columns")
+
+
+@app.route("/predict/batch", methods=["POST"])
+def predict_batch():
+    """
+    Receives many rows as JSON (records or columns), validates them,
+    scales and predicts all valid rows with a single model call, and returns
+    predictions in input order together with per-row errors.
+    """
+    return _predict_batch_with(state)
+
+
+def _predict_batch_with(current):
+    """Batch prediction against one serving state"""
+    timer = metrics.timer(request.endpoint)
+    try:
+        return _predict_batch_timed(current, timer)
+    finally:
+        timer.finish()
+
+
+def _predict_batch_timed(current, timer):
+    if current.model is None or current.scaler is None:
+        timer.error("model_not_loaded")
+        return jsonify({"error": "Model or scaler not loaded"}), 500
+
+    # Get JSON data from the request
+    try:
+        payload = request.get_json()
+        if not payload:
+            timer.error("empty_input")
+            return jsonify({"error": "No input data received"}), 400
+    except Exception as e:
+        timer.error("invalid_json")
+        return jsonify({"error": f"Failed to parse JSON: {str(e)}"}), 400
+    timer.mark("parse_json")
+
+    # --- Data Validation and Preparation ---
+    # Nothing is added to rolling history until the batch is accepted
+    try:
+        if current.rolling is not None:
+            payload = _batch_records(payload)
+        input_df, missing_per_row = _batch_frame(payload, _input_features(current))
+    except KeyError as e:
+        timer.error("missing_features")
+        return (
+            jsonify(
+                {
+                    "error": "Missing required features",
+                    "missing": e.args[0],
+                }
+            ),
+            400,
+        )
+    except (ValueError, TypeError) as e:
+        timer.error("invalid_payload")
+        return jsonify({"error": "Invalid batch payload", "details": str(e)}), 400
+
+    metrics.observe_batch_size(request.endpoint, len(input_df))
+    if len(input_df) > MAX_BATCH_SIZE:
+        timer.error("batch_too_large")
+        return (
+            jsonify(
+                {
+                    "error": f"Batch too large, at most {MAX_BATCH_SIZE} rows are accepted",
+                }
+            ),
+            413,
+        )
+    input_df, missing_per_row = _with_rolling_features(current, payload, input_df, missing_per_row)
+
+    predictions, errors, failure = _score_batch(current, input_df, missing_per_row, timer)
+    if failure is not None:
+        error_type, error_body = failure
+        timer.error(error_type)
+        return jsonify(error_body), 500
+
+    # --- Return Predictions ---
+    response = jsonify(
+        {
+            "predictions": predictions,
+            "errors": errors,
+            "count": len(predictions),
+            "model_version": current.version,
+        }
+    )
+    timer.mark("serialize")
+    return response
+
+
+def _coerce_frame(input_df):
+    """
+    Coerces a batch frame to numbers at once. Returns (numeric frame, null
+    mask, invalid mask): values that fail to parse or are infinite are
+    invalid; nulls become NaN and are not.
+    """
+    numeric_df = input_df.apply(pd.to_numeric, errors="coerce")
+    values = numeric_df.to_numpy(dtype=np.float64)
+    null_mask = input_df.isna().to_numpy()
+    return numeric_df, null_mask, ~np.isfinite(values) & ~null_mask
+
+
+def _score_batch(current, input_df, missing_per_row, timer):
+    """
+    Validates a batch frame (see _batch_frame), then scales and predicts all
+    valid rows with one call each. Null features are passed on as NaN, as
+    /predict does; if the model rejects them, only the rows holding them
+    fail. Returns (predictions, errors, failure): predictions in row order
+    (None for invalid rows), per-row errors, and (error type, error body)
+    if scaling or the model call failed.
+    """
+    numeric_df, null_mask, invalid_mask = _coerce_frame(input_df)
+
+    errors = []
+    valid_rows = np.ones(len(input_df), dtype=bool)
+    for i, missing in enumerate(missing_per_row):
+        if missing:
+            errors.append(
+                {"index": i, "error": "Missing required features", "missing": missing}
+            )
+            valid_rows[i] = False
+    for i in np.flatnonzero(invalid_mask.any(axis=1) & valid_rows):
+        bad = [current.features[j] for j in np.flatnonzero(invalid_mask[i])]
+        errors.append(
+            {
+                "index": int(i),
+                "error": "Invalid data type for one or more features. All features must be numeric.",
+                "invalid": bad,
+            }
+        )
+        valid_rows[i] = False
+    errors.sort(key=lambda error: error["index"])
+    timer.mark("build_input")
+
+    predictions = [None] * len(input_df)
+    if valid_rows.any():
+        # --- Preprocessing and Prediction (one vectorized call each) ---
+        try:
+            input_scaled = current.scaler.transform(numeric_df[valid_rows])
+        except Exception as e:
+            print(f"Error during scaling: {e}")
+            return predictions, errors, (
+                "scale_error",
+                {
+                    "error": "Failed to scale input data. Check feature count and types.",
+                    "details": str(e),
+                },
+            )
+        timer.mark("scale")
+        rows = np.flatnonzero(valid_rows)
+        try:
+            try:
+                batch_prediction = current.model.predict(input_scaled)
+            except Exception as e:
+                with_nulls = null_mask[rows].any(axis=1)
+                if not with_nulls.any():
+                    raise
+                # The model does not take NaN: fail those rows, score the rest
+                errors.extend(
+                    {"index": int(i), "error": "Failed to make prediction", "details": str(e)}
+                    for i in rows[with_nulls]
+                )
+                errors.sort(key=lambda error: error["index"])
+                rows = rows[~with_nulls]
+                batch_prediction = (
+                    current.model.predict(np.asarray(input_scaled)[~with_nulls])
+                    if len(rows) else np.empty(0)
+                )
+        except Exception as e:
+            print(f"Error during prediction: {e}")
+            return predictions, errors, (
+                "predict_error",
+                {"error": "Failed to make prediction", "details": str(e)},
+            )
+        timer.mark("predict")
+        for i, value in zip(rows, batch_prediction.tolist()):
+            predictions[i] = value if current.targets is None else label_prediction(value, current.targets)
+
+    return predictions, errors, None
+
+
+# --- Streaming Endpoint ---
+def _stream_records(lines, csv_body):
+    """
+    Yields one item per input row: a record dict with FEATURE_ALIASES
+    applied, or an error message for a row that does not parse.
+    """
+    if csv_body:
+        reader = csv.reader(lines)
+        header = [name.strip() for name in next(reader, [])]
+        rows = (
+            dict(zip(header, row)) if len(row) == len(header)
+            else f"Expected {len(header)} CSV fields, got {len(row)}"
+            for row in reader
+            if row
+        )
+    else:
+        rows = (_parse_json_line(line) for line in lines if line.strip())
+    for record in rows:
+        if isinstance(record, dict):
+            for alias, feature in FEATURE_ALIASES.items():
+                if alias in record and feature not in record:
+                    record[feature] = record.pop(alias)
+        yield record
+
+
+def _batches(items, size):
+    """Groups an iterable into lists of up to size items as they arrive"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _parse_json_line(line):
+    try:
+        record = json.loads(line)
+    except ValueError as e:
+        return f"Invalid JSON: {e}"
+    return record if isinstance(record, dict) else "Every record must be a JSON object"
+
+
+def _score_stream_batch(current, batch, start, timer):
+    """Scores one batch of _stream_records items; indices count from the start of the stream"""
+    rows = [i for i, record in enumerate(batch) if isinstance(record, dict)]
+    errors = [
+        {"index": start + i, "error": record}
+        for i, record in enumerate(batch)
+        if not isinstance(record, dict)
+    ]
+    predictions = [None] * len(batch)
+    timer.mark("parse_stream")
+    if rows:
+        records = [batch[i] for i in rows]
+        input_df, missing_per_row = _batch_frame(records, _input_features(current))
+        input_df, missing_per_row = _with_rolling_features(current, records, input_df, missing_per_row)
+        scored, row_errors, failure = _score_batch(current, input_df, missing_per_row, timer)
+        if failure is not None:
+            return None, failure
+        for i, value in zip(rows, scored):
+            predictions[i] = value
+        errors += [dict(error, index=start + rows[error["index"]]) for error in row_errors]
+        errors.sort(key=lambda error: error["index"])
+    return {"start": start, "predictions": predictions, "errors": errors}, None
+
+
+@app.route("/predict/stream", methods=["POST"])
+def predict_stream():
+    """
+    Ingest-and-predict for device gateways. The body is newline-delimited
+    JSON records or CSV with a header row (Content-Type: text/csv), read
+    incrementally. Every STREAM_BATCH_SIZE rows are validated and scored
+    together and sent back at once as one NDJSON line:
+    {"start": <index of the first row>, "predictions": [...], "errors": [...]},
+    followed by a final {"count": ..., "model_version": ...} line. Memory
+    is bounded by one batch, whatever the upload size.
+    """
+    return _predict_stream_with(state)
+
+
+@app.route("/predict/<name>/stream", methods=["POST"])
+def predict_named_stream(name):
+    """Streaming prediction routed to a registry model by name or target"""
+    current, error = _registry_state(name)
+    if error is not None:
+        return error
+    return _predict_stream_with(current)
+
+
+def _predict_stream_with(current):
+    """Streaming prediction against one serving state"""
+    endpoint = request.endpoint
+    if current.model is None or current.scaler is None:
+        timer = metrics.timer(endpoint)
+        timer.error("model_not_loaded")
+        timer.finish()
+        return jsonify({"error": "Model or scaler not loaded"}), 500
+    csv_body = request.mimetype == "text/csv"
+    lines = (line.decode("utf-8", errors="replace") for line in request.stream)
+
+    def generate():
+        timer = metrics.timer(endpoint)
+        count = 0
+        try:
+            for batch in _batches(_stream_records(lines, csv_body), STREAM_BATCH_SIZE):
+                chunk, failure = _score_stream_batch(current, batch, count, timer)
+                if failure is not None:
+                    # Headers are already sent: the error is the last line of the stream
+                    error_type, error_body = failure
+                    timer.error(error_type)
+                    yield json.dumps(dict(error_body, start=count)) + "\n"
+                    return
+                metrics.observe_batch_size(endpoint, len(batch))
+                count += len(batch)
+                line = json.dumps(chunk) + "\n"
+                timer.mark("serialize")
+                timer.flush()
+                yield line
+            yield json.dumps({"count": count, "model_version": current.version}) + "\n"
+        finally:
+            timer.finish()
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
 
 # --- Run the Flask App ---
 if __name__ == "__main__":
-    if model and scaler:
+    if state.model and state.scaler:
         app.run(host="0.0.0.0", port=5000, debug=True)
     else:
         print("Flask server not started due to loading errors.")
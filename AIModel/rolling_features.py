@@ -0,0 +1,229 @@
+# rolling_features.py
+# Short-term history features per device: rolling mean, slope and delta of
+# the gas channels over each device's last `window` readings.
+#
+# Every device has a fixed-size ring buffer plus running sums, so a reading
+# is added in constant time: the window's sum and age-weighted sum are
+# updated by the value that enters and the one that leaves, and mean and
+# least-squares slope follow from them in closed form. Devices are kept in
+# least-recently-updated order and evicted when idle or over max_devices,
+# which bounds memory however many devices report.
+#
+# Training (TournamentModelSelection) and serving (pythonserver) both run
+# readings through RollingFeatures.update, so the features match exactly.
+# Only ingested readings (training rows, /predict/batch, /predict/stream) are
+# added to a device's history; /predict reads it without changing it, so
+# polling or retrying a reading does not skew the features. A reading with
+# the same timestamp as the device's last ingested one is a duplicate and
+# gets the features it had then.
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# Raw channels that benefit from short-term history
+ROLLING_COLUMNS = ["gas_res", "Tvoc", "nh3_raw", "co_raw", "no2_raw"]
+DEFAULT_WINDOW = 10
+# Device key for readings without a uuid (e.g. a single-device CSV log)
+DEFAULT_DEVICE = ""
+
+
+class _DeviceWindow:
+    """Ring buffer of one device's last readings with running sums"""
+
+    __slots__ = (
+        "values",
+        "position",
+        "count",
+        "sum",
+        "weighted_sum",
+        "last",
+        "last_seen",
+        "last_timestamp",
+        "last_features",
+    )
+
+    def __init__(self, window, width):
+        self.values = np.zeros((window, width))
+        self.position = 0  # Next slot to overwrite
+        self.count = 0
+        self.sum = np.zeros(width)
+        # Sum of age * value, with the newest reading at age 0 and older ones at -1, -2, ...
+        self.weighted_sum = np.zeros(width)
+        self.last = None
+        self.last_seen = 0.0
+        self.last_timestamp = None
+        self.last_features = None
+
+    def _next_sums(self, reading):
+        """(count, sum, weighted_sum) once reading is added"""
+        # Every stored reading gets one step older
+        weighted_sum = self.weighted_sum - self.sum
+        if self.count == len(self.values):
+            oldest = self.values[self.position]
+            # It had just become age -window
+            return self.count, self.sum - oldest + reading, weighted_sum + len(self.values) * oldest
+        return self.count + 1, self.sum + reading, weighted_sum
+
+    def _features(self, reading, n, total, weighted_sum):
+        """(mean, slope per reading, delta from the previous reading)"""
+        mean = total / n
+        if n > 1:
+            # Least-squares slope over ages -(n-1)..0
+            sum_x = -n * (n - 1) / 2
+            sum_xx = (n - 1) * n * (2 * n - 1) / 6
+            slope = (n * weighted_sum - sum_x * total) / (n * sum_xx - sum_x**2)
+        else:
+            slope = np.zeros_like(mean)
+        delta = reading - self.last if self.last is not None else np.zeros_like(mean)
+        return mean, slope, delta
+
+    def peek(self, reading):
+        """The features reading would get as the next reading, without adding it"""
+        return self._features(reading, *self._next_sums(reading))
+
+    def push(self, reading):
+        """Adds a reading; returns its features (see peek)"""
+        self.count, self.sum, self.weighted_sum = self._next_sums(reading)
+        self.values[self.position] = reading
+        window = len(self.values)
+        self.position = (self.position + 1) % window
+        if self.position == 0:
+            # Exact sums once per lap, so rounding errors cannot accumulate
+            ages = -((window - 1 - np.arange(window)) % window)
+            self.sum = self.values.sum(axis=0)
+            self.weighted_sum = ages @ self.values
+        features = self._features(reading, self.count, self.sum, self.weighted_sum)
+        self.last = np.array(reading, dtype=np.float64)
+        return features
+
+
+class RollingFeatures:
+    """
+    Per-device rolling-window features of columns. Thread-safe; history
+    lives in this object, so every server process keeps its own (serve.py
+    runs rolling models in a single worker for that reason).
+    """
+
+    def __init__(
+        self,
+        columns=ROLLING_COLUMNS,
+        window=DEFAULT_WINDOW,
+        max_devices=10000,
+        idle_seconds=3600.0,
+    ):
+        if window < 1:
+            raise ValueError("window must be at least 1")
+        self.columns = list(columns)
+        self.window = window
+        self.max_devices = max_devices
+        self.idle_seconds = idle_seconds
+        self.feature_names = [
+            f"{column}_{stat}" for stat in ("mean", "slope", "delta") for column in self.columns
+        ]
+        self._devices = OrderedDict()  # device -> _DeviceWindow, least recently updated first
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def config(self):
+        """What a model bundle records to rebuild the same pipeline"""
+        return {"columns": self.columns, "window": self.window}
+
+    def update(self, device, reading, now=None, timestamp=None):
+        """
+        Adds one reading (values of columns, in order) and returns its
+        features. A reading with the same timestamp as the device's last one
+        is not added again and gets that reading's features.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            state = self._devices.get(device)
+            if state is None:
+                state = self._devices[device] = _DeviceWindow(self.window, len(self.columns))
+            else:
+                self._devices.move_to_end(device)
+            state.last_seen = now
+            if timestamp is None or timestamp != state.last_timestamp:
+                state.last_features = np.concatenate(state.push(reading))
+                state.last_timestamp = timestamp
+            features = state.last_features
+            self._evict(now)
+        return features
+
+    def peek(self, device, reading, timestamp=None):
+        """
+        The features reading would get from update, without adding it to
+        the device's history (a duplicate of the last reading gets its
+        features, as in update).
+        """
+        with self._lock:
+            state = self._devices.get(device)
+            if state is None:
+                state = _DeviceWindow(self.window, len(self.columns))
+            elif timestamp is not None and timestamp == state.last_timestamp:
+                return state.last_features
+            return np.concatenate(state.peek(reading))
+
+    def _evict(self, now):
+        """Drops least recently updated devices that are idle or over max_devices"""
+        while self._devices:
+            state = next(iter(self._devices.values()))
+            if len(self._devices) <= self.max_devices and now - state.last_seen <= self.idle_seconds:
+                break
+            self._devices.popitem(last=False)
+            self.evictions += 1
+
+    def augment(self, record, ingest=True, device_key="uuid", timestamp_key="timestamp"):
+        """
+        record (one JSON reading) plus its rolling features. With ingest the
+        reading is added to the device's history (update), otherwise the
+        history is only read (peek). A reading with a missing or non-numeric
+        column gets NaN features and is never added.
+        """
+        try:
+            reading = np.array([float(record[column]) for column in self.columns])
+        except (KeyError, TypeError, ValueError):
+            reading = None
+        if reading is None or not np.isfinite(reading).all():
+            features = [np.nan] * len(self.feature_names)
+        else:
+            device = str(record.get(device_key, DEFAULT_DEVICE))
+            timestamp = record.get(timestamp_key)
+            timestamp = None if timestamp is None else str(timestamp)
+            if ingest:
+                features = self.update(device, reading, timestamp=timestamp).tolist()
+            else:
+                features = self.peek(device, reading, timestamp=timestamp).tolist()
+        return dict(record, **dict(zip(self.feature_names, features)))
+
+    def add_features(self, frame, device_column="uuid", timestamp_column="timestamp"):
+        """
+        Runs the rows of frame through update in order (one device per
+        device_column value, or a single device without that column) and
+        returns frame with the feature columns appended.
+        """
+        values = frame[self.columns].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=np.float64)
+        if device_column in frame.columns:
+            devices = frame[device_column].astype(str).to_numpy()
+        else:
+            devices = [DEFAULT_DEVICE] * len(frame)
+        if timestamp_column in frame.columns:
+            timestamps = [
+                None if pd.isna(timestamp) else str(timestamp) for timestamp in frame[timestamp_column]
+            ]
+        else:
+            timestamps = [None] * len(frame)
+        features = np.full((len(frame), len(self.feature_names)), np.nan)
+        for i, (device, reading, timestamp) in enumerate(zip(devices, values, timestamps)):
+            if np.isfinite(reading).all():
+                # One clock reading for the whole file: nothing is idle during training
+                features[i] = self.update(device, reading, now=0.0, timestamp=timestamp)
+        return pd.concat(
+            [frame, pd.DataFrame(features, index=frame.index, columns=self.feature_names)], axis=1
+        )
+
+    def stats(self):
+        with self._lock:
+            return {"devices": len(self._devices), "evictions": self.evictions}
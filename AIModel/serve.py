@@ -0,0 +1,133 @@
+# serve.py
+# Production launcher for pythonserver.py with N worker processes.
+#
+# Two ways of sharing one model between workers:
+#   preload  the master imports pythonserver (loading and compiling the model)
+#            and forks the workers, which share those pages copy-on-write.
+#   mmap     the master writes the serving model (compiled node arrays where
+#            possible) as an uncompressed joblib artifact; every worker
+#            memory-maps it, so the arrays live once in the page cache and a
+#            new worker starts without unpickling the full model.
+# Bundles trained with rolling-window features are served by one worker:
+# each process keeps its own device history, so several workers would each
+# see part of a device's readings.
+# Requires gunicorn (Linux/macOS).
+import argparse
+import fcntl
+import os
+
+import joblib
+
+MODEL_DIR = "models"
+MODEL_PATH = os.path.join(MODEL_DIR, "final_model.joblib")
+# Model bundles are memory-mappable as written (see model_bundle.py)
+MODEL_BUNDLE_PATH = os.path.join(MODEL_DIR, "final_model.bundle.joblib")
+SERVING_DIR = os.path.join(MODEL_DIR, "serving")
+
+parser = argparse.ArgumentParser(
+    description="Run the prediction server with several worker processes."
+)
+parser.add_argument("--bind", type=str, default="0.0.0.0:5000")
+parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+parser.add_argument(
+    "--threads",
+    type=int,
+    default=1,
+    help="Threads per worker (gthread worker class when > 1).",
+)
+parser.add_argument(
+    "--share",
+    choices=["preload", "mmap"],
+    default="mmap",
+    help="How workers share the model arrays.",
+)
+parser.add_argument(
+    "--timeout",
+    type=int,
+    default=30,
+    help="Seconds before an unresponsive worker is restarted.",
+)
+
+
+def prepare_mmap_artifact(model_path=MODEL_PATH, serving_dir=SERVING_DIR):
+    """
+    Writes the serving form of model_path as an uncompressed joblib file that
+    can be memory-mapped, and returns its path. The artifact is rebuilt only
+    when the source model is newer; a file lock makes workers reloading at
+    the same time rebuild it once and reuse it.
+    """
+    from tree_engine import select_engine
+
+    if not os.path.exists(serving_dir):
+        os.makedirs(serving_dir)
+    name = os.path.splitext(os.path.basename(model_path))[0]
+    artifact_path = os.path.join(serving_dir, f"{name}.mmap.joblib")
+    with open(artifact_path + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if (
+            os.path.exists(artifact_path)
+            and os.path.getmtime(artifact_path) >= os.path.getmtime(model_path)
+        ):
+            print(f"Reusing memory-mappable artifact {artifact_path}")
+            return artifact_path
+
+        model = joblib.load(model_path)
+        # sklearn trees copy their node arrays on unpickling and cannot be shared,
+        # the compiled node arrays can
+        serving_model = select_engine(model, "compiled")
+        tmp_path = artifact_path + ".tmp"
+        joblib.dump(serving_model, tmp_path, compress=0)
+        os.replace(tmp_path, artifact_path)
+    print(
+        f"Wrote memory-mappable {type(serving_model).__name__} artifact to {artifact_path}"
+    )
+    return artifact_path
+
+
+def main():
+    args = parser.parse_args()
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        print("gunicorn is required for multi-worker serving: pip install gunicorn")
+        return
+
+    if args.workers > 1 and os.path.exists(MODEL_BUNDLE_PATH):
+        from model_bundle import load_bundle
+
+        if load_bundle(MODEL_BUNDLE_PATH).rolling is not None:
+            print(
+                "The model uses rolling-window features, whose device history is kept "
+                "per process; run it with --workers 1 (more --threads are fine)."
+            )
+            return
+
+    if args.share == "mmap" and not os.path.exists(MODEL_BUNDLE_PATH):
+        # Workers read this at import time, before loading any model
+        os.environ["MODEL_MMAP_PATH"] = prepare_mmap_artifact()
+
+    class PredictionServer(BaseApplication):
+        def load_config(self):
+            options = {
+                "bind": args.bind,
+                "workers": args.workers,
+                "threads": args.threads,
+                "worker_class": "gthread" if args.threads > 1 else "sync",
+                "timeout": args.timeout,
+                "preload_app": args.share == "preload",
+            }
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            import pythonserver
+
+            if pythonserver.state.model is None or pythonserver.state.scaler is None:
+                raise SystemExit("Server not started due to loading errors.")
+            return pythonserver.app
+
+    PredictionServer().run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+# serving_metrics.py
+# Low-overhead request instrumentation for the prediction server, rendered
+# in the Prometheus text exposition format. A stage mark only appends a
+# perf_counter_ns reading to the request's own list. When the request
+# finishes, its stage durations are appended as raw integers to the
+# histograms under one lock acquisition, and bucketed in bulk with NumPy
+# every PENDING_LIMIT values or on scrape. No per-value bisect or per-mark
+# lock is left on the request path.
+import threading
+import time
+from array import array
+
+import numpy as np
+
+# Latency bucket upper bounds in seconds (10 us .. 10 s)
+LATENCY_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+# Rows per batch request
+BATCH_SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+PREFIX = "ecoverify"
+# Raw observations a histogram holds before bucketing them
+PENDING_LIMIT = 4096
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram in the Prometheus sense. Observations are
+    integers in units of scale (nanoseconds for latencies), buffered in
+    pending until fold buckets them.
+    """
+
+    __slots__ = ("bounds", "scale", "_edges", "counts", "sum", "count", "pending")
+
+    def __init__(self, bounds, scale=1.0):
+        self.bounds = bounds
+        self.scale = scale
+        # bisect_left semantics: a value equal to a bound falls in that bound's bucket
+        self._edges = np.asarray(bounds, dtype=np.float64) / scale
+        self.counts = np.zeros(len(bounds) + 1, dtype=np.int64)
+        self.sum = 0.0
+        self.count = 0
+        self.pending = array("q")
+
+    def observe(self, value):
+        self.pending.append(value)
+        if len(self.pending) >= PENDING_LIMIT:
+            self.fold()
+
+    def fold(self):
+        """Buckets the pending observations"""
+        if not self.pending:
+            return
+        values = np.frombuffer(self.pending, dtype=np.int64)
+        self.counts += np.bincount(
+            np.searchsorted(self._edges, values, side="left"), minlength=len(self.counts)
+        )
+        self.sum += float(values.sum()) * self.scale
+        self.count += len(values)
+        self.pending = array("q")
+
+    def render(self, name, labels):
+        self.fold()
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{_labels(labels, le=_number(bound))} {cumulative}')
+        lines.append(f'{name}_bucket{_labels(labels, le="+Inf")} {self.count}')
+        lines.append(f"{name}_sum{_labels(labels)} {self.sum!r}")
+        lines.append(f"{name}_count{_labels(labels)} {self.count}")
+        return lines
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels, **extra):
+    items = list(labels) + list(extra.items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in items) + "}"
+
+
+class RequestTimer:
+    """Times consecutive stages of one request"""
+
+    __slots__ = ("metrics", "endpoint", "start", "last", "marks", "error_type")
+
+    def __init__(self, metrics, endpoint):
+        self.metrics = metrics
+        self.endpoint = endpoint
+        self.start = self.last = time.perf_counter_ns()
+        self.marks = []  # (stage, perf_counter_ns) not yet recorded
+        self.error_type = None
+
+    def mark(self, stage):
+        """Ends stage, which started at the previous mark"""
+        self.marks.append((stage, time.perf_counter_ns()))
+
+    def error(self, error_type):
+        self.error_type = error_type
+
+    def flush(self):
+        """Records the marks so far (long requests such as streams call this as they go)"""
+        if self.marks:
+            self.metrics.observe_stages(self.endpoint, self.last, self.marks)
+            self.last = self.marks[-1][1]
+            self.marks = []
+
+    def finish(self):
+        self.metrics.observe_request(
+            self.endpoint, self.error_type, self.start, self.last, self.marks, time.perf_counter_ns()
+        )
+
+
+class _NullTimer:
+    """Stands in for RequestTimer when metrics are disabled"""
+
+    __slots__ = ()
+
+    def mark(self, stage):
+        pass
+
+    def error(self, error_type):
+        pass
+
+    def flush(self):
+        pass
+
+    def finish(self):
+        pass
+
+
+NULL_TIMER = _NullTimer()
+
+
+class ServingMetrics:
+    """
+    Stage latency histograms, request/error counters, batch-size distribution
+    and model load times for the /metrics endpoint.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stages = {}  # endpoint -> {stage: Histogram}
+        self._requests = {}  # endpoint -> Histogram
+        self._outcomes = {}  # (endpoint, outcome) -> count
+        self._errors = {}  # (endpoint, error type) -> count
+        self._batch_sizes = {}  # endpoint -> Histogram
+        self._model_loads = {}  # model -> (seconds, loads)
+
+    def timer(self, endpoint):
+        if not self.enabled:
+            return NULL_TIMER
+        return RequestTimer(self, endpoint)
+
+    def _observe_stages(self, endpoint, last, marks):
+        """Records (stage, end ns) marks following last; the caller holds the lock"""
+        stages = self._stages.get(endpoint)
+        if stages is None:
+            stages = self._stages[endpoint] = {}
+        for stage, now in marks:
+            histogram = stages.get(stage)
+            if histogram is None:
+                histogram = stages[stage] = Histogram(LATENCY_BUCKETS, scale=1e-9)
+            histogram.pending.append(now - last)
+            last = now
+        return stages
+
+    def observe_stages(self, endpoint, last, marks):
+        """Records (stage, end ns) marks of a request that is still running"""
+        with self._lock:
+            for histogram in self._observe_stages(endpoint, last, marks).values():
+                if len(histogram.pending) >= PENDING_LIMIT:
+                    histogram.fold()
+
+    def observe_request(self, endpoint, error_type, start, last, marks, end):
+        """Records a finished request: its remaining stage marks and its total time"""
+        outcome = "error" if error_type else "ok"
+        with self._lock:
+            stages = self._observe_stages(endpoint, last, marks)
+            histogram = self._requests.get(endpoint)
+            if histogram is None:
+                histogram = self._requests[endpoint] = Histogram(LATENCY_BUCKETS, scale=1e-9)
+            histogram.pending.append(end - start)
+            # Stages see about as many values as requests, so one check covers them
+            if len(histogram.pending) >= PENDING_LIMIT:
+                histogram.fold()
+                for stage_histogram in stages.values():
+                    stage_histogram.fold()
+            self._outcomes[(endpoint, outcome)] = self._outcomes.get((endpoint, outcome), 0) + 1
+            if error_type:
+                self._errors[(endpoint, error_type)] = (
+                    self._errors.get((endpoint, error_type), 0) + 1
+                )
+
+    def observe_batch_size(self, endpoint, rows):
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self._batch_sizes.get(endpoint)
+            if histogram is None:
+                histogram = self._batch_sizes[endpoint] = Histogram(BATCH_SIZE_BUCKETS)
+            histogram.observe(rows)
+
+    def observe_model_load(self, model, seconds):
+        """Model loads are rare and always recorded"""
+        with self._lock:
+            _, loads = self._model_loads.get(model, (0.0, 0))
+            self._model_loads[model] = (seconds, loads + 1)
+
+    def render(self, extra_gauges=()):
+        """
+        Prometheus text format. extra_gauges is an iterable of
+        (name, help, labels dict, value) appended as gauges.
+        """
+        with self._lock:
+            lines = []
+            lines += self._render_histograms(
+                "predict_stage_seconds",
+                "Time spent in each stage of a prediction request.",
+                {
+                    (endpoint, stage): histogram
+                    for endpoint, stages in self._stages.items()
+                    for stage, histogram in stages.items()
+                },
+                ("endpoint", "stage"),
+            )
+            lines += self._render_histograms(
+                "request_seconds",
+                "End-to-end handler latency.",
+                {(endpoint,): value for endpoint, value in self._requests.items()},
+                ("endpoint",),
+            )
+            lines += self._render_counters(
+                "requests_total",
+                "Handled requests by outcome.",
+                self._outcomes,
+                ("endpoint", "outcome"),
+            )
+            lines += self._render_counters(
+                "errors_total",
+                "Failed requests by error type.",
+                self._errors,
+                ("endpoint", "type"),
+            )
+            lines += self._render_histograms(
+                "batch_size_rows",
+                "Rows per batch request.",
+                {(endpoint,): value for endpoint, value in self._batch_sizes.items()},
+                ("endpoint",),
+            )
+            name = f"{PREFIX}_model_load_seconds"
+            lines += [f"# HELP {name} Duration of the latest load of each model.", f"# TYPE {name} gauge"]
+            for model, (seconds, _) in sorted(self._model_loads.items()):
+                lines.append(f"{name}{_labels([('model', model)])} {seconds!r}")
+            lines += self._render_counters(
+                "model_loads_total",
+                "Model loads, including hot reloads.",
+                {(model,): loads for model, (_, loads) in self._model_loads.items()},
+                ("model",),
+            )
+        for gauge_name, help_text, labels, value in extra_gauges:
+            name = f"{PREFIX}_{gauge_name}"
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+            lines.append(f"{name}{_labels(labels.items())} {value!r}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _render_histograms(short_name, help_text, histograms, label_names):
+        name = f"{PREFIX}_{short_name}"
+        lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        for key, histogram in sorted(histograms.items()):
+            lines += histogram.render(name, list(zip(label_names, key)))
+        return lines
+
+    @staticmethod
+    def _render_counters(short_name, help_text, counters, label_names):
+        name = f"{PREFIX}_{short_name}"
+        lines = [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+        for key, value in sorted(counters.items()):
+            lines.append(f"{name}{_labels(list(zip(label_names, key)))} {value}")
+        return lines
@@ -0,0 +1,404 @@
+# streaming_training.py
+# Incremental training on an append-only sensor log.
+# The log is read in fixed-size chunks of complete lines; the scaler is
+# updated with partial_fit and the model is trained chunk by chunk
+# (SGDRegressor / MLPRegressor partial_fit, or XGBoost continued training).
+# A small share of rows is held out into a bounded reservoir sample used for
+# evaluation, so memory stays flat however long the log gets.
+# The checkpoint remembers the byte offset reached: the next run (e.g. a
+# daily retrain) only reads rows appended since then.
+# SGD and MLP learn a standardized target (several shuffled passes per chunk
+# for the MLP); XGBoost grows to XGB_MAX_ROUNDS trees and from then on only
+# refreshes their leaf values, so the model size stays flat as well.
+#
+#   python streaming_training.py --data-path sensor_data_log.csv --target-column co2
+import argparse
+import io
+import json
+import os
+import pickle
+import warnings
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.base import BaseEstimator, RegressorMixin, clone
+from sklearn.linear_model import SGDRegressor
+from sklearn.metrics import mean_squared_error, r2_score
+from sklearn.neural_network import MLPRegressor
+from sklearn.preprocessing import StandardScaler
+
+from experiment_store import ArtifactWriter
+
+OUTPUT_DIR = "models"
+# Columns that are never features (see TournamentModelSelection._load_data)
+DROPPED_COLUMNS = ["Unnamed: 0", "timestamp"]
+# Boosting rounds added per chunk in xgboost mode, up to XGB_MAX_ROUNDS trees
+XGB_ROUNDS_PER_CHUNK = 10
+XGB_MAX_ROUNDS = 300
+# Shuffled partial_fit passes over each chunk in mlp mode
+MLP_EPOCHS_PER_CHUNK = 10
+
+
+class ScaledTargetRegressor(RegressorMixin, BaseEstimator):
+    """
+    Trains regressor with partial_fit on a standardized target and predicts
+    in the original units. The target scaler is updated with every chunk,
+    like the feature scaler. Each chunk is seen epochs times, reshuffled.
+    """
+
+    def __init__(self, regressor, epochs=1, random_state=None):
+        self.regressor = regressor
+        self.epochs = epochs
+        self.random_state = random_state
+
+    def partial_fit(self, X, y):
+        if not hasattr(self, "regressor_"):
+            self.regressor_ = clone(self.regressor)
+            self.target_scaler_ = StandardScaler()
+            self.rng_ = np.random.default_rng(self.random_state)
+        y = np.asarray(y, dtype=np.float64).reshape(-1, 1)
+        self.target_scaler_.partial_fit(y)
+        y_scaled = self.target_scaler_.transform(y).ravel()
+        for _ in range(self.epochs):
+            order = self.rng_.permutation(len(y_scaled)) if self.epochs > 1 else slice(None)
+            self.regressor_.partial_fit(X[order], y_scaled[order])
+        self.n_features_in_ = np.shape(X)[1]
+        return self
+
+    def predict(self, X):
+        y_scaled = np.asarray(self.regressor_.predict(X)).reshape(-1, 1)
+        return self.target_scaler_.inverse_transform(y_scaled).ravel()
+
+
+def _make_estimator(name, random_state):
+    if name == "sgd":
+        return ScaledTargetRegressor(SGDRegressor(random_state=random_state))
+    if name == "mlp":
+        return ScaledTargetRegressor(
+            MLPRegressor(hidden_layer_sizes=(100,), random_state=random_state),
+            epochs=MLP_EPOCHS_PER_CHUNK,
+            random_state=random_state,
+        )
+    if name == "xgboost":
+        import xgboost as xgb
+
+        return xgb.XGBRegressor(n_estimators=XGB_ROUNDS_PER_CHUNK, random_state=random_state)
+    raise ValueError(f"Unknown estimator '{name}'")
+
+
+def _train_chunk(model, X, y):
+    """Updates model with one chunk of scaled rows"""
+    if hasattr(model, "partial_fit"):
+        model.partial_fit(X, y)
+    elif getattr(model, "_Booster", None) is not None:
+        booster = model.get_booster()
+        rounds = booster.num_boosted_rounds()
+        if rounds + XGB_ROUNDS_PER_CHUNK <= XGB_MAX_ROUNDS:
+            # XGBoost continued training: adds rounds on top of the current booster
+            model.fit(X, y, xgb_model=booster)
+        else:
+            # Full size: refit the leaf values of the existing trees to this chunk
+            import xgboost as xgb
+
+            with warnings.catch_warnings():
+                # The refresh updater is set explicitly on purpose
+                warnings.simplefilter("ignore", UserWarning)
+                model._Booster = xgb.train(
+                    {"process_type": "update", "updater": "refresh", "refresh_leaf": True},
+                    xgb.DMatrix(X, label=y),
+                    num_boost_round=rounds,
+                    xgb_model=booster,
+                )
+    else:
+        model.fit(X, y)
+    return model
+
+
+def _read_chunks(path, offset, chunk_size):
+    """
+    Yields (chunk bytes, end offset) for complete lines after offset.
+    A trailing line without a newline is still being written and is left
+    for the next run.
+    """
+    with open(path, "rb") as f:
+        f.seek(offset)
+        while True:
+            lines = []
+            for _ in range(chunk_size):
+                line = f.readline()
+                if not line.endswith(b"\n"):
+                    break
+                lines.append(line)
+                offset += len(line)
+            if not lines:
+                return
+            yield b"".join(lines), offset
+            if len(lines) < chunk_size:
+                return
+
+
+class Reservoir:
+    """
+    Uniform sample of at most capacity rows from a stream (Algorithm R).
+    Checkpoints hold it as plain arrays (to_dict), so they load wherever
+    this module is imported from.
+    """
+
+    def __init__(self, capacity, n_features, random_state):
+        self.capacity = capacity
+        self.X = np.empty((capacity, n_features))
+        self.y = np.empty(capacity)
+        self.seen = 0
+        self.rng = np.random.default_rng(random_state)
+
+    def add(self, X, y):
+        for row, target in zip(X, y):
+            if self.seen < self.capacity:
+                slot = self.seen
+            else:
+                slot = self.rng.integers(0, self.seen + 1)
+            if slot < self.capacity:
+                self.X[slot] = row
+                self.y[slot] = target
+            self.seen += 1
+
+    def sample(self):
+        size = min(self.seen, self.capacity)
+        return self.X[:size], self.y[:size]
+
+    def to_dict(self):
+        return {
+            "X": self.X,
+            "y": self.y,
+            "seen": self.seen,
+            "rng_state": self.rng.bit_generator.state,
+        }
+
+    @classmethod
+    def from_dict(cls, values):
+        reservoir = cls(len(values["y"]), values["X"].shape[1], None)
+        reservoir.X = values["X"]
+        reservoir.y = values["y"]
+        reservoir.seen = values["seen"]
+        reservoir.rng.bit_generator.state = values["rng_state"]
+        return reservoir
+
+
+class StreamingTrainer:
+    """
+    Trains one incremental model on a growing CSV log.
+    Everything needed to continue (scaler, model, reservoir, byte offset) is
+    saved in a checkpoint after every chunk.
+    The scaler keeps adapting, so early chunks were learned under slightly
+    different scaling; the effect fades as the statistics settle.
+    """
+
+    def __init__(
+        self,
+        data_path,
+        target_column,
+        estimator="sgd",
+        chunk_size=5000,
+        reservoir_size=5000,
+        holdout_fraction=0.1,
+        random_state=42,
+        checkpoint_path=None,
+    ):
+        self.data_path = data_path
+        self.target_column = target_column
+        self.estimator = estimator
+        self.chunk_size = chunk_size
+        self.reservoir_size = reservoir_size
+        self.holdout_fraction = holdout_fraction
+        self.random_state = random_state
+        self.checkpoint_path = checkpoint_path or os.path.join(
+            OUTPUT_DIR, f"streaming_{estimator}_{target_column}.checkpoint.joblib"
+        )
+        self.writer = ArtifactWriter()
+        self.state = None
+
+    def _new_state(self, header):
+        columns = pd.read_csv(io.BytesIO(header), nrows=0).columns
+        if self.target_column not in columns:
+            raise ValueError(f"Target column '{self.target_column}' not found in the data.")
+        features = [
+            column
+            for column in columns
+            if column not in DROPPED_COLUMNS and column != self.target_column
+        ]
+        return {
+            "header": header,
+            "columns": list(columns),
+            "features": features,
+            "offset": len(header),
+            "rows_trained": 0,
+            "rows_held_out": 0,
+            "scaler": StandardScaler(),
+            "model": _make_estimator(self.estimator, self.random_state),
+            "reservoir": Reservoir(self.reservoir_size, len(features), self.random_state),
+        }
+
+    def _load_state(self):
+        """Resumes from the checkpoint unless the log was replaced or truncated"""
+        with open(self.data_path, "rb") as f:
+            header = f.readline()
+        size = os.path.getsize(self.data_path)
+        if os.path.exists(self.checkpoint_path):
+            try:
+                state = joblib.load(self.checkpoint_path)
+                state["reservoir"] = Reservoir.from_dict(state["reservoir"])
+            except (AttributeError, ImportError, KeyError, TypeError, EOFError, pickle.UnpicklingError) as e:
+                raise ValueError(
+                    f"Cannot read checkpoint {self.checkpoint_path} ({e}); "
+                    "delete it to start over"
+                ) from e
+            if state["header"] == header and state["offset"] <= size:
+                print(
+                    f"Resuming from {self.checkpoint_path}: {state['rows_trained']} rows "
+                    f"trained, continuing at byte {state['offset']}"
+                )
+                return state
+            print("The log was replaced or truncated since the checkpoint, starting over.")
+        return self._new_state(header)
+
+    def _process_chunk(self, chunk):
+        state = self.state
+        frame = pd.read_csv(io.BytesIO(chunk), names=state["columns"], header=None)
+        frame = frame[state["features"] + [self.target_column]].apply(
+            pd.to_numeric, errors="coerce"
+        )
+        frame = frame.dropna()
+        if frame.empty:
+            return
+        X = frame[state["features"]].astype(float)
+        y = frame[self.target_column].to_numpy(dtype=float)
+
+        # Deterministic holdout: depends only on the seed and stream position
+        rng = np.random.default_rng([self.random_state, state["rows_trained"] + state["rows_held_out"]])
+        held_out = rng.random(len(y)) < self.holdout_fraction
+        state["reservoir"].add(X[held_out].to_numpy(), y[held_out])
+        state["rows_held_out"] += int(held_out.sum())
+
+        X_train, y_train = X[~held_out], y[~held_out]
+        if len(y_train) == 0:
+            return
+        # Fitted on a frame so the scaler records the feature names, like
+        # the scalers written by training.py
+        state["scaler"].partial_fit(X_train)
+        X_scaled = state["scaler"].transform(X_train)
+        state["model"] = _train_chunk(state["model"], X_scaled, y_train)
+        state["rows_trained"] += len(y_train)
+
+    def _save_checkpoint(self):
+        # Synchronous: the next chunk mutates the model being saved
+        tmp_path = self.checkpoint_path + ".tmp"
+        joblib.dump(dict(self.state, reservoir=self.state["reservoir"].to_dict()), tmp_path)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def run(self):
+        """Trains on every complete row not seen yet and returns the state"""
+        if not os.path.exists(OUTPUT_DIR):
+            os.makedirs(OUTPUT_DIR)
+        self.state = self._load_state()
+        chunks = 0
+        for chunk, offset in _read_chunks(self.data_path, self.state["offset"], self.chunk_size):
+            self._process_chunk(chunk)
+            self.state["offset"] = offset
+            chunks += 1
+            print(
+                f"Chunk {chunks}: {self.state['rows_trained']} rows trained, "
+                f"{self.state['rows_held_out']} held out"
+            )
+            self._save_checkpoint()
+        if chunks == 0:
+            print("No new rows since the last checkpoint.")
+        return self.state
+
+    def evaluate(self):
+        """RMSE and R² of the current model on the reservoir sample"""
+        X, y = self.state["reservoir"].sample()
+        if self.state["rows_trained"] == 0 or len(y) < 2:
+            return None
+        X = pd.DataFrame(X, columns=self.state["features"])
+        y_pred = self.state["model"].predict(self.state["scaler"].transform(X))
+        return {
+            "rmse": float(np.sqrt(mean_squared_error(y, y_pred))),
+            "r2": float(r2_score(y, y_pred)),
+            "rows": int(len(y)),
+        }
+
+    def save_serving_artifacts(self):
+        """Writes model, scaler and feature schema for the prediction server"""
+        name = f"streaming_{self.estimator}_{self.target_column}"
+        model_file = f"{name}.joblib"
+        scaler_file = f"{name}_scaler.joblib"
+        self.writer.submit(self.state["model"], os.path.join(OUTPUT_DIR, model_file))
+        self.writer.submit(self.state["scaler"], os.path.join(OUTPUT_DIR, scaler_file))
+        self.writer.flush()
+        schema_path = os.path.join(OUTPUT_DIR, f"{name}.schema.json")
+        schema = {
+            "name": name,
+            "target": self.target_column,
+            "model": model_file,
+            "scaler": scaler_file,
+            "features": self.state["features"],
+        }
+        with open(schema_path, "w") as f:
+            json.dump(schema, f, indent=2)
+        print(f"Serving artifacts saved as {name} ({schema_path})")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Incrementally train a model on an append-only CSV log."
+    )
+    parser.add_argument("--data-path", type=str, default="sensor_data_log.csv")
+    parser.add_argument("--target-column", type=str, default="co2")
+    parser.add_argument(
+        "--estimator", choices=["sgd", "mlp", "xgboost"], default="sgd"
+    )
+    parser.add_argument("--chunk-size", type=int, default=5000, help="Rows per chunk.")
+    parser.add_argument(
+        "--reservoir-size",
+        type=int,
+        default=5000,
+        help="Held-out rows kept for evaluation.",
+    )
+    parser.add_argument("--holdout-fraction", type=float, default=0.1)
+    parser.add_argument("--random-state", type=int, default=42)
+    parser.add_argument("--checkpoint-path", type=str, default=None)
+    args = parser.parse_args()
+
+    trainer = StreamingTrainer(
+        data_path=args.data_path,
+        target_column=args.target_column,
+        estimator=args.estimator,
+        chunk_size=args.chunk_size,
+        reservoir_size=args.reservoir_size,
+        holdout_fraction=args.holdout_fraction,
+        random_state=args.random_state,
+        checkpoint_path=args.checkpoint_path,
+    )
+    try:
+        trainer.run()
+    except (OSError, ValueError) as e:
+        print(f"Error during streaming training: {e}")
+        return
+
+    scores = trainer.evaluate()
+    if scores is None:
+        print("Not enough data to evaluate yet.")
+        return
+    print(f"Reservoir evaluation on {scores['rows']} rows:")
+    print(f"RMSE: {scores['rmse']:.4f}")
+    print(f"R²: {scores['r2']:.4f}")
+    trainer.save_serving_artifacts()
+
+
+if __name__ == "__main__":
+    # Run from the importable module, so the pickled models refer to
+    # streaming_training.ScaledTargetRegressor rather than __main__
+    import streaming_training
+
+    streaming_training.main()
@@ -0,0 +1,99 @@
+# timelimit.py
+# Runs calls in child processes under a wall-clock limit, killing any that
+# overrun. Used by the budgeted tournament so a single slow estimator cannot
+# hold up a round.
+import multiprocessing
+import time
+from collections import deque
+from multiprocessing.connection import wait
+
+
+class TimeLimitExceeded(Exception):
+    """Returned for calls that were killed or never started in time"""
+
+
+def _context():
+    # fork shares the caller's arrays copy-on-write; spawn needs picklable args
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context("spawn")
+
+
+def _child(connection, func, args):
+    try:
+        outcome = func(*args)
+    except Exception as e:
+        outcome = e
+    try:
+        connection.send(outcome)
+    except Exception as e:
+        # Unpicklable result or exception
+        connection.send(RuntimeError(str(e)))
+    connection.close()
+
+
+def run_with_time_limit(calls, time_limit=None, budget=None, max_workers=1):
+    """
+    Runs each (func, args) in calls in its own process, at most max_workers
+    at a time. A call is killed once it has run for time_limit seconds (one
+    number, or a list with a limit per call), or when budget seconds have
+    passed since this function was entered; calls that have not started by
+    then are skipped.
+
+    Returns a list aligned with calls holding each result, or the exception
+    instance it raised (TimeLimitExceeded for killed or skipped calls).
+    """
+    context = _context()
+    started = time.monotonic()
+    overall_deadline = started + budget if budget is not None else None
+    pending = deque(enumerate(calls))
+    running = {}  # reader -> (index, process, start time, deadline)
+    results = [None] * len(calls)
+    if not isinstance(time_limit, (list, tuple)):
+        time_limit = [time_limit] * len(calls)
+
+    while pending or running:
+        now = time.monotonic()
+        while pending and len(running) < max_workers:
+            index, (func, args) = pending.popleft()
+            if overall_deadline is not None and now >= overall_deadline:
+                results[index] = TimeLimitExceeded("Time budget exhausted before start")
+                continue
+            reader, writer = context.Pipe(duplex=False)
+            process = context.Process(target=_child, args=(writer, func, args), daemon=True)
+            process.start()
+            writer.close()
+            deadlines = [
+                deadline
+                for deadline in (
+                    now + time_limit[index] if time_limit[index] is not None else None,
+                    overall_deadline,
+                )
+                if deadline is not None
+            ]
+            running[reader] = (index, process, now, min(deadlines) if deadlines else None)
+        if not running:
+            continue
+
+        deadlines = [deadline for _, _, _, deadline in running.values() if deadline is not None]
+        timeout = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+        for reader in wait(list(running), timeout=timeout):
+            index, process, _, _ = running.pop(reader)
+            try:
+                value = reader.recv()
+            except EOFError:
+                process.join()
+                value = RuntimeError(f"Worker exited with code {process.exitcode}")
+            reader.close()
+            process.join()
+            results[index] = value
+
+        now = time.monotonic()
+        for reader, (index, process, process_started, deadline) in list(running.items()):
+            if deadline is not None and now >= deadline:
+                process.terminate()
+                process.join()
+                reader.close()
+                del running[reader]
+                results[index] = TimeLimitExceeded(f"Killed after {now - process_started:.1f}s")
+    return results
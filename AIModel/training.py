@@ -4,9 +4,10 @@
 # however it should lead to optimal results
 import numpy as np
 import pandas as pd
-from sklearn.model_selection import train_test_split, cross_val_score
+from sklearn.base import clone
+from sklearn.model_selection import train_test_split, KFold
 from sklearn.preprocessing import StandardScaler
-from sklearn.metrics import mean_squared_error, r2_score
+from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
 from sklearn.linear_model import LinearRegression, Ridge, Lasso, ElasticNet
 from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
 from sklearn.svm import SVR
@@ -16,8 +17,232 @@ import xgboost as xgb
 import matplotlib.pyplot as plt
 import seaborn as sns
 from tqdm import tqdm
+from threadpoolctl import threadpool_limits
 import joblib
+import ctypes
+import gc
+import glob
+import io
 import os
+import shutil
+import tempfile
+import time
+from dataset_cache import load_csv
+from experiment_store import DEFAULT_STORE_PATH, ArtifactWriter, ExperimentStore, fingerprint
+from model_bundle import write_bundle
+from model_compaction import compact_model, print_report, save_compacted
+from multi_target import MultiTargetModel, as_multi_output
+from rolling_features import ROLLING_COLUMNS, RollingFeatures
+from timelimit import TimeLimitExceeded, run_with_time_limit
+
+# Cross-validation metrics, all computed from the same fold predictions
+METRIC_FUNCTIONS = {
+    "rmse": lambda y_true, y_pred: np.sqrt(mean_squared_error(y_true, y_pred)),
+    "mae": mean_absolute_error,
+    "r2": r2_score,
+}
+# Metrics where a higher value is better
+HIGHER_IS_BETTER = {"r2"}
+# Serving and training costs measured on each candidate's first fold, one
+# candidate at a time once the round's fits are done
+COST_NAMES = ["latency_single_ms", "latency_batch_ms", "artifact_mb", "fit_peak_mb"]
+# Costs a candidate must not lose on all at once to stay on the Pareto front
+PARETO_COSTS = ["latency_single_ms", "artifact_mb"]
+# Rows per batch when timing batch prediction
+LATENCY_BATCH_ROWS = 1000
+# Timed single-row predictions per candidate (the median is kept)
+LATENCY_REPEATS = 50
+
+
+def _measure_costs(model, X_test, fit_peak_mb):
+    """Predict latency (single row and batch), pickled size and fit memory of a fitted model"""
+    single = X_test[:1]
+    batch = X_test[np.arange(LATENCY_BATCH_ROWS) % len(X_test)]
+    model.predict(single)  # Warm-up
+    timings = []
+    for _ in range(LATENCY_REPEATS):
+        started = time.perf_counter()
+        model.predict(single)
+        timings.append(time.perf_counter() - started)
+    started = time.perf_counter()
+    model.predict(batch)
+    batch_time = time.perf_counter() - started
+    artifact = io.BytesIO()
+    joblib.dump(model, artifact)
+    return {
+        "latency_single_ms": float(np.median(timings)) * 1000,
+        "latency_batch_ms": batch_time * 1000,
+        "artifact_mb": artifact.tell() / 2**20,
+        "fit_peak_mb": fit_peak_mb,
+    }
+
+
+def _child_pids():
+    """Processes started by this one (joblib workers), from /proc"""
+    pids = []
+    for stat_path in glob.glob("/proc/[0-9]*/stat"):
+        try:
+            with open(stat_path) as f:
+                # The command name may contain spaces; fields resume after ")"
+                fields = f.read().rsplit(")", 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        if int(fields[1]) == os.getpid():
+            pids.append(int(stat_path.split("/")[2]))
+    return pids
+
+
+def _status_mb(pid, field):
+    """A memory field of /proc/<pid>/status in MB, None where /proc is unavailable"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _peak_rss_mb(pid="self"):
+    """Peak resident memory (VmHWM) of a process in MB"""
+    return _status_mb(pid, "VmHWM")
+
+
+def _rss_mb(pid="self"):
+    """Current resident memory (VmRSS) of a process in MB"""
+    return _status_mb(pid, "VmRSS")
+
+
+def _trim_heap():
+    """
+    Returns freed heap memory of this process to the OS (glibc malloc_trim),
+    so a following fit's allocations show up in its RSS instead of reusing
+    pages that are already resident. A no-op without glibc.
+    """
+    gc.collect()
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+def _reset_peak_rss(pids):
+    """Restarts VmHWM tracking of the given processes (Linux clear_refs)"""
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/clear_refs", "w") as f:
+                f.write("5")
+        except OSError:
+            pass
+
+
+def pareto_front(points):
+    """
+    Names in {name: (error, cost, ...)} that no other point matches or beats
+    on every axis while beating it on at least one.
+    """
+    front = []
+    for name, point in points.items():
+        dominated = any(
+            all(o <= p for o, p in zip(other, point)) and other != point
+            for other_name, other in points.items()
+            if other_name != name
+        )
+        if not dominated:
+            front.append(name)
+    return front
+
+
+def _fit_candidate(name, model, X, y, train_idx, test_idx, metric_names, threads):
+    """
+    Fits an unfitted model on the rows in train_idx.
+    With test_idx, returns (name, fold scores, error); without, the model is
+    fitted on all of X and returned as (name, fitted model, error).
+    threads caps both the estimator's n_jobs and BLAS/OpenMP pools.
+    """
+    capped = threads is not None and "n_jobs" in model.get_params()
+    if capped:
+        n_jobs = model.get_params()["n_jobs"]
+        model.set_params(n_jobs=threads)
+    try:
+        with threadpool_limits(limits=threads):
+            if test_idx is None:
+                model.fit(X, y)
+            else:
+                model.fit(X[train_idx], y[train_idx])
+                y_pred = model.predict(X[test_idx])
+    except Exception as e:
+        return name, None, str(e)
+    if test_idx is None:
+        if capped:
+            # The cap only applies inside the tournament
+            model.set_params(n_jobs=n_jobs)
+        return name, model, None
+    y_true = y[test_idx]
+    if y_true.ndim == 1:
+        scores = {metric: METRIC_FUNCTIONS[metric](y_true, y_pred) for metric in metric_names}
+    else:
+        # Several targets: each metric is the mean of the per-target scores
+        scores = {"targets": [
+            {metric: METRIC_FUNCTIONS[metric](y_true[:, j], y_pred[:, j]) for metric in metric_names}
+            for j in range(y_true.shape[1])
+        ]}
+        for metric in metric_names:
+            scores[metric] = float(np.mean([target[metric] for target in scores["targets"]]))
+    return name, scores, None
+
+
+def _candidate_costs(model, X, y, train_idx, test_idx, threads):
+    """
+    Fits an unfitted model on the rows in train_idx and measures its costs
+    (see _measure_costs). Meant to run in the main process with nothing else
+    fitting: fit memory is the rise of this process's RSS high-water mark
+    over the RSS before the fit, which includes native allocations (None
+    where /proc is unavailable).
+    """
+    if threads is not None and "n_jobs" in model.get_params():
+        model.set_params(n_jobs=threads)
+    X_train, y_train = X[train_idx], y[train_idx]
+    with threadpool_limits(limits=threads):
+        _trim_heap()
+        baseline = _rss_mb()
+        _reset_peak_rss(["self"])
+        model.fit(X_train, y_train)
+        peak = _peak_rss_mb()
+        fit_peak = None if baseline is None or peak is None else max(peak - baseline, 0.0)
+        return _measure_costs(model, X[test_idx], fit_peak)
+
+
+def _cross_validate_candidate(name, model, X, y, folds, metric_names, threads):
+    """
+    Runs the given fold fits of one candidate in the calling process and
+    returns their scores. Used by the budgeted tournament, where a candidate
+    is the unit that is timed and killed.
+    """
+    fold_scores = []
+    for train_idx, test_idx in folds:
+        _, scores, error = _fit_candidate(
+            name, clone(model), X, y, train_idx, test_idx, metric_names, threads
+        )
+        if error is not None:
+            raise RuntimeError(error)
+        fold_scores.append(scores)
+    return fold_scores
+
+
+def _share_arrays(folder, **arrays):
+    """
+    Dumps arrays to folder and reopens them memory-mapped, so joblib hands
+    workers a file reference instead of pickling a copy per task.
+    """
+    shared = {}
+    for name, array in arrays.items():
+        path = os.path.join(folder, f"{name}.joblib")
+        joblib.dump(np.ascontiguousarray(array), path)
+        shared[name] = joblib.load(path, mmap_mode="r")
+    return shared
+
 
 class TournamentModelSelection:
     def __init__(
@@ -30,15 +255,102 @@ class TournamentModelSelection:
         tournament_rounds=3,
         metrics=["rmse", "r2"],
         primary_metric="rmse",
+        cv_folds=3,
+        n_jobs=1,
+        threads_per_model=None,
+        time_budget=None,
+        candidate_time_limit=None,
+        data_growth=2.0,
+        experiment_store=DEFAULT_STORE_PATH,
+        selection_policy="accuracy",
+        selection_tolerance=0.02,
+        measure_costs=None,
+        low_memory=False,
+        rolling_window=None,
     ):
+        """
+        n_jobs > 1 (or -1 for all cores) spreads every candidate x fold fit of a
+        round across a process pool. threads_per_model caps the threads one fit
+        may use; it defaults to cores // n_jobs when running in parallel.
+
+        time_budget (seconds) turns on the budgeted tournament: round 1 uses
+        tournament_data_fraction of the training set and each later round
+        data_growth times more, as nested prefixes of one seeded permutation.
+        Every round gets an equal share of the remaining budget, and a
+        candidate still running after candidate_time_limit seconds (or when
+        its round's share runs out) is killed and dropped.
+
+        Fold scores are recorded in the SQLite experiment_store (None turns it
+        off) and reused by later runs on the same data, folds and parameters,
+        so an interrupted run resumes where it stopped.
+
+        With measure_costs, every candidate's single-row and batch predict
+        latency, pickled size and peak fit memory (RSS) are measured on its
+        first fold and kept in model_history next to its scores. This takes
+        one more fit per candidate, run after the round's fits, one at a time
+        in this process, so the timings and memory are not shared with other
+        fits. It defaults to on for every selection_policy but "accuracy".
+        selection_policy decides how the costs count:
+          - "accuracy": the best primary_metric wins each round (costs are
+            only reported).
+          - "fastest_within": the round winner is the model with the lowest
+            single-row latency among those whose error is within
+            selection_tolerance (relative) of the best.
+          - "pareto": like "fastest_within", and every model on the Pareto
+            front of error, single-row latency and artifact size also
+            advances, even outside the top half.
+
+        low_memory keeps the scaled data in float32 (estimators that need
+        float64 convert per fit), drops the raw frames once they are scaled,
+        keeps only metrics and parameters of eliminated models in
+        model_history and does not hold on to fitted round winners (they are
+        still written to models/). Peak RSS of this process and its workers
+        is reported after every round either way (round_memory).
+
+        target_column may be a list of targets (e.g. ["CO", "NOX"]), which
+        share one split, scaler, folds and fit per candidate: natively
+        multi-output estimators fit all targets at once, the others are
+        wrapped in MultiOutputRegressor. Metrics are kept per target
+        (e.g. "rmse_CO") next to their average, each target ranks the field
+        on its own, and a model advances if it is in the top half for any
+        target. The winner is a MultiTargetModel of each target's best model,
+        predicting every target in one call.
+
+        rolling_window adds the rolling mean, slope and delta of the gas
+        channels (ROLLING_COLUMNS) over each device's last rolling_window
+        readings (rolling_features.py), computed in file order before the
+        split. The configuration is saved in the final model bundle, so the
+        server computes the same features from live readings.
+        """
+        if selection_policy not in ("accuracy", "fastest_within", "pareto"):
+            raise ValueError(f"Unknown selection_policy '{selection_policy}'")
+        unknown = [metric for metric in [*metrics, primary_metric] if metric not in METRIC_FUNCTIONS]
+        if unknown:
+            raise ValueError(f"Unknown metrics {unknown}; choose from {list(METRIC_FUNCTIONS)}")
         self.data_path = data_path
         self.target_column = target_column
+        self.targets = [target_column] if isinstance(target_column, str) else list(target_column)
         self.test_size = test_size
         self.random_state = random_state
         self.tournament_data_fraction = tournament_data_fraction
         self.tournament_rounds = tournament_rounds
         self.metrics = metrics
         self.primary_metric = primary_metric
+        self.cv_folds = cv_folds
+        self.n_jobs = n_jobs
+        self.threads_per_model = threads_per_model
+        self.time_budget = time_budget
+        self.candidate_time_limit = candidate_time_limit
+        self.data_growth = data_growth
+        self.selection_policy = selection_policy
+        self.selection_tolerance = selection_tolerance
+        self.measure_costs = selection_policy != "accuracy" if measure_costs is None else measure_costs
+        self.low_memory = low_memory
+        self.rolling_window = rolling_window
+        self.round_memory = {}
+        self.timed_out = {}
+        self.store = ExperimentStore(experiment_store) if experiment_store else None
+        self.artifacts = ArtifactWriter()
         self.model_history = {}
         self.round_winners = []
         
@@ -55,7 +367,8 @@ class TournamentModelSelection:
         """Load the dataset from CSV file, using the first column as index"""
         print("Loading data...")
         # Use index_col=0 to treat the first column as the index
-        self.data = pd.read_csv(self.data_path, index_col=0)
+        # (served from the column cache after the first run)
+        self.data = load_csv(self.data_path, index_col=0)
         print(f"Data loaded with shape: {self.data.shape}")
         # Optional: Check if 'Unnamed: 0' is still somehow present and drop it
         if "Unnamed: 0" in self.data.columns:
@@ -69,7 +382,15 @@ class TournamentModelSelection:
     def _prepare_data(self):
         """Split data and scale features"""
         print("Preparing data...")
-        X = self.data.drop(columns=[self.target_column])
+        self.rolling = None
+        if self.rolling_window:
+            columns = [column for column in ROLLING_COLUMNS if column in self.data.columns]
+            if not columns:
+                raise ValueError(f"None of the rolling feature columns {ROLLING_COLUMNS} are in the data")
+            self.rolling = RollingFeatures(columns, window=self.rolling_window)
+            self.data = self.rolling.add_features(self.data)
+            print(f"Added {len(self.rolling.feature_names)} rolling features (window {self.rolling_window})")
+        X = self.data.drop(columns=self.targets)
         y = self.data[self.target_column]
         
         # Split data into train and test sets
@@ -81,10 +402,26 @@ class TournamentModelSelection:
         self.scaler = StandardScaler()
         self.X_train_scaled = self.scaler.fit_transform(self.X_train)
         self.X_test_scaled = self.scaler.transform(self.X_test)
+        self.feature_names = [str(column) for column in X.columns]
         
         print(f"Training data size: {self.X_train.shape}")
         print(f"Testing data size: {self.X_test.shape}")
         
+        if self.low_memory:
+            # float32 from here on; the unscaled frames are no longer needed
+            self.X_train_scaled = self.X_train_scaled.astype(np.float32, copy=False)
+            self.X_test_scaled = self.X_test_scaled.astype(np.float32, copy=False)
+            self.y_train = self.y_train.to_numpy(dtype=np.float32)
+            self.y_test = self.y_test.to_numpy(dtype=np.float32)
+            self.data = self.X_train = self.X_test = None
+            print(
+                "Low-memory mode: keeping "
+                f"{(self.X_train_scaled.nbytes + self.X_test_scaled.nbytes) / 2**20:.1f} MB "
+                "of float32 features"
+            )
+        # Identifies the split and scaling in experiment store keys
+        self.data_key = fingerprint(self.X_train_scaled, self.y_train, self.X_test_scaled)
+        
     def _define_models(self):
         """Define a variety of models with different hyperparameters"""
         self.models = {
@@ -128,109 +465,397 @@ class TournamentModelSelection:
             ),
         }
         
+        if len(self.targets) > 1:
+            self.models = {name: as_multi_output(model) for name, model in self.models.items()}
+        
         print(f"Defined {len(self.models)} different models for tournament")
         
-    def _tournament_round(self, models, round_num):
+    def _tournament_round(self, models, round_num, round_budget=None):
         """Run a tournament round with the given models"""
         print(f"\n--- Tournament Round {round_num} ---")
         print(f"Competing models: {len(models)}")
+        _reset_peak_rss(["self", *_child_pids()])
         
         # Subsample the training data for quicker evaluation
-        tournament_size = int(len(self.X_train) * self.tournament_data_fraction)
-        indices = np.random.choice(
-            len(self.X_train), tournament_size, replace=False
-        )
+        if self.time_budget is None:
+            tournament_size = int(len(self.X_train_scaled) * self.tournament_data_fraction)
+            # Seeded per round so reruns can reuse stored fold scores
+            indices = np.random.RandomState(self.random_state + round_num).choice(
+                len(self.X_train_scaled), tournament_size, replace=False
+            )
+        else:
+            # Nested seeded subsamples that grow as the field shrinks
+            fraction = min(
+                1.0, self.tournament_data_fraction * self.data_growth ** (round_num - 1)
+            )
+            order = np.random.RandomState(self.random_state).permutation(len(self.X_train_scaled))
+            indices = np.sort(order[: int(len(self.X_train_scaled) * fraction)])
+            print(f"Round data: {len(indices)} rows ({fraction:.0%}), budget {round_budget:.1f}s")
         X_tournament = self.X_train_scaled[indices]
-        y_tournament = self.y_train.iloc[indices]
-        
-        # Track model performance
-        results = {}
-        
-        # Train and evaluate each model
-        for name, model in tqdm(models.items()):
-            try:
-                # Perform cross-validation
-                cv_rmse = -np.mean(
-                    cross_val_score(
-                        model,
-                        X_tournament,
-                        y_tournament,
-                        cv=3,
-                        scoring="neg_root_mean_squared_error",
-                    )
-                )
-                cv_r2 = np.mean(
-                    cross_val_score(
-                        model, X_tournament, y_tournament, cv=3, scoring="r2"
-                    )
-                )
-                
-                # Train on the tournament data
-                model.fit(X_tournament, y_tournament)
-                
-                # Record results
-                results[name] = {
-                    "model": model,
-                    "rmse": cv_rmse,
-                    "r2": cv_r2,
-                }
-                
-                # Optionally save model for analysis
-                joblib.dump(
-                    model, f"models/round{round_num}_{name}.joblib"
-                )
-                
-            except Exception as e:
-                print(f"Error with model {name}: {e}")
-                continue
+        y_tournament = np.asarray(self.y_train)[indices]
+        round_key = fingerprint(self.data_key, indices)
         
-        # Sort models by primary metric
-        if self.primary_metric == "rmse":
-            sorted_models = sorted(
-                results.items(), key=lambda x: x[1]["rmse"]
-            )  # Lower RMSE is better
+        if self.time_budget is None:
+            results = self._evaluate_candidates(models, X_tournament, y_tournament, round_key)
         else:
-            sorted_models = sorted(
-                results.items(), key=lambda x: -x[1]["r2"]
-            )  # Higher R² is better
-            
+            results = self._evaluate_candidates_budgeted(
+                models, X_tournament, y_tournament, round_key, round_num, round_budget
+            )
+        if not results:
+            print(f"Round {round_num}: no model finished")
+            return {}
+        # Cost fits reset this process's high-water mark; keep the round's so far
+        evaluation_peak = _peak_rss_mb()
+        if self.measure_costs:
+            self._add_costs(results, X_tournament, y_tournament, round_key)
+        
         # Save round results
         self.model_history[f"round_{round_num}"] = results
         
-        # Return the top half of models
-        top_half = int(np.ceil(len(sorted_models) / 2))
-        winners = {name: results_dict["model"] for name, results_dict in sorted_models[:top_half]}
+        # Each target ranks the field by its primary metric; the top half for
+        # any target advances (a single target is one ranking)
+        top_half = int(np.ceil(len(results) / 2))
+        advancing = []
+        best_models = {}
+        front = set()
+        for target, key in self._target_keys():
+            ranked = sorted(results, key=lambda name: self._error(results[name], key))
+            target_front = pareto_front(
+                {
+                    name: (self._error(metrics, key), *(metrics.get(cost, np.inf) for cost in PARETO_COSTS))
+                    for name, metrics in results.items()
+                }
+            )
+            front.update(target_front)
+            advancing += ranked[:top_half]
+            
+            # Record the best model of this round
+            best_models[target] = self._select_winner(ranked, results, key)
+            if self.selection_policy == "pareto":
+                advancing += [name for name in ranked if name in target_front]
+            advancing.append(best_models[target])
+        for name, metrics in results.items():
+            metrics["pareto"] = name in front
+        winners = {name: results[name]["model"] for name in dict.fromkeys(advancing)}
+        self.round_winners.append(
+            best_models[self.target_column] if len(self.targets) == 1 else best_models
+        )
+        
+        # Only the round's best models are fitted on the round data and saved
+        for best_model_name in dict.fromkeys(best_models.values()):
+            _, fitted, error = _fit_candidate(
+                best_model_name, clone(models[best_model_name]), X_tournament, y_tournament,
+                None, None, [], None,
+            )
+            if error is None:
+                if not self.low_memory:
+                    results[best_model_name]["model"] = fitted
+                    winners[best_model_name] = fitted
+                self.artifacts.submit(fitted, f"models/round{round_num}_{best_model_name}.joblib")
+            else:
+                print(f"Error refitting {best_model_name}: {error}")
         
-        # Record the best model of this round
-        best_model_name = sorted_models[0][0]
-        self.round_winners.append(best_model_name)
+        if self.low_memory:
+            # Eliminated models are only remembered by their parameters
+            for name, metrics in results.items():
+                if name not in winners:
+                    model = metrics.pop("model")
+                    metrics["estimator"] = type(model).__name__
+                    metrics["params"] = model.get_params(deep=False)
         
-        print(f"Round {round_num} best model: {best_model_name}")
-        print(f"RMSE: {results[best_model_name]['rmse']:.4f}, R²: {results[best_model_name]['r2']:.4f}")
+        for target, best_model_name in best_models.items():
+            suffix = "" if len(self.targets) == 1 else f"_{target}"
+            print(f"Round {round_num} best model{f' for {target}' if suffix else ''}: {best_model_name}")
+            print(
+                f"RMSE: {results[best_model_name]['rmse' + suffix]:.4f}, "
+                f"R²: {results[best_model_name]['r2' + suffix]:.4f}"
+            )
+            if "latency_single_ms" in results[best_model_name]:
+                print(
+                    f"Latency: {results[best_model_name]['latency_single_ms']:.3f} ms/row, "
+                    f"{results[best_model_name]['latency_batch_ms']:.1f} ms/{LATENCY_BATCH_ROWS} rows, "
+                    f"size: {results[best_model_name]['artifact_mb']:.2f} MB"
+                )
+        self._report_memory(round_num, evaluation_peak)
         
         return winners
     
+    def _add_costs(self, results, X, y, round_key):
+        """
+        Measures the costs of every model in results on the first fold, one
+        model at a time, and adds them to its results. Costs found in the
+        experiment store are not measured again.
+        """
+        _, folds, _, _ = self._evaluation_setup(X)
+        train_idx, test_idx = folds[0]
+        for name, metrics in tqdm(results.items(), desc="Measuring costs"):
+            key = fingerprint(round_key, train_idx, test_idx, metrics["model"], "costs")
+            costs = self.store.get(key) if self.store is not None else None
+            if costs is None:
+                try:
+                    costs = _candidate_costs(
+                        clone(metrics["model"]), X, y, train_idx, test_idx, self.threads_per_model
+                    )
+                except Exception as e:
+                    print(f"Warning: could not measure the costs of {name}: {e}")
+                    continue
+                if self.store is not None:
+                    self.store.put(key, "tournament_costs", name, costs)
+            metrics.update(costs)
+    
+    def _report_memory(self, round_num, evaluation_peak=None):
+        """
+        Records and prints the round's peak RSS of this process and its
+        workers; evaluation_peak is this process's peak before it was reset
+        for cost measurement.
+        """
+        workers = [peak for peak in map(_peak_rss_mb, _child_pids()) if peak is not None]
+        main_peak = max(
+            (peak for peak in (evaluation_peak, _peak_rss_mb()) if peak is not None), default=None
+        )
+        memory = {
+            "main_peak_mb": main_peak,
+            "worker_peak_mb": max(workers, default=None),
+            "workers_total_peak_mb": sum(workers) if workers else None,
+        }
+        self.round_memory[f"round_{round_num}"] = memory
+        if memory["main_peak_mb"] is None:
+            return
+        line = f"Peak RSS: {memory['main_peak_mb']:.0f} MB"
+        if workers:
+            line += (
+                f", workers {memory['worker_peak_mb']:.0f} MB max / "
+                f"{memory['workers_total_peak_mb']:.0f} MB total ({len(workers)} child processes)"
+            )
+        print(line)
+    
+    def _target_keys(self):
+        """(target, results key of its primary_metric) for every target"""
+        if len(self.targets) == 1:
+            return [(self.target_column, self.primary_metric)]
+        return [(target, f"{self.primary_metric}_{target}") for target in self.targets]
+    
+    def _error(self, metrics, key=None):
+        """primary_metric (or the given per-target key) as an error (lower is better)"""
+        value = metrics[key or self.primary_metric]
+        return -value if self.primary_metric in HIGHER_IS_BETTER else value
+    
+    def _select_winner(self, ranked, results, key=None):
+        """Round winner under selection_policy; ranked is ordered by primary_metric"""
+        if self.selection_policy == "accuracy":
+            return ranked[0]
+        best_error = self._error(results[ranked[0]], key)
+        allowed = best_error + self.selection_tolerance * abs(best_error)
+        close = [name for name in ranked if self._error(results[name], key) <= allowed]
+        return min(close, key=lambda name: results[name].get("latency_single_ms", np.inf))
+    
+    def _evaluation_setup(self, X):
+        """Metrics to score, CV folds, worker count and threads per fit"""
+        metric_names = list(dict.fromkeys(["rmse", "r2", *self.metrics, self.primary_metric]))
+        folds = list(KFold(n_splits=self.cv_folds).split(X))
+        workers = joblib.effective_n_jobs(self.n_jobs)
+        threads = self.threads_per_model
+        if threads is None and workers > 1:
+            threads = max(1, (os.cpu_count() or 1) // workers)
+        return metric_names, folds, workers, threads
+
+    def _fold_keys(self, models, folds, metric_names, round_key):
+        """Experiment store key of every (name, fold index)"""
+        return {
+            # Multi-target scores are per-target means since "target_mean";
+            # older stored scores are not reused
+            (name, fold): fingerprint(
+                round_key, train_idx, test_idx, model, sorted(metric_names),
+                *(["target_mean"] if len(self.targets) > 1 else []),
+            )
+            for name, model in models.items()
+            for fold, (train_idx, test_idx) in enumerate(folds)
+        }
+
+    def _stored_scores(self, fold_keys):
+        """Fold scores already in the experiment store: {(name, fold): scores}"""
+        if self.store is None:
+            return {}
+        stored = {}
+        for task, key in fold_keys.items():
+            scores = self.store.get(key)
+            if scores is not None:
+                stored[task] = scores
+        if stored:
+            print(f"Reusing {len(stored)} of {len(fold_keys)} fold results from {self.store.path}")
+        return stored
+
+    def _record_scores(self, fold_keys, task, scores):
+        if self.store is not None:
+            self.store.put(fold_keys[task], "tournament_fold", task[0], scores)
+
+    def _summarize(self, models, folds, fold_scores, metric_names, failed):
+        """Averages fold scores into {name: {"model": estimator, <metric>: score}}"""
+        results = {}
+        for name, model in models.items():
+            if name in failed:
+                print(f"Error with model {name}: {failed[name]}")
+                continue
+            if any((name, fold) not in fold_scores for fold in range(len(folds))):
+                continue
+            results[name] = {"model": model}
+            for metric in metric_names:
+                results[name][metric] = np.mean(
+                    [fold_scores[(name, fold)][metric] for fold in range(len(folds))]
+                )
+            if len(self.targets) > 1:
+                for j, target in enumerate(self.targets):
+                    for metric in metric_names:
+                        results[name][f"{metric}_{target}"] = np.mean(
+                            [fold_scores[(name, fold)]["targets"][j][metric] for fold in range(len(folds))]
+                        )
+        return results
+
+    def _evaluate_candidates(self, models, X, y, round_key):
+        """
+        Cross-validates every model on (X, y). Each fold is fitted once and
+        scored on every metric; fold fits are independent tasks, run in a
+        process pool when n_jobs allows. Folds found in the experiment store
+        are not refitted, and new ones are stored as soon as they finish.
+        Returns {name: {"model": estimator, <metric>: mean fold score}}.
+        """
+        metric_names, folds, workers, threads = self._evaluation_setup(X)
+        fold_keys = self._fold_keys(models, folds, metric_names, round_key)
+        fold_scores = self._stored_scores(fold_keys)
+        pending = [task for task in fold_keys if task not in fold_scores]
+
+        shared_dir = None
+        if workers > 1 and pending:
+            shared_dir = tempfile.mkdtemp(prefix="tournament_")
+            shared = _share_arrays(shared_dir, X=X, y=y)
+            X, y = shared["X"], shared["y"]
+        failed = {}
+        try:
+            # Unfitted clones: a fitted model may hold references to the
+            # previous round's arrays (KNN keeps its training data)
+            tasks = [
+                (name, clone(models[name]), X, y, *folds[fold], metric_names, threads)
+                for name, fold in pending
+            ]
+            if workers > 1 and tasks:
+                print(f"Running {len(tasks)} fits on {workers} workers, {threads} thread(s) each")
+                outcomes = joblib.Parallel(n_jobs=workers, return_as="generator")(
+                    joblib.delayed(_fit_candidate)(*task) for task in tasks
+                )
+            else:
+                outcomes = (_fit_candidate(*task) for task in tqdm(tasks))
+            for task, (name, scores, error) in zip(pending, outcomes):
+                if error is not None:
+                    failed.setdefault(name, error)
+                else:
+                    fold_scores[task] = scores
+                    self._record_scores(fold_keys, task, scores)
+        finally:
+            if shared_dir is not None:
+                shutil.rmtree(shared_dir, ignore_errors=True)
+
+        return self._summarize(models, folds, fold_scores, metric_names, failed)
+
+    def _evaluate_candidates_budgeted(self, models, X, y, round_key, round_num, round_budget):
+        """
+        Like _evaluate_candidates, but each candidate's missing folds run in
+        its own process under the candidate time limit and the round budget.
+        Candidates that are killed are recorded in self.timed_out and left
+        out of the results.
+        """
+        metric_names, folds, workers, threads = self._evaluation_setup(X)
+        fold_keys = self._fold_keys(models, folds, metric_names, round_key)
+        fold_scores = self._stored_scores(fold_keys)
+        missing = {
+            name: [fold for fold in range(len(folds)) if (name, fold) not in fold_scores]
+            for name in models
+        }
+        names = [name for name in models if missing[name]]
+        outcomes = run_with_time_limit(
+            [
+                (
+                    _cross_validate_candidate,
+                    (
+                        name,
+                        clone(models[name]),
+                        X,
+                        y,
+                        [folds[fold] for fold in missing[name]],
+                        metric_names,
+                        threads,
+                    ),
+                )
+                for name in names
+            ],
+            time_limit=self.candidate_time_limit,
+            budget=round_budget,
+            max_workers=workers,
+        )
+
+        failed = {}
+        for name, outcome in zip(names, outcomes):
+            if isinstance(outcome, TimeLimitExceeded):
+                print(f"Dropped model {name}: {outcome}")
+                self.timed_out.setdefault(f"round_{round_num}", []).append(name)
+            elif isinstance(outcome, Exception):
+                failed[name] = outcome
+            else:
+                for fold, scores in zip(missing[name], outcome):
+                    fold_scores[(name, fold)] = scores
+                    self._record_scores(fold_keys, (name, fold), scores)
+        return self._summarize(models, folds, fold_scores, metric_names, failed)
+
     def run_tournament(self):
         """Run the model tournament to find the best model"""
         print("Starting model tournament...")
         
+        started = time.perf_counter()
         competing_models = self.models
+        self.last_round = 0
         for round_num in range(1, self.tournament_rounds + 1):
-            competing_models = self._tournament_round(competing_models, round_num)
+            round_budget = None
+            if self.time_budget is not None:
+                remaining = self.time_budget - (time.perf_counter() - started)
+                if remaining <= 0 and self.last_round > 0:
+                    print("Time budget exhausted, ending the tournament")
+                    break
+                round_budget = max(remaining, 0) / (self.tournament_rounds - round_num + 1)
+            winners = self._tournament_round(competing_models, round_num, round_budget)
+            if not winners:
+                # Every candidate failed or timed out: keep the previous round's result
+                break
+            competing_models = winners
+            self.last_round = round_num
             
             # If only one model left or no models left, stop early
             if len(competing_models) <= 1:
                 break
+        
+        if self.last_round == 0:
+            raise RuntimeError("No model finished the first tournament round")
                 
         # Get the final winner
-        if len(competing_models) == 1:
+        if len(self.targets) > 1:
+            # Each target's best model of the last round, behind one predict call
+            self.target_winners = self.round_winners[-1]
+            last_round = self.model_history[f"round_{self.last_round}"]
+            self.winner_name = ", ".join(
+                f"{target}: {name}" for target, name in self.target_winners.items()
+            )
+            self.winner_model = MultiTargetModel(
+                self.targets,
+                {name: clone(last_round[name]["model"]) for name in set(self.target_winners.values())},
+                [self.target_winners[target] for target in self.targets],
+            )
+        elif len(competing_models) == 1:
             self.winner_name = list(competing_models.keys())[0]
             self.winner_model = list(competing_models.values())[0]
         else:
             # This should not happen normally but just in case
             self.winner_name = self.round_winners[-1]
-            self.winner_model = self.model_history[f"round_{self.tournament_rounds}"][self.winner_name]["model"]
+            self.winner_model = self.model_history[f"round_{self.last_round}"][self.winner_name]["model"]
             
+        self.artifacts.flush()
         print(f"\nTournament completed! Winner: {self.winner_name}")
         return self.winner_name, self.winner_model
     
@@ -238,8 +863,8 @@ class TournamentModelSelection:
         """Train the winning model on the full training dataset"""
         print(f"\nTraining final {self.winner_name} model on full dataset...")
         
-        # Clone the winning model if needed (to ensure fresh training)
-        self.final_model = joblib.load(f"models/round{self.tournament_rounds}_{self.winner_name}.joblib")
+        # Clone the winning model (to ensure fresh training)
+        self.final_model = clone(self.winner_model)
         
         # Train on full training set
         self.final_model.fit(self.X_train_scaled, self.y_train)
@@ -248,22 +873,78 @@ class TournamentModelSelection:
         y_pred = self.final_model.predict(self.X_test_scaled)
         test_rmse = np.sqrt(mean_squared_error(self.y_test, y_pred))
         test_r2 = r2_score(self.y_test, y_pred)
+        test_metrics = {"rmse": test_rmse, "r2": test_r2}
         
         print("Final model performance on test set:")
+        if len(self.targets) > 1:
+            y_test = np.asarray(self.y_test)
+            for j, target in enumerate(self.targets):
+                test_metrics[f"rmse_{target}"] = np.sqrt(mean_squared_error(y_test[:, j], y_pred[:, j]))
+                test_metrics[f"r2_{target}"] = r2_score(y_test[:, j], y_pred[:, j])
+                print(
+                    f"{target}: RMSE: {test_metrics[f'rmse_{target}']:.4f}, "
+                    f"R²: {test_metrics[f'r2_{target}']:.4f}"
+                )
+            # Averages of the per-target scores, as in the tournament
+            test_rmse = test_metrics["rmse"] = float(
+                np.mean([test_metrics[f"rmse_{target}"] for target in self.targets])
+            )
+            print("Averaged over targets:")
         print(f"RMSE: {test_rmse:.4f}")
         print(f"R²: {test_r2:.4f}")
         
         # Save the final model
-        joblib.dump(self.final_model, "models/final_model.joblib")
+        self.artifacts.submit(self.final_model, "models/final_model.joblib")
         
         # Save the scaler for preprocessing new data
-        joblib.dump(self.scaler, "models/scaler.joblib")
+        self.artifacts.submit(self.scaler, "models/scaler.joblib")
+        
+        # Everything the server needs in one file (served in preference to the two above)
+        write_bundle(
+            "models/final_model.bundle.joblib",
+            self.final_model,
+            self.scaler,
+            self.feature_names,
+            target=self.target_column,
+            name=self.winner_name,
+            metrics=test_metrics,
+            rolling=self.rolling.config() if self.rolling is not None else None,
+        )
+        self.artifacts.flush()
         
         return self.final_model, test_rmse, test_r2
     
+    def compact_final_model(self, max_rmse_increase=0.01, max_mape_increase=0.01):
+        """
+        Saves a compacted copy of a tree-ensemble final model as
+        final_model_compact (see model_compaction.py) and returns it, or
+        None when the winner is not a tree ensemble or cannot shrink within
+        the accuracy limits.
+        """
+        try:
+            compact, report = compact_model(
+                self.final_model, self.X_test_scaled, self.y_test,
+                max_rmse_increase=max_rmse_increase,
+                max_mape_increase=max_mape_increase,
+                random_state=self.random_state,
+            )
+        except ValueError as e:
+            print(f"Skipping compaction: {e}")
+            return None
+        print_report(report)
+        if compact is self.final_model:
+            print("No compaction step stayed within the accuracy limits.")
+            return None
+        save_compacted(
+            compact, report, "final_model", self.target_column, "scaler.joblib",
+            self.feature_names,
+        )
+        return compact
+    
     def visualize_results(self):
         """Visualize tournament results"""
-        plt.figure(figsize=(14, 8))
+        panels = 3 if self.measure_costs else 2
+        plt.figure(figsize=(7 * panels, 8))
         
         # Plot RMSE across rounds for each model that made it to the final round
         sns.set_style("whitegrid")
@@ -278,23 +959,40 @@ class TournamentModelSelection:
                         "Round": round_num,
                         "Model": model_name,
                         "RMSE": metrics["rmse"],
-                        "R²": metrics["r2"]
+                        "R²": metrics["r2"],
+                        **{cost: metrics.get(cost, np.nan) for cost in COST_NAMES},
+                        "Pareto": metrics.get("pareto", False),
                     })
         
         results_df = pd.DataFrame(round_results)
         
         # Plot RMSE
-        plt.subplot(1, 2, 1)
+        plt.subplot(1, panels, 1)
         sns.lineplot(data=results_df, x="Round", y="RMSE", hue="Model")
         plt.title("RMSE Across Tournament Rounds")
         plt.ylabel("RMSE (lower is better)")
         
         # Plot R²
-        plt.subplot(1, 2, 2)
+        plt.subplot(1, panels, 2)
         sns.lineplot(data=results_df, x="Round", y="R²", hue="Model")
         plt.title("R² Across Tournament Rounds")
         plt.ylabel("R² (higher is better)")
         
+        # Plot accuracy against serving cost in the first round, where every
+        # model competed (marker size: artifact size)
+        first_round = results_df[results_df["Round"] == results_df["Round"].min()]
+        if self.measure_costs:
+            plt.subplot(1, panels, 3)
+            sns.scatterplot(
+                data=first_round, x="latency_single_ms", y="RMSE", size="artifact_mb",
+                hue="Pareto", sizes=(30, 400),
+            )
+            for _, row in first_round.dropna(subset=["latency_single_ms"]).iterrows():
+                plt.annotate(row["Model"], (row["latency_single_ms"], row["RMSE"]), fontsize=7)
+            plt.xscale("log")
+            plt.title("RMSE vs Single-Row Latency (Round 1)")
+            plt.xlabel("Predict latency per row (ms, log scale)")
+        
         plt.tight_layout()
         plt.savefig("tournament_results.png")
         plt.show()
@@ -303,6 +1001,14 @@ class TournamentModelSelection:
         print(f"Tournament winners by round:")
         for i, winner in enumerate(self.round_winners):
             print(f"Round {i+1}: {winner}")
+        
+        if self.measure_costs:
+            print(f"\nModel costs (round 1, selection policy: {self.selection_policy}):")
+            print(
+                first_round.set_index("Model")[["RMSE", "R²", *COST_NAMES, "Pareto"]]
+                .sort_values("RMSE")
+                .to_string(float_format=lambda value: f"{value:.4g}")
+            )
 
 
 # Usage example
@@ -312,7 +1018,8 @@ if __name__ == "__main__":
         target_column="co2",
         tournament_rounds=3,
         tournament_data_fraction=0.3,
-        primary_metric="rmse"
+        primary_metric="rmse",
+        n_jobs=-1,
     )
     
     # Run the tournament to find the best model
@@ -321,6 +1028,9 @@ if __name__ == "__main__":
     # Train the winning model on the full dataset
     final_model, test_rmse, test_r2 = tournament.train_final_model()
     
+    # Save a smaller copy for serving if the winner is a tree ensemble
+    tournament.compact_final_model()
+    
     # Visualize results
     tournament.visualize_results()
 
@@ -0,0 +1,455 @@
+# tree_engine.py
+# Array-backed inference for fitted tree ensembles.
+# RandomForestRegressor, GradientBoostingRegressor and XGBRegressor winners
+# are flattened into one set of contiguous node arrays at load time and
+# evaluated for a whole batch with vectorized NumPy, which avoids sklearn's
+# per-call dispatch and lets the server drop the unpickled estimator objects.
+import argparse
+import json
+import os
+import pickle
+import threading
+import time
+
+import joblib
+import numpy as np
+from sklearn.ensemble import GradientBoostingRegressor, RandomForestRegressor
+
+try:
+    import xgboost as xgb
+except ImportError:  # xgboost is optional for serving
+    xgb = None
+
+# Rows evaluated per traversal pass; bounds the (rows x trees) index matrix
+CHUNK_ROWS = 4096
+
+
+class CompiledTreeEnsemble:
+    """
+    A tree ensemble stored as flat node arrays.
+
+    Every tree's nodes live in the same arrays at a per-tree offset. Leaves
+    point at themselves, so walking a fixed number of levels leaves each
+    (row, tree) cursor on its leaf. The prediction is
+    ``offset + scale * reduce(leaf values)`` where the reduction is a sum,
+    which covers bagging (scale = 1 / n_trees) and boosting
+    (scale = learning rate) alike. With float32_sum the reduction starts at
+    offset and adds the leaves tree by tree in float32, as XGBoost does, so
+    predictions match it bit for bit instead of to float32 rounding.
+    """
+
+    # Artifacts compiled before float32_sum existed sum in float64
+    float32_sum = False
+
+    def __init__(
+        self,
+        feature,
+        threshold,
+        left,
+        right,
+        missing_left,
+        value,
+        roots,
+        max_depth,
+        scale=1.0,
+        offset=0.0,
+        strict=False,
+        float32_inputs=True,
+        allow_nan=True,
+        allow_inf=True,
+        n_features=None,
+        source=None,
+        float32_sum=False,
+    ):
+        if float32_sum and scale != 1.0:
+            raise ValueError("float32_sum requires scale=1")
+        self.feature = np.ascontiguousarray(feature, dtype=np.int32)
+        self.threshold = np.ascontiguousarray(threshold, dtype=np.float64)
+        self.left = np.ascontiguousarray(left, dtype=np.int32)
+        self.right = np.ascontiguousarray(right, dtype=np.int32)
+        self.missing_left = np.ascontiguousarray(missing_left, dtype=bool)
+        self.value = np.ascontiguousarray(value, dtype=np.float64)
+        self.roots = np.ascontiguousarray(roots, dtype=np.int32)
+        self.max_depth = int(max_depth)
+        self.scale = float(scale)
+        self.offset = float(offset)
+        # XGBoost sends x < threshold left, sklearn sends x <= threshold left
+        self.strict = bool(strict)
+        # Both libraries compare features after casting them to float32
+        self.float32_inputs = bool(float32_inputs)
+        # Mirror the original estimator's input validation
+        self.allow_nan = bool(allow_nan)
+        self.allow_inf = bool(allow_inf)
+        self.n_features = n_features
+        self.source = source
+        self.n_features_in_ = n_features
+        self.float32_sum = bool(float32_sum)
+
+    def __setstate__(self, state):
+        # joblib's mmap_mode hands back np.memmap objects; plain ndarray views
+        # over the same pages keep fancy indexing on the fast path
+        self.__dict__.update(
+            {
+                key: np.asarray(value) if isinstance(value, np.ndarray) else value
+                for key, value in state.items()
+            }
+        )
+
+    # --- Construction ---
+    @classmethod
+    def from_model(cls, model):
+        """Compiles a fitted ensemble, raising TypeError if it is not supported"""
+        if isinstance(model, RandomForestRegressor):
+            trees = [est.tree_ for est in model.estimators_]
+            return cls._from_sklearn_trees(
+                trees,
+                scale=1.0 / len(model.estimators_),
+                offset=0.0,
+                allow_nan=all(hasattr(tree, "missing_go_to_left") for tree in trees),
+                n_features=model.n_features_in_,
+                source=type(model).__name__,
+            )
+        if isinstance(model, GradientBoostingRegressor):
+            if model.init_ == "zero":
+                offset = 0.0
+            else:
+                offset = float(
+                    np.ravel(model.init_.predict(np.zeros((1, model.n_features_in_))))[0]
+                )
+            return cls._from_sklearn_trees(
+                [est.tree_ for est in model.estimators_[:, 0]],
+                scale=model.learning_rate,
+                offset=offset,
+                allow_nan=False,
+                n_features=model.n_features_in_,
+                source=type(model).__name__,
+            )
+        if xgb is not None and isinstance(model, xgb.XGBRegressor):
+            return cls._from_xgboost(model.get_booster(), source=type(model).__name__)
+        raise TypeError(f"Cannot compile model of type {type(model).__name__}")
+
+    @classmethod
+    def _from_sklearn_trees(cls, trees, scale, offset, allow_nan, n_features, source):
+        """Concatenates sklearn Tree objects into flat arrays"""
+        if any(tree.n_outputs != 1 for tree in trees):
+            raise TypeError("Only single-output tree ensembles can be compiled")
+        sizes = [tree.node_count for tree in trees]
+        roots = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+        feature, threshold, left, right, missing_left, value = [], [], [], [], [], []
+        for root, tree in zip(roots, trees):
+            node_ids = np.arange(tree.node_count) + root
+            is_leaf = tree.children_left == -1
+            feature.append(np.where(is_leaf, 0, tree.feature))
+            threshold.append(np.where(is_leaf, 0.0, tree.threshold))
+            left.append(np.where(is_leaf, node_ids, tree.children_left + root))
+            right.append(np.where(is_leaf, node_ids, tree.children_right + root))
+            missing = getattr(tree, "missing_go_to_left", None)
+            missing_left.append(
+                np.zeros(tree.node_count, dtype=bool) if missing is None else missing.astype(bool)
+            )
+            value.append(tree.value[:, 0, 0])
+        return cls(
+            np.concatenate(feature),
+            np.concatenate(threshold),
+            np.concatenate(left),
+            np.concatenate(right),
+            np.concatenate(missing_left),
+            np.concatenate(value),
+            roots,
+            max(tree.max_depth for tree in trees),
+            scale=scale,
+            offset=offset,
+            strict=False,
+            allow_nan=allow_nan,
+            allow_inf=False,
+            n_features=n_features,
+            source=source,
+        )
+
+    @classmethod
+    def _from_xgboost(cls, booster, source):
+        """Reads the trees from an XGBoost booster's JSON model"""
+        learner = json.loads(booster.save_raw("json"))["learner"]
+        objective = learner["objective"]["name"]
+        if objective not in ("reg:squarederror", "reg:absoluteerror", "reg:pseudohubererror"):
+            raise TypeError(f"Cannot compile XGBoost objective {objective}")
+        gbm = learner["gradient_booster"]
+        if gbm["name"] != "gbtree":
+            raise TypeError(f"Cannot compile XGBoost booster {gbm['name']}")
+        model_param = learner["learner_model_param"]
+        if int(model_param.get("num_target", "1")) > 1:
+            raise TypeError("Only single-output tree ensembles can be compiled")
+        base_score = float(model_param["base_score"].strip("[]"))
+
+        trees = gbm["model"]["trees"]
+        sizes = [len(tree["left_children"]) for tree in trees]
+        roots = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.int64)
+        feature, threshold, left, right, missing_left, value = [], [], [], [], [], []
+        max_depth = 0
+        for root, tree in zip(roots, trees):
+            if any(tree.get("split_type", [])):
+                raise TypeError("Categorical XGBoost splits are not supported")
+            tree_left = np.asarray(tree["left_children"], dtype=np.int64)
+            tree_right = np.asarray(tree["right_children"], dtype=np.int64)
+            conditions = np.asarray(tree["split_conditions"], dtype=np.float32)
+            node_ids = np.arange(len(tree_left)) + root
+            is_leaf = tree_left == -1
+            feature.append(np.where(is_leaf, 0, tree["split_indices"]))
+            threshold.append(np.where(is_leaf, 0.0, conditions).astype(np.float64))
+            left.append(np.where(is_leaf, node_ids, tree_left + root))
+            right.append(np.where(is_leaf, node_ids, tree_right + root))
+            missing_left.append(np.asarray(tree["default_left"], dtype=bool))
+            value.append(np.where(is_leaf, conditions, 0.0).astype(np.float64))
+            max_depth = max(max_depth, _depth(tree_left, tree_right))
+        return cls(
+            np.concatenate(feature),
+            np.concatenate(threshold),
+            np.concatenate(left),
+            np.concatenate(right),
+            np.concatenate(missing_left),
+            np.concatenate(value),
+            roots,
+            max_depth,
+            scale=1.0,
+            offset=base_score,
+            strict=True,
+            n_features=int(model_param["num_feature"]),
+            source=source,
+            float32_sum=True,
+        )
+
+    # --- Inference ---
+    def predict(self, X):
+        """Predicts every row of X; accepts anything np.asarray understands"""
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim != 2:
+            raise ValueError(f"Expected 2D input, got {X.ndim}D")
+        if self.n_features is not None and X.shape[1] != self.n_features:
+            raise ValueError(
+                f"X has {X.shape[1]} features, but the model expects {self.n_features}"
+            )
+        if not self.allow_inf and np.isinf(X).any():
+            raise ValueError(
+                "Input X contains infinity or a value too large for dtype('float64')."
+            )
+        if not self.allow_nan and np.isnan(X).any():
+            raise ValueError("Input X contains NaN.")
+        if self.float32_inputs:
+            X = X.astype(np.float32).astype(np.float64)
+        if len(X) <= CHUNK_ROWS:
+            return self._predict_chunk(X)
+        return np.concatenate(
+            [
+                self._predict_chunk(X[start:start + CHUNK_ROWS])
+                for start in range(0, len(X), CHUNK_ROWS)
+            ]
+        )
+
+    def _predict_chunk(self, X):
+        """Walks all trees for all rows of X level by level"""
+        rows = np.arange(len(X))[:, None]
+        nodes = np.broadcast_to(self.roots, (len(X), len(self.roots)))
+        for _ in range(self.max_depth):
+            x = X[rows, self.feature[nodes]]
+            threshold = self.threshold[nodes]
+            go_left = x < threshold if self.strict else x <= threshold
+            missing = np.isnan(x)
+            if missing.any():
+                go_left = np.where(missing, self.missing_left[nodes], go_left)
+            next_nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+            if np.array_equal(next_nodes, nodes):
+                break
+            nodes = next_nodes
+        if self.float32_sum:
+            # XGBoost: float32 running sum from the base score, in tree order
+            # (cumsum accumulates sequentially, unlike the pairwise sum)
+            leaves = self.value[nodes].astype(np.float32)
+            leaves[:, 0] += np.float32(self.offset)
+            return np.cumsum(leaves, axis=1, dtype=np.float32)[:, -1].astype(np.float64)
+        return self.value[nodes].sum(axis=1) * self.scale + self.offset
+
+    # --- Introspection ---
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def nbytes(self):
+        """Memory held by the node arrays"""
+        return sum(
+            array.nbytes
+            for array in (
+                self.feature,
+                self.threshold,
+                self.left,
+                self.right,
+                self.missing_left,
+                self.value,
+                self.roots,
+            )
+        )
+
+    def verify(self, model, X, rtol=1e-6, atol=1e-6):
+        """
+        Checks the compiled predictions against model.predict on X.
+        Returns the largest absolute difference, raising ValueError if any
+        prediction is outside the tolerance.
+        """
+        expected = np.asarray(model.predict(X), dtype=np.float64)
+        actual = self.predict(X)
+        max_diff = float(np.max(np.abs(expected - actual))) if len(X) else 0.0
+        if not np.allclose(expected, actual, rtol=rtol, atol=atol):
+            raise ValueError(
+                f"Compiled {self.source} predictions differ from the original model "
+                f"(max abs diff {max_diff:.3g})"
+            )
+        return max_diff
+
+
+def _depth(left, right):
+    """Depth of a tree given its child arrays, with -1 marking leaves"""
+    depth = np.zeros(len(left), dtype=np.int64)
+    # XGBoost numbers children after their parents, so one forward pass works
+    for node in range(len(left)):
+        if left[node] != -1:
+            depth[left[node]] = depth[node] + 1
+            depth[right[node]] = depth[node] + 1
+    return int(depth.max())
+
+
+class _ReloadedEstimator:
+    """Stands in for an estimator dropped after compilation; load() brings it back on first use"""
+
+    def __init__(self, load, n_features):
+        self.load = load
+        self.n_features_in_ = n_features
+        self._model = None
+        self._lock = threading.Lock()
+
+    def predict(self, X):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = self.load()
+                    print(f"Reloaded {type(self._model).__name__} for a batch of {len(X)} rows")
+        return self._model.predict(X)
+
+
+class HybridTreePredictor:
+    """
+    Routes small batches to the compiled ensemble and large ones to the
+    original estimator, whose compiled Cython loops win past a few hundred rows.
+    """
+
+    def __init__(self, model, engine, max_rows):
+        self.model = model
+        self.engine = engine
+        self.max_rows = max_rows
+        self.n_features_in_ = engine.n_features_in_
+
+    def predict(self, X):
+        if len(X) <= self.max_rows:
+            return self.engine.predict(X)
+        return self.model.predict(X)
+
+
+def compile_model(model, X_check, rtol=1e-6, atol=1e-6):
+    """
+    Compiles model and verifies it on X_check.
+    Returns the compiled ensemble, or None if the model is not supported.
+    """
+    try:
+        engine = CompiledTreeEnsemble.from_model(model)
+    except TypeError:
+        return None
+    engine.verify(model, X_check, rtol=rtol, atol=atol)
+    return engine
+
+
+def select_engine(model, mode, max_rows=128, n_check=256, random_state=0, load=None):
+    """
+    Returns the predictor to serve for model under one of the engine modes:
+    "sklearn" keeps the estimator, "compiled" replaces it with the verified
+    node arrays (freeing the estimator), and "auto" uses the node arrays for
+    batches up to max_rows. Unsupported models and failed checks fall back
+    to the estimator.
+
+    "auto" needs the estimator for larger batches, so it holds both the
+    estimator and the node arrays, unless load (a callable returning the
+    estimator again, e.g. from its file) is given: then the estimator is
+    freed and only reloaded for the first batch above max_rows.
+    """
+    if mode == "sklearn" or model is None:
+        return model
+    if mode not in ("compiled", "auto"):
+        raise ValueError(f"Unknown tree engine mode: {mode}")
+    n_features = getattr(model, "n_features_in_", None)
+    if n_features is None:
+        return model
+    # Inputs are standardized, so draw check rows from a standard normal
+    X_check = np.random.default_rng(random_state).standard_normal((n_check, n_features))
+    try:
+        engine = compile_model(model, X_check)
+    except ValueError as e:
+        print(
+            f"Warning: tree engine '{mode}' disabled, serving the original "
+            f"{type(model).__name__} instead: {e}"
+        )
+        return model
+    if engine is None:
+        return model
+    print(
+        f"Compiled {engine.n_trees} {engine.source} trees "
+        f"({engine.nbytes / 1e6:.2f} MB of node arrays), engine mode '{mode}'"
+    )
+    if mode == "compiled":
+        return engine
+    if load is not None:
+        model = _ReloadedEstimator(load, n_features)
+    return HybridTreePredictor(model, engine, max_rows)
+
+
+# --- Command-Line Check ---
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compile a saved tree ensemble and compare it with the original."
+    )
+    parser.add_argument(
+        "--model-path",
+        type=str,
+        default=os.path.join("models", "final_model.joblib"),
+        help="Path to a saved RandomForest/GradientBoosting/XGBoost regressor.",
+    )
+    parser.add_argument(
+        "--rows",
+        type=int,
+        default=1000,
+        help="Number of random standardized rows used for checking and timing.",
+    )
+    args = parser.parse_args()
+
+    model = joblib.load(args.model_path)
+    rng = np.random.default_rng(0)
+    X = rng.standard_normal((args.rows, model.n_features_in_))
+
+    engine = CompiledTreeEnsemble.from_model(model)
+    max_diff = engine.verify(model, X)
+    print(f"Compiled {engine.n_trees} trees from {engine.source}, max abs diff {max_diff:.3g}")
+    print(f"Pickled model size: {len(pickle.dumps(model)) / 1e6:.2f} MB")
+    print(f"Compiled node arrays: {engine.nbytes / 1e6:.2f} MB")
+
+    for label, batch in (("single row", X[:1]), (f"{args.rows} rows", X)):
+        for name, predictor in (("sklearn", model), ("compiled", engine)):
+            timings = []
+            for _ in range(50):
+                start = time.perf_counter()
+                predictor.predict(batch)
+                timings.append(time.perf_counter() - start)
+            print(
+                f"{label:>12} {name:>9}: p50 {np.percentile(timings, 50) * 1e3:.3f} ms  "
+                f"p99 {np.percentile(timings, 99) * 1e3:.3f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
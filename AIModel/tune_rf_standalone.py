@@ -1,9 +1,9 @@
 # tune_rf_standalone.py
 import argparse
+import json
 import os
 import joblib
 import numpy as np
-import pandas as pd
 from scipy.stats import randint
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.metrics import (
@@ -12,9 +12,18 @@ from sklearn.metrics import (
     mean_squared_error,
     r2_score,
 )
-from sklearn.model_selection import RandomizedSearchCV, train_test_split
+from sklearn.base import clone
+from sklearn.model_selection import GridSearchCV, ParameterSampler, train_test_split
 from sklearn.preprocessing import StandardScaler
 
+from cost_aware_search import CostAwareSearch
+from dataset_cache import load_csv
+from experiment_store import DEFAULT_STORE_PATH, ArtifactWriter, ExperimentStore, fingerprint
+from model_bundle import BUNDLE_SUFFIX, write_bundle
+from model_compaction import compact_model, print_report, save_compacted
+from multi_target import MultiTargetModel
+from warm_start_search import WarmStartForestSearch
+
 # --- Configuration via Command-Line Arguments ---
 parser = argparse.ArgumentParser(
     description="Tune RandomForestRegressor using RandomizedSearchCV (Standalone)."
@@ -28,8 +37,13 @@ parser.add_argument(
 parser.add_argument(
     "--target-column",
     type=str,
+    nargs="+",
     required=True,
-    help="Name of the target variable column (e.g., 'CO', 'NOX').",
+    help=(
+        "Name of the target variable column (e.g., 'CO', 'NOX'). Several "
+        "targets (e.g. CO NOX) are tuned together as one multi-output forest "
+        "on a shared split, scaler and search, with metrics reported per target."
+    ),
 )
 # Optional: Load a pre-existing scaler if you ran the previous script
 parser.add_argument(
@@ -57,7 +71,10 @@ parser.add_argument(
     "--n-iter",
     type=int,
     default=50,
-    help="Number of parameter settings sampled by RandomizedSearchCV.",
+    help=(
+        "Number of parameter settings sampled by RandomizedSearchCV (with "
+        "--search warm-start: candidates, as n_iter / tree counts configurations)."
+    ),
 )
 parser.add_argument(
     "--cv-folds",
@@ -72,13 +89,111 @@ parser.add_argument(
     help="Target 'accuracy' (used to derive MAPE threshold).",
 )
 
+parser.add_argument(
+    "--search",
+    choices=["randomized", "warm-start"],
+    default="randomized",
+    help=(
+        "'warm-start' grows one forest per group of candidates that differ only "
+        "in n_estimators instead of fitting every candidate from scratch."
+    ),
+)
+parser.add_argument(
+    "--halving",
+    action="store_true",
+    help="With --search warm-start: drop weak candidates early on fewer rows and trees.",
+)
+parser.add_argument(
+    "--halving-factor",
+    type=int,
+    default=3,
+    help="Fraction (1/factor) of candidates kept after each halving rung.",
+)
+parser.add_argument(
+    "--tree-checkpoints",
+    type=lambda text: [int(size) for size in text.split(",")],
+    default=[100, 200, 300, 400],
+    help=(
+        "With --search warm-start: comma-separated tree counts at which every "
+        "sampled configuration is scored while its forest grows."
+    ),
+)
+parser.add_argument(
+    "--time-budget",
+    type=float,
+    default=None,
+    help=(
+        "Seconds for the whole search: trials run cheapest-first by learned "
+        "cost, trials that would overrun are skipped or killed, and the search "
+        "stops once the accuracy goal is met."
+    ),
+)
+parser.add_argument(
+    "--compact",
+    action="store_true",
+    help=(
+        "Also save a compacted copy of the tuned forest (fewer, shallower trees) "
+        "whose test RMSE and MAPE stay within --max-compaction-loss of the original."
+    ),
+)
+parser.add_argument(
+    "--max-compaction-loss",
+    type=float,
+    default=0.01,
+    help="Largest relative RMSE/MAPE increase allowed by --compact (0.01 = 1%%).",
+)
+parser.add_argument(
+    "--store-path",
+    type=str,
+    default=DEFAULT_STORE_PATH,
+    help="SQLite experiment store used to reuse CV scores across runs.",
+)
+parser.add_argument(
+    "--no-store",
+    action="store_true",
+    help="Evaluate every candidate even if its scores are stored.",
+)
+
 args = parser.parse_args()
 
 # --- Constants ---
+TARGETS = args.target_column
+# Used in file names: "CO", or "CO_NOX" when tuning several targets
+TARGET_NAME = "_".join(TARGETS)
 OUTPUT_DIR = "models"
-TUNED_MODEL_FILENAME = f"{OUTPUT_DIR}/tuned_standalone_RandomForest_{args.target_column}.joblib"
+TUNED_MODEL_FILENAME = f"{OUTPUT_DIR}/tuned_standalone_RandomForest_{TARGET_NAME}.joblib"
 # Scaler filename only relevant if we fit a new one
-NEW_SCALER_FILENAME = f"{OUTPUT_DIR}/scaler_standalone_{args.target_column}.joblib"
+NEW_SCALER_FILENAME = f"{OUTPUT_DIR}/scaler_standalone_{TARGET_NAME}.joblib"
+# Feature schema read by the prediction server's model registry
+SCHEMA_FILENAME = f"{OUTPUT_DIR}/tuned_standalone_RandomForest_{TARGET_NAME}.schema.json"
+# Model, scaler, features and metrics in one memory-mappable file
+BUNDLE_FILENAME = f"{OUTPUT_DIR}/tuned_standalone_RandomForest_{TARGET_NAME}{BUNDLE_SUFFIX}"
+# Accuracy vs fit time of --time-budget searches
+TRIALS_FILENAME = f"{OUTPUT_DIR}/rf_trials_{TARGET_NAME}.csv"
+# Candidates evaluated between experiment store writes (bounds lost work on interruption)
+STORE_CHUNK_SIZE = 10
+SCORING = "neg_mean_absolute_percentage_error"  # Optimize for MAPE
+
+
+def _report_trials(trials):
+    """Prints accuracy vs fit time of a budgeted search and saves it as CSV"""
+    trials = trials.assign(cv_mape=-trials["mean_score"]).sort_values("fit_time")
+    print("\n--- Accuracy vs Fit Time ---")
+    print(f"{'fit time':>9}  {'CV MAPE':>8}  {'status':<8} {'pareto':<6} params")
+    for _, trial in trials.iterrows():
+        fit_time = "-" if np.isnan(trial["fit_time"]) else f"{trial['fit_time']:.1f}s"
+        cv_mape = "-" if np.isnan(trial["cv_mape"]) else f"{trial['cv_mape']:.4f}"
+        print(
+            f"{fit_time:>9}  {cv_mape:>8}  {trial['status']:<8} "
+            f"{'*' if trial['pareto'] else '':<6} {trial['params']}"
+        )
+    print(
+        f"Trials: {(trials['status'] == 'ok').sum()} finished, "
+        f"{(trials['status'] == 'killed').sum()} killed, "
+        f"{(trials['status'] == 'skipped').sum()} skipped"
+    )
+    trials.drop(columns=["scores"]).to_csv(TRIALS_FILENAME, index=False)
+    print(f"Trial report saved to {TRIALS_FILENAME}")
 
 
 # --- Main Tuning Logic ---
@@ -89,11 +204,12 @@ def main():
     if not os.path.exists(OUTPUT_DIR):
         os.makedirs(OUTPUT_DIR)
         print(f"Created output directory: {OUTPUT_DIR}")
+    writer = ArtifactWriter()
 
     # 1. Load Data
     print(f"Loading data from: {args.data_path}")
     try:
-        data = pd.read_csv(args.data_path)
+        data = load_csv(args.data_path)
     except FileNotFoundError:
         print(f"Error: Data file not found at {args.data_path}")
         return
@@ -101,24 +217,26 @@ def main():
         print(f"Error loading data: {e}")
         return
 
-    if args.target_column not in data.columns:
-        print(
-            f"Error: Target column '{args.target_column}' not found in the data."
-        )
-        return
+    for target in TARGETS:
+        if target not in data.columns:
+            print(
+                f"Error: Target column '{target}' not found in the data."
+            )
+            return
 
-    if (data[args.target_column] == 0).any():
-        print(
-            f"Warning: Target column '{args.target_column}' contains zero values."
-            " MAPE results might be misleading or infinite."
-        )
+        if (data[target] == 0).any():
+            print(
+                f"Warning: Target column '{target}' contains zero values."
+                " MAPE results might be misleading or infinite."
+            )
     print(f"Data loaded with shape: {data.shape}")
 
     # 2. Prepare Data (Split)
     print("Splitting data...")
     try:
-        X = data.drop(columns=[args.target_column])
-        y = data[args.target_column]
+        X = data.drop(columns=TARGETS)
+        # Several targets are one 2D target for the (natively multi-output) forest
+        y = data[TARGETS[0]] if len(TARGETS) == 1 else data[TARGETS]
         # Use the random_state for consistent splitting if desired
         X_train, X_test, y_train, y_test = train_test_split(
             X,
@@ -134,12 +252,14 @@ def main():
 
     # 3. Scale Features
     scaler = None
+    scaler_path = NEW_SCALER_FILENAME
     if args.scaler_path and os.path.exists(args.scaler_path):
         try:
             print(f"Loading pre-existing scaler from: {args.scaler_path}")
             scaler = joblib.load(args.scaler_path)
             X_train_scaled = scaler.transform(X_train)
             X_test_scaled = scaler.transform(X_test)
+            scaler_path = args.scaler_path
             print("Features scaled using loaded scaler.")
         except Exception as e:
             print(f"Error loading scaler from {args.scaler_path}: {e}")
@@ -152,9 +272,9 @@ def main():
         try:
             X_train_scaled = scaler.fit_transform(X_train)
             X_test_scaled = scaler.transform(X_test)
-            # Save the newly fitted scaler
-            joblib.dump(scaler, NEW_SCALER_FILENAME)
-            print(f"New scaler saved to {NEW_SCALER_FILENAME}")
+            # Save the newly fitted scaler (in the background)
+            writer.submit(scaler, NEW_SCALER_FILENAME)
+            print(f"Saving new scaler to {NEW_SCALER_FILENAME}")
         except Exception as e:
             print(f"Error during feature scaling: {e}")
             return
@@ -174,21 +294,117 @@ def main():
     # We are tuning a RandomForest, so initialize the base estimator here
     base_rf = RandomForestRegressor(random_state=args.random_state)
 
-    try:
-        random_search = RandomizedSearchCV(
-            estimator=base_rf,
-            param_distributions=param_dist,
-            n_iter=args.n_iter,
-            cv=args.cv_folds,
-            scoring="neg_mean_absolute_percentage_error", # Optimize for MAPE
-            n_jobs=-1,
+    # The same candidates RandomizedSearchCV would sample; those already in
+    # the experiment store (same data, folds, scoring and parameters) are reused
+    if args.search == "warm-start" and args.time_budget is None:
+        # Sampled n_estimators almost never repeat a configuration, so sample
+        # the other parameters and score each at every tree count instead:
+        # one growing forest per configuration and fold covers them all
+        tree_counts = sorted(set(args.tree_checkpoints))
+        configurations = ParameterSampler(
+            {name: values for name, values in param_dist.items() if name != "n_estimators"},
+            n_iter=max(1, -(-args.n_iter // len(tree_counts))),
             random_state=args.random_state,
-            verbose=1,
         )
+        candidates = [
+            dict(params, n_estimators=size) for params in configurations for size in tree_counts
+        ]
+        search_label = (
+            f"Warm-Start Search ({len(configurations)} configurations x "
+            f"trees {tree_counts} = {len(candidates)} candidates"
+        )
+    else:
+        candidates = list(
+            ParameterSampler(param_dist, n_iter=args.n_iter, random_state=args.random_state)
+        )
+        search_label = f"Randomized Search (n_iter={args.n_iter}"
+    store = None if args.no_store else ExperimentStore(args.store_path)
+    data_key = fingerprint(X_train_scaled, y_train, args.cv_folds, SCORING)
+    keys = [
+        fingerprint(data_key, clone(base_rf).set_params(**params)) for params in candidates
+    ]
+    fold_scores = {}
+    if store is not None:
+        for index, key in enumerate(keys):
+            stored = store.get(key)
+            if stored is not None:
+                fold_scores[index] = stored
+        print(f"Reusing {len(fold_scores)} of {len(candidates)} candidates from {args.store_path}")
+    missing = [index for index in range(len(candidates)) if index not in fold_scores]
 
-        print(f"Running Randomized Search (n_iter={args.n_iter}, cv={args.cv_folds})...")
-        # Fit the search on the scaled training data
-        random_search.fit(X_train_scaled, y_train)
+    try:
+        print(f"Running {search_label}, cv={args.cv_folds})...")
+        if args.time_budget is not None and missing:
+            goal_score = -(1.0 - args.accuracy_goal)  # Scores are negated MAPE
+            if any(np.mean(scores) >= goal_score for scores in fold_scores.values()):
+                print("A stored candidate already meets the accuracy goal.")
+            else:
+                search = CostAwareSearch(
+                    estimator=base_rf,
+                    candidates=[candidates[index] for index in missing],
+                    time_budget=args.time_budget,
+                    cv=args.cv_folds,
+                    scoring=SCORING,
+                    n_workers=os.cpu_count() or 1,
+                    goal_score=goal_score,
+                )
+                search.fit(X_train_scaled, y_train)
+                for position, trial in search.trials_.iterrows():
+                    if trial["status"] != "ok":
+                        continue
+                    fold_scores[missing[position]] = trial["scores"]
+                    if store is not None:
+                        store.put(keys[missing[position]], "rf_search", TARGET_NAME, trial["scores"])
+                _report_trials(search.trials_)
+            missing = []
+        elif args.search == "warm-start" and missing:
+            search = WarmStartForestSearch(
+                estimator=base_rf,
+                candidates=[candidates[index] for index in missing],
+                cv=args.cv_folds,
+                scoring=SCORING,
+                n_jobs=-1,
+                halving=args.halving,
+                factor=args.halving_factor,
+                random_state=args.random_state,
+                refit=False,
+            )
+            search.fit(X_train_scaled, y_train)
+            for position, index in enumerate(missing):
+                scores = [
+                    float(search.cv_results_[f"split{fold}_test_score"][position])
+                    for fold in range(args.cv_folds)
+                ]
+                if np.isnan(scores).any():
+                    continue  # Eliminated by halving
+                fold_scores[index] = scores
+                if store is not None:
+                    store.put(keys[index], "rf_search", TARGET_NAME, scores)
+            missing = []
+        for start in range(0, len(missing), STORE_CHUNK_SIZE):
+            chunk = missing[start:start + STORE_CHUNK_SIZE]
+            # One grid point per sampled candidate, evaluated in parallel
+            search = GridSearchCV(
+                estimator=base_rf,
+                param_grid=[
+                    {name: [value] for name, value in candidates[index].items()}
+                    for index in chunk
+                ],
+                cv=args.cv_folds,
+                scoring=SCORING,
+                n_jobs=-1,
+                refit=False,
+                verbose=1,
+            )
+            # Fit the search on the scaled training data
+            search.fit(X_train_scaled, y_train)
+            for position, index in enumerate(chunk):
+                fold_scores[index] = [
+                    float(search.cv_results_[f"split{fold}_test_score"][position])
+                    for fold in range(args.cv_folds)
+                ]
+                if store is not None:
+                    store.put(keys[index], "rf_search", TARGET_NAME, fold_scores[index])
 
     except TypeError as e:
         print(f"Error during RandomizedSearchCV setup or fitting: {e}")
@@ -199,45 +415,140 @@ def main():
         print(f"An unexpected error occurred during tuning: {e}")
         return
 
+    mean_scores = [
+        np.mean(fold_scores[index]) if index in fold_scores else np.nan
+        for index in range(len(candidates))
+    ]
+    best_index = int(np.nanargmax(mean_scores))
+    best_params = candidates[best_index]
+
     print("\n--- Tuning Complete ---")
-    print(f"Best parameters found: {random_search.best_params_}")
-    print(f"Best CV MAPE score: {-random_search.best_score_:.4f}") # Negate score
+    print(f"Best parameters found: {best_params}")
+    print(
+        f"Best CV MAPE score{' (averaged over targets)' if len(TARGETS) > 1 else ''}: "
+        f"{-mean_scores[best_index]:.4f}"
+    ) # Negate score
 
     # 6. Evaluate Best Model on Test Set
     print("\n--- Evaluating Best Tuned Model on Test Set ---")
-    best_rf_model = random_search.best_estimator_
+    best_rf_model = clone(base_rf).set_params(**best_params)
+    best_rf_model.set_params(n_jobs=-1)
+    if len(TARGETS) > 1:
+        # One joint forest; the wrapper labels its output columns for the server
+        best_rf_model = MultiTargetModel(
+            TARGETS, {"RandomForest": best_rf_model}, ["RandomForest"] * len(TARGETS)
+        )
+        best_rf_model.fit(X_train_scaled, y_train)
+        best_rf_model.estimators_["RandomForest"].set_params(n_jobs=None)
+    else:
+        best_rf_model.fit(X_train_scaled, y_train)
+        best_rf_model.set_params(n_jobs=None)
+    writer.submit(best_rf_model, TUNED_MODEL_FILENAME)
     y_pred_tuned = best_rf_model.predict(X_test_scaled)
 
-    # Calculate final metrics
-    tuned_rmse = np.sqrt(mean_squared_error(y_test, y_pred_tuned))
-    tuned_r2 = r2_score(y_test, y_pred_tuned)
-    tuned_mae = mean_absolute_error(y_test, y_pred_tuned)
-    tuned_mape = mean_absolute_percentage_error(y_test, y_pred_tuned)
+    # Calculate final metrics (per target when tuning several)
+    if len(TARGETS) == 1:
+        target_pairs = {TARGETS[0]: (y_test, y_pred_tuned)}
+    else:
+        target_pairs = {
+            target: (y_test[target], y_pred_tuned[:, j]) for j, target in enumerate(TARGETS)
+        }
+    tuned_metrics = {}
+    for target, (y_true, y_pred) in target_pairs.items():
+        tuned_metrics[target] = {
+            "rmse": np.sqrt(mean_squared_error(y_true, y_pred)),
+            "mae": mean_absolute_error(y_true, y_pred),
+            "r2": r2_score(y_true, y_pred),
+            "mape": mean_absolute_percentage_error(y_true, y_pred),
+        }
 
-    print(f"RMSE: {tuned_rmse:.4f}")
-    print(f"MAE: {tuned_mae:.4f}")
-    print(f"R²: {tuned_r2:.4f}")
-    print(f"MAPE: {tuned_mape:.4f} ({tuned_mape * 100:.2f}%)")
+    for target, tuned in tuned_metrics.items():
+        if len(TARGETS) > 1:
+            print(f"-- {target} --")
+        print(f"RMSE: {tuned['rmse']:.4f}")
+        print(f"MAE: {tuned['mae']:.4f}")
+        print(f"R²: {tuned['r2']:.4f}")
+        print(f"MAPE: {tuned['mape']:.4f} ({tuned['mape'] * 100:.2f}%)")
 
     # 7. Check Accuracy Goal
     allowed_mape = 1.0 - args.accuracy_goal
     print("\n--- Accuracy Goal Check ---")
-    if tuned_mape <= allowed_mape:
-        print(
-            f"[SUCCESS] Model MAPE ({tuned_mape*100:.2f}%) is within the allowed {allowed_mape*100:.0f}% error threshold for {args.accuracy_goal*100:.0f}% accuracy."
-        )
-    else:
-        print(
-            f"[FAILED] Model MAPE ({tuned_mape*100:.2f}%) exceeds the allowed {allowed_mape*100:.0f}% error threshold for {args.accuracy_goal*100:.0f}% accuracy."
-        )
+    for target, tuned in tuned_metrics.items():
+        tuned_mape = tuned["mape"]
+        label = f"{target} model" if len(TARGETS) > 1 else "Model"
+        if tuned_mape <= allowed_mape:
+            print(
+                f"[SUCCESS] {label} MAPE ({tuned_mape*100:.2f}%) is within the allowed {allowed_mape*100:.0f}% error threshold for {args.accuracy_goal*100:.0f}% accuracy."
+            )
+        else:
+            print(
+                f"[FAILED] {label} MAPE ({tuned_mape*100:.2f}%) exceeds the allowed {allowed_mape*100:.0f}% error threshold for {args.accuracy_goal*100:.0f}% accuracy."
+            )
 
     # 8. Save Tuned Model
+    features = [str(column) for column in X.columns]
+    target = TARGETS[0] if len(TARGETS) == 1 else TARGETS
+    schema = {
+        "name": f"RandomForest_{TARGET_NAME}",
+        "target": target,
+        "model": os.path.relpath(TUNED_MODEL_FILENAME, OUTPUT_DIR),
+        "scaler": os.path.relpath(scaler_path, OUTPUT_DIR),
+        "bundle": os.path.relpath(BUNDLE_FILENAME, OUTPUT_DIR),
+        "features": features,
+    }
+    saved = False
     try:
-        joblib.dump(best_rf_model, TUNED_MODEL_FILENAME)
+        writer.flush()
         print(f"\nTuned RandomForest model saved to {TUNED_MODEL_FILENAME}")
+        bundle_metrics = {"cv_mape": float(-mean_scores[best_index]), "params": best_params}
+        for name, tuned in tuned_metrics.items():
+            suffix = "" if len(TARGETS) == 1 else f"_{name}"
+            bundle_metrics.update({f"{metric}{suffix}": value for metric, value in tuned.items()})
+        write_bundle(
+            BUNDLE_FILENAME,
+            best_rf_model,
+            scaler,
+            features,
+            target=target,
+            name=schema["name"],
+            metrics=bundle_metrics,
+        )
+        with open(SCHEMA_FILENAME, "w") as f:
+            json.dump(schema, f, indent=2)
+        print(f"Feature schema saved to {SCHEMA_FILENAME}")
+        saved = True
     except Exception as e:
         print(f"Error saving tuned model: {e}")
 
+    # 9. Compact the Tuned Model
+    if args.compact and not saved:
+        # The compacted model's schema points at the tuned model's scaler
+        print("\nThe tuned model was not saved; skipping compaction.")
+    elif args.compact and len(TARGETS) > 1:
+        print("\n--compact only supports single-target forests; skipping compaction.")
+    elif args.compact:
+        print("\n--- Compacting Tuned Model ---")
+        compact, report = compact_model(
+            best_rf_model,
+            X_test_scaled,
+            y_test,
+            max_rmse_increase=args.max_compaction_loss,
+            max_mape_increase=args.max_compaction_loss,
+            random_state=args.random_state,
+        )
+        print_report(report)
+        if compact is best_rf_model:
+            print("No compaction step stayed within the accuracy limits.")
+        else:
+            save_compacted(
+                compact,
+                report,
+                schema["name"],
+                TARGETS[0],
+                schema["scaler"],
+                schema["features"],
+            )
+
     print("\n--- Standalone Tuning Script Finished ---")
 
 
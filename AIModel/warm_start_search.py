@@ -0,0 +1,182 @@
+# warm_start_search.py
+# Hyperparameter search for forests that never rebuilds a tree it already has.
+# Candidates that differ only in n_estimators are grouped; each group grows a
+# single warm-started forest per fold through its tree counts in ascending
+# order and is scored at every size on the way. A warm-started forest is
+# identical to one trained from scratch with the same random_state, so the
+# scores match RandomizedSearchCV.
+# With halving=True, groups first compete on a fraction of the training rows
+# and trees; only the best 1/factor of them move on to more data.
+import math
+from collections import OrderedDict
+
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.metrics import check_scoring
+from sklearn.model_selection import check_cv
+
+SIZE_PARAM = "n_estimators"
+
+
+def _group_candidates(candidates):
+    """Groups candidate indices by every parameter except n_estimators"""
+    groups = OrderedDict()
+    for index, params in enumerate(candidates):
+        shared = {name: value for name, value in params.items() if name != SIZE_PARAM}
+        key = tuple(sorted((name, repr(value)) for name, value in shared.items()))
+        group = groups.setdefault(key, {"params": shared, "members": []})
+        group["members"].append((index, params[SIZE_PARAM]))
+    return list(groups.values())
+
+
+def _grow_and_score(estimator, params, sizes, X, y, train_idx, test_idx, scorer):
+    """
+    Grows one warm-started forest on train_idx through sizes (ascending)
+    and returns {size: score on test_idx}.
+    """
+    model = clone(estimator).set_params(**params)
+    model.set_params(warm_start=True, n_jobs=1)
+    X_train, y_train = X[train_idx], y[train_idx]
+    X_test, y_test = X[test_idx], y[test_idx]
+    scores = {}
+    for size in sizes:
+        model.set_params(n_estimators=size)
+        model.fit(X_train, y_train)
+        scores[size] = scorer(model, X_test, y_test)
+    return scores
+
+
+class WarmStartForestSearch:
+    """
+    Evaluates a list of parameter dicts for a forest estimator (anything with
+    warm_start and n_estimators) and reports like RandomizedSearchCV:
+    best_params_, best_score_, best_index_, best_estimator_ and cv_results_
+    (params, mean_test_score, split<k>_test_score; NaN for candidates
+    eliminated by halving).
+
+    checkpoint_sizes adds extra tree counts to score while a group grows
+    (for free up to the group's largest member); they are appended to
+    cv_results_ as additional candidates.
+    """
+
+    def __init__(
+        self,
+        estimator,
+        candidates,
+        cv=3,
+        scoring=None,
+        n_jobs=-1,
+        halving=False,
+        factor=3,
+        min_samples=500,
+        checkpoint_sizes=(),
+        random_state=None,
+        refit=True,
+        verbose=1,
+    ):
+        self.estimator = estimator
+        self.candidates = candidates
+        self.cv = cv
+        self.scoring = scoring
+        self.n_jobs = n_jobs
+        self.halving = halving
+        self.factor = factor
+        self.min_samples = min_samples
+        self.checkpoint_sizes = checkpoint_sizes
+        self.random_state = random_state
+        self.refit = refit
+        self.verbose = verbose
+
+    def _schedule(self, n_groups, n_train):
+        """Training-row fractions of the halving rungs, smallest first"""
+        if not self.halving or n_groups <= 1:
+            return [1.0]
+        rungs = 1 + int(math.floor(math.log(n_groups, self.factor)))
+        while rungs > 1 and n_train / self.factor ** (rungs - 1) < self.min_samples:
+            rungs -= 1
+        return [1.0 / self.factor ** (rungs - 1 - rung) for rung in range(rungs)]
+
+    def fit(self, X, y):
+        X = np.asarray(X)
+        y = np.asarray(y)
+        scorer = check_scoring(self.estimator, scoring=self.scoring)
+        folds = list(check_cv(self.cv, y, classifier=False).split(X, y))
+
+        candidates = [dict(params) for params in self.candidates]
+        groups = _group_candidates(candidates)
+        # Extra tree counts scored on the way to each group's largest member
+        for group in groups:
+            largest = max(size for _, size in group["members"])
+            known = {size for _, size in group["members"]}
+            for size in sorted(self.checkpoint_sizes):
+                if size < largest and size not in known:
+                    candidates.append(dict(group["params"], **{SIZE_PARAM: size}))
+                    group["members"].append((len(candidates) - 1, size))
+                    known.add(size)
+
+        # Nested row subsets: each rung's training rows include the previous ones
+        order = np.random.RandomState(self.random_state).permutation(len(X))
+        rank = np.empty(len(X), dtype=int)
+        rank[order] = np.arange(len(X))
+        max_size = max(size for group in groups for _, size in group["members"])
+        schedule = self._schedule(len(groups), len(X) - len(X) // len(folds))
+
+        alive = list(range(len(groups)))
+        fold_scores = {}
+        for rung, fraction in enumerate(schedule):
+            last = rung == len(schedule) - 1
+            tree_cap = max_size if last else max(1, int(round(max_size * fraction)))
+            sizes = {
+                g: sorted({min(size, tree_cap) for _, size in groups[g]["members"]})
+                for g in alive
+            }
+            if self.verbose:
+                print(
+                    f"Rung {rung + 1}/{len(schedule)}: {len(alive)} groups, "
+                    f"{fraction:.0%} of training rows, up to {tree_cap} trees"
+                )
+            rung_folds = [
+                (train_idx if last else train_idx[rank[train_idx] < fraction * len(X)], test_idx)
+                for train_idx, test_idx in folds
+            ]
+            tasks = [
+                (g, fold, train_idx, test_idx)
+                for g in alive
+                for fold, (train_idx, test_idx) in enumerate(rung_folds)
+            ]
+            outcomes = Parallel(n_jobs=self.n_jobs)(
+                delayed(_grow_and_score)(
+                    self.estimator, groups[g]["params"], sizes[g], X, y, train_idx, test_idx, scorer
+                )
+                for g, _, train_idx, test_idx in tasks
+            )
+            rung_scores = {}
+            for (g, fold, _, _), scores in zip(tasks, outcomes):
+                for size, score in scores.items():
+                    rung_scores.setdefault((g, size), [None] * len(folds))[fold] = score
+            if last:
+                fold_scores = rung_scores
+                break
+            # A group is as good as its best size at this rung
+            group_score = {
+                g: max(np.mean(rung_scores[(g, size)]) for size in sizes[g]) for g in alive
+            }
+            keep = max(1, int(math.ceil(len(alive) / self.factor)))
+            alive = sorted(alive, key=lambda g: -group_score[g])[:keep]
+
+        split_scores = np.full((len(folds), len(candidates)), np.nan)
+        for g in alive:
+            for index, size in groups[g]["members"]:
+                split_scores[:, index] = fold_scores[(g, size)]
+        self.cv_results_ = {"params": candidates, "mean_test_score": split_scores.mean(axis=0)}
+        for fold in range(len(folds)):
+            self.cv_results_[f"split{fold}_test_score"] = split_scores[fold]
+        self.best_index_ = int(np.nanargmax(self.cv_results_["mean_test_score"]))
+        self.best_params_ = candidates[self.best_index_]
+        self.best_score_ = float(self.cv_results_["mean_test_score"][self.best_index_])
+
+        if self.refit:
+            self.best_estimator_ = clone(self.estimator).set_params(**self.best_params_)
+            self.best_estimator_.fit(X, y)
+        return self